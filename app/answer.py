@@ -1,36 +1,136 @@
 import json
 import os
+import time
 from typing import List, Dict
-from openai import OpenAI
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-
-def format_context(messages: List[dict]) -> str:
+import numpy as np
+
+from app.extractive import EXTRACTIVE, extract_answer, record_llm_answer
+from app.llm import chat, chat_async, stream_chat_async
+from app.tokens import count_tokens, tokenizer_name, truncate_tokens
+
+NOT_FOUND_ANSWER = "Sorry, I couldn't find that information."
+
+# Prompt size is tuned here, independently of how many messages retrieval
+# returns (MEMBER_QA_RETRIEVAL_K): the packer keeps the best-ranked
+# messages that fit the budget.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("MEMBER_QA_CONTEXT_TOKENS", "512"))
+# Messages at or above this cosine to an already kept message are dropped.
+DEDUPE_MIN_COSINE = float(os.getenv("MEMBER_QA_CONTEXT_DEDUPE", "0.95"))
+
+CONTEXT_STATS = {
+    "requests": 0,
+    "messages_in": 0,
+    "messages_kept": 0,
+    "tokens_naive": 0,
+    "tokens_packed": 0,
+}
+
+
+def context_line(m: dict, text=None) -> str:
+    username = m.get("user") or m.get("user_name") or "UNKNOWN"
+    return f"- {username}: {json.dumps(m.get('text', '') if text is None else text)}"
+
+
+def pack_context(messages: List[dict], vectors=None, budget=CONTEXT_TOKEN_BUDGET,
+                 min_cosine=DEDUPE_MIN_COSINE):
+    """
+    Context lines for `messages` (best-ranked first): near-duplicates are
+    dropped (by embedding cosine when `vectors` are given, else by
+    identical folded text), then lines are kept in rank order until the
+    token budget is spent; a line that does not fit whole is truncated
+    if it is the first one. Returns (lines, report).
+    """
+    kept, kept_vectors, seen_texts = [], [], set()
+    duplicates = 0
+    for i, m in enumerate(messages):
+        if vectors is not None:
+            v = vectors[i]
+            if kept_vectors and float(np.max(np.stack(kept_vectors) @ v)) >= min_cosine:
+                duplicates += 1
+                continue
+            kept_vectors.append(v)
+        else:
+            key = " ".join(str(m.get("text", "")).casefold().split())
+            if key in seen_texts:
+                duplicates += 1
+                continue
+            seen_texts.add(key)
+        kept.append(m)
+
+    lines, used, truncated = [], 0, 0
+    for m in kept:
+        line = context_line(m)
+        tokens = count_tokens(line) + 1  # newline
+        if used + tokens > budget:
+            if lines:
+                break
+            # Shrink the text until the line fits; token counts of a
+            # prefix and of the quoted line do not add up exactly.
+            room = budget - count_tokens(context_line(m, "")) - 1
+            while room > 0:
+                line = context_line(m, truncate_tokens(str(m.get("text", "")), room) + "...")
+                tokens = count_tokens(line) + 1
+                if tokens <= budget:
+                    break
+                room -= 1
+            if room <= 0:
+                break
+            truncated += 1
+        lines.append(line)
+        used += tokens
+
+    naive = sum(count_tokens(context_line(m)) + 1 for m in messages)
+    report = {
+        "tokenizer": tokenizer_name(),
+        "budget": budget,
+        "messages_in": len(messages),
+        "duplicates": duplicates,
+        "dropped_for_budget": len(kept) - len(lines),
+        "truncated": truncated,
+        "messages_kept": len(lines),
+        "tokens_naive": naive,
+        "tokens_packed": used,
+        "tokens_saved": naive - used,
+    }
+    return lines, report
+
+
+def format_context(messages: List[dict], vectors=None, report=None) -> str:
+    """Packed context block; the packing report is written into `report` when given."""
     if not messages:
         return "NO_RELEVANT_MESSAGES"
 
-    lines = []
-    for m in messages:
-        username = m.get("user") or m.get("user_name") or "UNKNOWN"
-        text = json.dumps(m.get("text", ""))
-        lines.append(f"- {username}: {text}")
+    lines, packed = pack_context(messages, vectors)
+    CONTEXT_STATS["requests"] += 1
+    for key in ("messages_in", "messages_kept", "tokens_naive", "tokens_packed"):
+        CONTEXT_STATS[key] += packed[key]
+    if report is not None:
+        report.update(packed)
     return "\n".join(lines)
 
 
-def generate_answer(
-    question: str,
-    parsed: dict,
-    retrieved_messages: List[dict]
-) -> Dict:
+def context_stats() -> dict:
+    requests = CONTEXT_STATS["requests"]
+    saved = CONTEXT_STATS["tokens_naive"] - CONTEXT_STATS["tokens_packed"]
+    return {
+        **CONTEXT_STATS,
+        "budget": CONTEXT_TOKEN_BUDGET,
+        "tokenizer": tokenizer_name(),
+        "tokens_saved": saved,
+        "avg_tokens_saved": round(saved / requests, 2) if requests else 0.0,
+    }
 
-    context_block = format_context(retrieved_messages)
 
-    prompt = f"""
+def build_answer_prompt(question: str, retrieved_messages: List[dict],
+                        vectors=None, report=None) -> str:
+    context_block = format_context(retrieved_messages, vectors, report)
+
+    return f"""
 You are an assistant that answers questions ONLY using the provided user messages.
 
 If the information is not contained in the messages, respond exactly with:
-Sorry, I couldn't find that information.
+{NOT_FOUND_ANSWER}
 
 Otherwise respond with ONLY the answer, in SHORT plain text.
 No JSON. No extra words. No quotes. No punctuation unless part of the answer.
@@ -44,17 +144,109 @@ RETRIEVED_MESSAGES:
 ANSWER:
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Respond ONLY with the answer text."},
-            {"role": "user", "content": prompt}
-        ],
+
+def answer_messages(question: str, retrieved_messages: List[dict],
+                    vectors=None, report=None) -> List[dict]:
+    return [
+        {"role": "system", "content": "Respond ONLY with the answer text."},
+        {"role": "user", "content": build_answer_prompt(question, retrieved_messages, vectors, report)}
+    ]
+
+
+def extractive_answer(question: str, parsed: dict, retrieved_messages: List[dict],
+                      scores=None, report=None):
+    """
+    The answer read straight from the top messages (app.extractive), or
+    None when the LLM should answer. Needs the retrieval `scores`.
+    """
+    if not EXTRACTIVE or scores is None or not retrieved_messages:
+        return None
+    text, details = extract_answer(question, parsed, retrieved_messages, scores)
+    if report is not None:
+        report["extractive"] = details
+    return text
+
+
+def generate_answer(
+    question: str,
+    parsed: dict,
+    retrieved_messages: List[dict],
+    vectors=None,
+    report=None,
+    scores=None,
+    corpus_version=None
+) -> Dict:
+
+    fast = extractive_answer(question, parsed, retrieved_messages, scores, report)
+    if fast is not None:
+        return {"answer": fast}
+
+    start = time.perf_counter()
+    answer_text = chat(
+        answer_messages(question, retrieved_messages, vectors, report),
         max_tokens=50,
-        temperature=0.0
+        temperature=0.0,
+        cache_version=corpus_version
     )
-
-    answer_text = response.choices[0].message.content.strip()
+    record_llm_answer((time.perf_counter() - start) * 1000)
 
     # wrap it in JSON yourself
     return {"answer": answer_text}
+
+
+async def generate_answer_async(
+    question: str,
+    parsed: dict,
+    retrieved_messages: List[dict],
+    vectors=None,
+    report=None,
+    scores=None,
+    corpus_version=None
+) -> Dict:
+    """
+    Same as generate_answer, on the async client. `vectors` (the retrieved
+    rows' embeddings) enable near-duplicate removal while packing; `scores`
+    (their cosines to the question) enable the extractive fast path;
+    `corpus_version` scopes the LLM response cache.
+    """
+
+    fast = extractive_answer(question, parsed, retrieved_messages, scores, report)
+    if fast is not None:
+        return {"answer": fast}
+
+    start = time.perf_counter()
+    answer_text = await chat_async(
+        answer_messages(question, retrieved_messages, vectors, report),
+        max_tokens=50,
+        temperature=0.0,
+        cache_version=corpus_version
+    )
+    record_llm_answer((time.perf_counter() - start) * 1000)
+    return {"answer": answer_text}
+
+
+async def stream_answer_async(
+    question: str,
+    parsed: dict,
+    retrieved_messages: List[dict],
+    vectors=None,
+    report=None,
+    scores=None,
+    corpus_version=None
+):
+    """Yield answer text deltas as the model produces them (one, for an extractive answer)."""
+
+    fast = extractive_answer(question, parsed, retrieved_messages, scores, report)
+    if fast is not None:
+        yield fast
+        return
+
+    start = time.perf_counter()
+    async for delta in stream_chat_async(
+        answer_messages(question, retrieved_messages, vectors, report),
+        max_tokens=50,
+        temperature=0.0,
+        cache_version=corpus_version
+    ):
+        yield delta
+    record_llm_answer((time.perf_counter() - start) * 1000)
@@ -0,0 +1,102 @@
+# app/backends.py
+#
+# Selectable runtimes for the all-mpnet-base-v2 encoder.
+#
+#   torch      full-precision PyTorch (reference)
+#   onnx       ONNX Runtime export of the same weights
+#   onnx-int8  ONNX Runtime with dynamic int8 quantization
+#
+# The ONNX variants are exported once under data_cache/onnx_model/ and
+# reused on later starts. They need the optional `optimum[onnxruntime]`
+# package. Before a non-reference backend is trusted against an existing
+# corpus_embeddings.npy, check_compatibility() compares its vectors with
+# the stored ones.
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from app.index import normalize_rows
+
+CACHE_DIR = Path("data_cache")
+ONNX_DIR = CACHE_DIR / "onnx_model"
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("MEMBER_QA_EMBED_BACKEND", "torch")
+# arm64 | avx2 | avx512 | avx512_vnni — pick what the serving CPU supports
+ONNX_QUANT_CONFIG = os.getenv("MEMBER_QA_ONNX_QUANT", "avx2")
+# Minimum cosine between a backend's vector and the stored vector, per text
+COMPAT_MIN_COSINE = float(os.getenv("MEMBER_QA_BACKEND_MIN_COSINE", "0.99"))
+COMPAT_SAMPLE = 64
+
+
+def model_key(model_name: str, backend: str) -> str:
+    """Identity of the vectors a backend produces; torch keeps the plain name."""
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def backend_from_key(key: str) -> str:
+    return key.split("@", 1)[1] if "@" in key else "torch"
+
+
+def export_onnx(model_name: str, quantize: bool) -> str:
+    """Export (once) and return the ONNX file name relative to ONNX_DIR."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    file_name = "onnx/model.onnx"
+    if not (ONNX_DIR / file_name).exists():
+        print(f"[INFO] Exporting {model_name} to ONNX → {ONNX_DIR}")
+        model = SentenceTransformer(model_name, backend="onnx")
+        model.save_pretrained(str(ONNX_DIR))
+
+    if not quantize:
+        return file_name
+
+    quant_name = f"onnx/model_qint8_{ONNX_QUANT_CONFIG}.onnx"
+    if not (ONNX_DIR / quant_name).exists():
+        print(f"[INFO] Quantizing ONNX model to int8 ({ONNX_QUANT_CONFIG})...")
+        model = SentenceTransformer(str(ONNX_DIR), backend="onnx")
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANT_CONFIG, str(ONNX_DIR))
+    return quant_name
+
+
+def load_encoder(backend: str, model_name: str):
+    """A SentenceTransformer running on the requested backend."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {BACKENDS}")
+
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+
+    file_name = export_onnx(model_name, quantize=backend == "onnx-int8")
+    return SentenceTransformer(
+        str(ONNX_DIR), backend="onnx", model_kwargs={"file_name": file_name}
+    )
+
+
+def sample_rows(n: int, size: int = COMPAT_SAMPLE) -> np.ndarray:
+    """Evenly spaced, deterministic row sample."""
+    return np.unique(np.linspace(0, n - 1, num=min(n, size)).astype(np.int64))
+
+
+def check_compatibility(encode, texts, reference_vectors, min_cosine=COMPAT_MIN_COSINE) -> dict:
+    """
+    Encode `texts` with the candidate backend and compare row-by-row with
+    the reference vectors. Compatible only if every cosine ≥ min_cosine.
+    """
+    if not len(texts):
+        return {"compatible": True, "min_cosine": None, "mean_cosine": None, "sample": 0}
+
+    candidate = normalize_rows(encode(list(texts)))
+    reference = normalize_rows(reference_vectors)
+    cosines = np.sum(candidate * reference, axis=1)
+
+    return {
+        "compatible": bool(cosines.min() >= min_cosine),
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "sample": len(texts),
+    }
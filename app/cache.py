@@ -0,0 +1,364 @@
+# app/cache.py
+#
+# Small in-process caches shared by the serving path.
+#
+#   TTLCache    thread-safe LRU with per-entry time-to-live
+#   SqliteCache optional on-disk tier (SQLite, WAL) that survives restarts
+#               and can be shared by several worker processes
+#   ResponseCache  on-disk text cache (SQLite, WAL) with LRU eviction by
+#               size and per-entry corpus versions; used for LLM responses
+#   SemanticCache  values keyed by embedding similarity (near-duplicate hits)
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, stored_at = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SqliteCache:
+    """Key → bytes store on disk. Entries older than `ttl` seconds are ignored."""
+
+    def __init__(self, path, ttl: float | None = None, table: str = "cache"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is not None and (self.ttl is None or time.time() - row[1] < self.ttl):
+            self.hits += 1
+            return row[0]
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: bytes):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"path": str(self.path), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Key → text store on disk, shared by every process that opens `path`.
+    Entries may carry a corpus version; purge_versions() drops the ones
+    from other versions. When the stored text exceeds `max_bytes`, the
+    least recently used entries are evicted down to 90% of it.
+
+    Hits only read: the last-use times they record are buffered and
+    written at most every `touch_after` seconds (or with the next set), so
+    readers in other workers never wait on the database write lock. The
+    byte total is kept in a one-row side table instead of summed per set.
+    """
+
+    def __init__(self, path, max_bytes: int = 64 << 20, ttl: float | None = None,
+                 table: str = "llm_responses", touch_after: float = 60.0, timeout: float = 30.0):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.table = table
+        self.touch_after = touch_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+        self._touched = {}              # key → last hit, not yet written
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=timeout)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "version TEXT, size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_used ON {table} (used)")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table}_total (id INTEGER PRIMARY KEY CHECK (id = 0), "
+            "bytes INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            f"INSERT OR IGNORE INTO {table}_total (id, bytes) "
+            f"SELECT 0, COALESCE(SUM(size), 0) FROM {table}"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created, used FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            hit = row is not None and (self.ttl is None or now - row[1] < self.ttl)
+            if hit:
+                self.hits += 1
+                if now - row[2] >= self.touch_after:
+                    self._touched[key] = now
+                if self._touched and now - self._flushed_at >= self.touch_after:
+                    try:
+                        with self._conn:
+                            self._flush_touches(now)
+                    except sqlite3.OperationalError:
+                        pass  # busy: the touches stay buffered for the next write
+                return row[0]
+        self.misses += 1
+        return None
+
+    def _flush_touches(self, now):
+        """Write buffered last-use times (lock held, inside a transaction)."""
+        if self._touched:
+            self._conn.executemany(
+                f"UPDATE {self.table} SET used = MAX(used, ?) WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._flushed_at = now
+
+    def _recount(self):
+        self._conn.execute(
+            f"UPDATE {self.table}_total SET bytes = (SELECT COALESCE(SUM(size), 0) FROM {self.table})"
+        )
+
+    def set(self, key: str, value: str, version=None) -> bool:
+        """Store `value`; False when the database stayed locked (the entry is skipped)."""
+        now = time.time()
+        size = len(key) + len(value.encode("utf-8"))
+        with self._lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                self._flush_touches(now)
+                old = self._conn.execute(
+                    f"SELECT size FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, version, size, created, used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, value, version, size, now, now),
+                )
+                self._conn.execute(
+                    f"UPDATE {self.table}_total SET bytes = bytes + ?", (size - (old[0] if old else 0),)
+                )
+                total = self._conn.execute(f"SELECT bytes FROM {self.table}_total").fetchone()[0]
+                if total > self.max_bytes:
+                    # Keep the most recently used entries that fit in 90% of the budget.
+                    cursor = self._conn.execute(
+                        f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM ("
+                        f"SELECT key, SUM(size) OVER (ORDER BY used DESC, key) AS running "
+                        f"FROM {self.table}) WHERE running > ?)",
+                        (int(self.max_bytes * 0.9),),
+                    )
+                    self.evictions += cursor.rowcount
+                    self._recount()
+                self._conn.commit()
+                return True
+            except sqlite3.OperationalError as e:
+                self._conn.rollback()
+                self.write_errors += 1
+                print(f"[WARN] Response cache write skipped: {e}")
+                return False
+
+    def purge_versions(self, keep) -> int:
+        """Drop versioned entries not tagged `keep`; unversioned entries stay."""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE version IS NOT NULL AND version != ?", (str(keep),)
+            )
+            self._recount()
+            self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            size = self._conn.execute(f"SELECT bytes FROM {self.table}_total").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_errors": self.write_errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            try:
+                with self._conn:
+                    self._flush_touches(time.time())
+            except sqlite3.OperationalError:
+                pass
+            self._conn.close()
+
+
+class SemanticCache:
+    """
+    Answers keyed by query embedding. A lookup hits when a cached entry in
+    the same scope (e.g. corpus version + member) has cosine similarity
+    ≥ `threshold` with the query. Vectors must be L2-normalized.
+    Entries are evicted LRU beyond `maxsize` and expire after `ttl`.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()   # id → (scope, vector, value, stored_at, cost_ms)
+        self._scopes = {}               # scope → {id, ...}
+        self._matrices = {}             # scope → (ids, stacked vectors, stored_at), rebuilt lazily
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, entry_id):
+        scope = self._entries.pop(entry_id)[0]
+        self._scopes[scope].discard(entry_id)
+        if not self._scopes[scope]:
+            del self._scopes[scope]
+        self._matrices.pop(scope, None)
+
+    def _matrix(self, scope):
+        """(ids, stacked vectors, stored_at) for `scope`, rebuilt after any change."""
+        if scope not in self._matrices:
+            ordered = list(self._scopes[scope])
+            self._matrices[scope] = (
+                ordered,
+                np.stack([self._entries[i][1] for i in ordered]),
+                np.array([self._entries[i][3] for i in ordered]),
+            )
+        return self._matrices[scope]
+
+    def get(self, vector, scope):
+        with self._lock:
+            if scope in self._scopes and self.ttl is not None:
+                # expired entries are dropped before ranking, so a stale
+                # nearest neighbour cannot hide a fresh match behind it
+                ordered, _, stored_at = self._matrix(scope)
+                for i in np.flatnonzero(time.monotonic() - stored_at >= self.ttl):
+                    self._drop(ordered[i])
+
+            if scope in self._scopes:
+                ordered, matrix, _ = self._matrix(scope)
+                sims = matrix @ vector
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    entry_id = ordered[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    self.saved_ms += self._entries[entry_id][4]
+                    return self._entries[entry_id][2]
+
+            self.misses += 1
+            return None
+
+    def set(self, vector, value, scope, cost_ms: float = 0.0):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, vector, value, time.monotonic(), cost_ms)
+            self._scopes.setdefault(scope, set()).add(entry_id)
+            self._matrices.pop(scope, None)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_llm_ms": round(self.saved_ms, 1),
+        }
@@ -1,9 +1,21 @@
 # compute_embeddings.py
+#
+# Run from the repo root:  python -m app.compute_embeddings
 
+import argparse
+import hashlib
 import json
-import numpy as np
+import os
+from datetime import datetime, timezone
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+
+import numpy as np
+
+from app.backends import (
+    BACKENDS, EMBED_BACKEND, check_compatibility, load_encoder, model_key, sample_rows,
+)
+from app.index import build_index, normalize_rows, INDEX_TYPES
+from app.lexical import LEXICAL_PATH, build_lexical_index
 
 # -----------------------------
 # CONFIG — MUST MATCH YOUR APP
@@ -12,55 +24,273 @@ MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"  # 768-dim model
 CACHE_DIR = Path("data_cache")
 CACHE_EMBEDDINGS = CACHE_DIR / "corpus_embeddings.npy"
 CACHE_MESSAGES = CACHE_DIR / "corpus_messages.json"
+CACHE_MANIFEST = CACHE_DIR / "corpus_manifest.json"
+CACHE_EMBEDDINGS_SERVING = CACHE_DIR / "corpus_embeddings_f32.npy"
 
 
 # -----------------------------
-# STEP 1 — Load corpus messages
+# Keys + manifest helpers
 # -----------------------------
-print(f"[INFO] Loading messages from {CACHE_MESSAGES}...")
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
 
-if not CACHE_MESSAGES.exists():
-    raise FileNotFoundError(
-        f"Could not find {CACHE_MESSAGES}. Did you export your corpus?"
-    )
 
-with open(CACHE_MESSAGES, "r", encoding="utf-8") as f:
-    messages = json.load(f)
+def corpus_version(model_name: str, rows: list[dict]) -> str:
+    """Stable id for (model, ordered message ids, text hashes)."""
+    h = hashlib.sha256(model_name.encode("utf-8"))
+    for r in rows:
+        h.update(f"\n{r['message_id']}:{r['text_hash']}".encode("utf-8"))
+    return h.hexdigest()[:16]
 
-# Expect: list of objects each with at least { "text": "..." }
 
+def rows_path(manifest_path: Path) -> Path:
+    """
+    The per-row keys (message id + text hash) beside `manifest_path`, e.g.
+    corpus_manifest_rows.json. Only the next incremental build reads them;
+    the server loads the small manifest header.
+    """
+    return manifest_path.with_name(f"{manifest_path.stem}_rows{manifest_path.suffix}")
 
-# -----------------------------
-# Extract texts
-# -----------------------------
-texts = [m["text"] for m in messages]
 
-print(f"[INFO] Loaded {len(texts)} messages for embedding.")
+def load_previous(embeddings_path: Path, manifest_path: Path):
+    """Return (embeddings, manifest with its rows) from the last build, or (None, None)."""
+    if not (embeddings_path.exists() and manifest_path.exists()):
+        return None, None
 
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if "rows" not in manifest:  # older builds kept them in the header itself
+        if not rows_path(manifest_path).exists():
+            print("[WARN] Manifest rows missing; ignoring previous build.")
+            return None, None
+        with open(rows_path(manifest_path), "r", encoding="utf-8") as f:
+            manifest["rows"] = json.load(f)
+    embeddings = np.load(embeddings_path)
 
-# -----------------------------
-# STEP 2 — Load model
-# -----------------------------
-print(f"[INFO] Loading embedding model: {MODEL_NAME}...")
-model = SentenceTransformer(MODEL_NAME)
+    if len(manifest.get("rows", [])) != len(embeddings):
+        print("[WARN] Manifest does not match embeddings; ignoring previous build.")
+        return None, None
+    return embeddings, manifest
 
 
-# -----------------------------
-# STEP 3 — Compute embeddings
-# -----------------------------
-print("[INFO] Computing embeddings...")
-embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+def atomic_save(embeddings: np.ndarray, manifest: dict,
+                embeddings_path: Path, manifest_path: Path):
+    """
+    Write the embeddings, the manifest's rows (to rows_path) and its header
+    to temp names, then rename into place, header last. The header is what
+    the server reads, so it stays small however large the corpus grows.
+    """
+    embeddings_path.parent.mkdir(parents=True, exist_ok=True)
 
-print(f"[INFO] Finished embedding! Shape: {embeddings.shape}")  # Expect (N, 768)
+    tmp_emb = embeddings_path.with_suffix(".npy.tmp")
+    with open(tmp_emb, "wb") as f:
+        np.save(f, embeddings)
+    tmp_rows = rows_path(manifest_path).with_suffix(".json.tmp")
+    with open(tmp_rows, "w", encoding="utf-8") as f:
+        json.dump(manifest["rows"], f, separators=(",", ":"))
+    tmp_manifest = manifest_path.with_suffix(".json.tmp")
+    with open(tmp_manifest, "w", encoding="utf-8") as f:
+        json.dump({k: v for k, v in manifest.items() if k != "rows"}, f, indent=2)
+
+    os.replace(tmp_emb, embeddings_path)
+    os.replace(tmp_rows, rows_path(manifest_path))
+    os.replace(tmp_manifest, manifest_path)
+
+
+def save_serving_embeddings(embeddings: np.ndarray, path: Path):
+    """
+    Write the L2-normalized, C-contiguous float32 matrix that the server
+    memory-maps. np.save pads the header so the data starts on a 64-byte
+    boundary.
+    """
+    tmp = path.with_suffix(".npy.tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, normalize_rows(embeddings))
+    os.replace(tmp, path)
+
+
+def previous_sample(messages, previous_embeddings, previous_manifest):
+    """(texts, vectors) for a sample of unchanged messages from the last build."""
+    current = {m.get("message_id"): m["text"] for m in messages}
+    pairs = [
+        (current[r["message_id"]], i)
+        for i, r in enumerate(previous_manifest["rows"])
+        if r["message_id"] in current and text_hash(current[r["message_id"]]) == r["text_hash"]
+    ]
+    pairs = [pairs[i] for i in sample_rows(len(pairs))] if pairs else []
+    return [t for t, _ in pairs], previous_embeddings[[i for _, i in pairs]]
 
 
 # -----------------------------
-# STEP 4 — Save embeddings
+# Incremental rebuild
 # -----------------------------
-CACHE_DIR.mkdir(exist_ok=True)
+def rebuild_embeddings(messages, encode, model_name=MODEL_NAME,
+                       previous_embeddings=None, previous_manifest=None,
+                       compatible_models=()):
+    """
+    Build the embedding matrix for `messages` (row i ↔ messages[i]).
+
+    Vectors from the previous build are reused when the message id, text
+    hash and model name all match (or the previous model is listed in
+    `compatible_models`); only new or edited messages go through `encode`,
+    and deleted messages simply drop out.
+
+    Returns (embeddings, manifest, stats).
+    """
+    rows = [
+        {"message_id": m.get("message_id"), "text_hash": text_hash(m["text"])}
+        for m in messages
+    ]
+
+    reusable = {}
+    if previous_embeddings is not None and previous_manifest is not None \
+            and previous_manifest.get("model") in {model_name, *compatible_models}:
+        for i, r in enumerate(previous_manifest["rows"]):
+            reusable[(r["message_id"], r["text_hash"])] = i
+
+    reuse_src, reuse_dst, encode_idx = [], [], []
+    for i, r in enumerate(rows):
+        j = reusable.get((r["message_id"], r["text_hash"]))
+        if j is None:
+            encode_idx.append(i)
+        else:
+            reuse_src.append(j)
+            reuse_dst.append(i)
+
+    new_vectors = None
+    if encode_idx:
+        new_vectors = np.asarray(encode([messages[i]["text"] for i in encode_idx]))
+
+    if previous_embeddings is not None and reuse_src:
+        dim, dtype = previous_embeddings.shape[1], previous_embeddings.dtype
+    elif new_vectors is not None:
+        dim, dtype = new_vectors.shape[1], new_vectors.dtype
+    else:
+        dim, dtype = 0, np.float32
+
+    embeddings = np.zeros((len(messages), dim), dtype=dtype)
+    if reuse_src:
+        embeddings[reuse_dst] = previous_embeddings[reuse_src]
+    if new_vectors is not None:
+        embeddings[encode_idx] = new_vectors
+
+    previous_count = len(previous_manifest["rows"]) if reusable else 0
+    stats = {
+        "total": len(messages),
+        "reused": len(reuse_src),
+        "encoded": len(encode_idx),
+        "dropped": previous_count - len(reuse_src),
+    }
+
+    manifest = {
+        "model": model_name,
+        "dim": int(dim),
+        "count": len(messages),
+        "corpus_version": corpus_version(model_name, rows),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "rows": rows,
+    }
+    return embeddings, manifest, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild corpus embeddings.")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the previous build and re-encode everything")
+    parser.add_argument("--index", choices=[*INDEX_TYPES, "none"], default="ivf",
+                        help="ANN index to build alongside the embeddings")
+    parser.add_argument("--backend", choices=BACKENDS, default=EMBED_BACKEND,
+                        help="encoder runtime (onnx/onnx-int8 need optimum[onnxruntime])")
+    args = parser.parse_args(argv)
+
+    # -----------------------------
+    # STEP 1 — Load corpus messages
+    # -----------------------------
+    print(f"[INFO] Loading messages from {CACHE_MESSAGES}...")
+
+    if not CACHE_MESSAGES.exists():
+        raise FileNotFoundError(
+            f"Could not find {CACHE_MESSAGES}. Did you export your corpus?"
+        )
+
+    with open(CACHE_MESSAGES, "r", encoding="utf-8") as f:
+        messages = json.load(f)
+
+    # Expect: list of objects each with at least { "message_id": ..., "text": "..." }
+    print(f"[INFO] Loaded {len(messages)} messages for embedding.")
+
+    # -----------------------------
+    # STEP 2 — Load previous build
+    # -----------------------------
+    previous_embeddings, previous_manifest = (None, None)
+    if not args.full:
+        previous_embeddings, previous_manifest = load_previous(CACHE_EMBEDDINGS, CACHE_MANIFEST)
+
+    # -----------------------------
+    # STEP 3 — Load model lazily (only if something needs encoding)
+    # -----------------------------
+    model = None
+
+    def encode(texts, progress=True):
+        nonlocal model
+        if model is None:
+            print(f"[INFO] Loading embedding model: {MODEL_NAME} ({args.backend})...")
+            model = load_encoder(args.backend, MODEL_NAME)
+        if progress:
+            print(f"[INFO] Computing embeddings for {len(texts)} messages...")
+        return model.encode(texts, convert_to_numpy=True, show_progress_bar=progress)
+
+    # A different backend may reuse the previous vectors only if it
+    # reproduces them within tolerance; otherwise flag a full rebuild.
+    key = model_key(MODEL_NAME, args.backend)
+    compatible_models = ()
+    if previous_manifest is not None and previous_manifest.get("model") != key:
+        texts, vectors = previous_sample(messages, previous_embeddings, previous_manifest)
+        report = check_compatibility(lambda t: encode(t, progress=False), texts, vectors)
+        print(f"[INFO] {args.backend} vs {previous_manifest['model']}: {report}")
+        if report["compatible"]:
+            compatible_models = (previous_manifest["model"],)
+        else:
+            print("[WARN] Backend vectors are outside tolerance; FULL REBUILD flagged.")
+
+    # -----------------------------
+    # STEP 4 — Compute embeddings
+    # -----------------------------
+    embeddings, manifest, stats = rebuild_embeddings(
+        messages, encode, key, previous_embeddings, previous_manifest, compatible_models
+    )
+    print(
+        f"[INFO] Finished embedding! Shape: {embeddings.shape} "
+        f"(reused={stats['reused']}, encoded={stats['encoded']}, dropped={stats['dropped']})"
+    )
+
+    # -----------------------------
+    # STEP 5 — Save embeddings + manifest atomically
+    # -----------------------------
+    atomic_save(embeddings, manifest, CACHE_EMBEDDINGS, CACHE_MANIFEST)
+    save_serving_embeddings(embeddings, CACHE_EMBEDDINGS_SERVING)
+    print(f"[INFO] Saved embeddings → {CACHE_EMBEDDINGS} (+ {CACHE_EMBEDDINGS_SERVING.name})")
+    print(f"[INFO] Saved manifest → {CACHE_MANIFEST} (corpus_version={manifest['corpus_version']}, "
+          f"rows → {rows_path(CACHE_MANIFEST).name})")
+
+    # -----------------------------
+    # STEP 6 — Build ANN index
+    # -----------------------------
+    if args.index != "none":
+        print(f"[INFO] Building {args.index} index...")
+        build_index(embeddings, args.index, manifest["corpus_version"])
+        print(f"[INFO] Saved {args.index} index → {CACHE_DIR}")
+
+    # -----------------------------
+    # STEP 7 — Build BM25 lexical index
+    # -----------------------------
+    print("[INFO] Building BM25 index...")
+    lexical = build_lexical_index(messages, manifest["corpus_version"])
+    print(f"[INFO] Saved BM25 index ({len(lexical.vocab)} terms) → {LEXICAL_PATH}")
+
+    print("\n[SUCCESS] Local embedding rebuild complete!")
+    print("🎉 Now commit + push the updated data_cache/ files and deploy.")
 
-np.save(CACHE_EMBEDDINGS, embeddings)
-print(f"[INFO] Saved new embeddings → {CACHE_EMBEDDINGS}")
 
-print("\n[SUCCESS] Local embedding rebuild complete!")
-print("🎉 Now commit + push your updated corpus_embeddings.npy and deploy to Render.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# app/corpus_store.py
+#
+# Columnar, offset-indexed binary corpus store (data_cache/corpus_messages.bin).
+#
+# The JSON corpus repeats every user id and name on every message and is
+# parsed into one dict per message at startup. The store instead keeps:
+#
+#   users      interned (user_id, user_name) pairs, in the file header
+#   user_idx   uint32 per row → users table
+#   message_id 16-byte UUIDs per row (or a string column if any id is not a UUID)
+#   text       one UTF-8 blob + int64 offsets, decoded only when read
+#   timestamp  same layout as text
+#
+# Opening is a header read plus np.memmap of each column, so load time
+# does not grow with the corpus. Rows come back as small slotted Message
+# records that read like the old dicts (m["text"], m.get("user_name")).
+#
+# Writing streams too: records are read one at a time from the JSON list
+# and the string columns are spooled to temporary files, so only the
+# fixed-width per-row columns are held in memory. The header records the
+# SHA-256 of the JSON it was built from; the store is current when that
+# still matches (file times do not survive checkouts, copies and deploys).
+# The JSON's hash is cached beside it keyed by size and mtime, so startup
+# only re-reads the JSON after it changed.
+#
+#   python -m app.corpus_store   # convert data_cache/corpus_messages.json
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import uuid
+from array import array
+from collections.abc import Mapping, Sequence
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = Path("data_cache")
+STORE_PATH = CACHE_DIR / "corpus_messages.bin"
+JSON_PATH = CACHE_DIR / "corpus_messages.json"
+
+MAGIC = b"MQACORP1"
+ALIGN = 64
+FIELDS = ("message_id", "user_id", "user_name", "text", "timestamp")
+
+
+# -----------------------------
+#   WRITE
+# -----------------------------
+class _StringSpool:
+    """A string column built row by row: offsets and nulls in memory, UTF-8 bytes on disk."""
+
+    def __init__(self):
+        self.offsets = array("q", [0])
+        self.nulls = bytearray()
+        self.blob = tempfile.TemporaryFile()
+
+    def append(self, value):
+        data = (value or "").encode("utf-8")
+        self.blob.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.nulls.append(value is None)
+
+    def sections(self, field):
+        return {
+            f"{field}.offsets": np.frombuffer(self.offsets, dtype=np.int64),
+            f"{field}.blob": self.blob,
+            f"{field}.nulls": np.frombuffer(self.nulls, dtype=np.uint8),
+        }
+
+
+def _uuid_bytes(value):
+    """The 16 bytes of a canonical UUID string, else None."""
+    try:
+        parsed = uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+    return parsed.bytes if str(parsed) == value else None
+
+
+def _nbytes(column):
+    if isinstance(column, np.ndarray):
+        return column.nbytes
+    return column.seek(0, os.SEEK_END)
+
+
+def file_sha256(path: Path) -> str:
+    """Content hash of `path`, read in chunks; recorded in the store header."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def cached_sha256(path: Path) -> str:
+    """
+    file_sha256, remembered in `<path>.sha256` with the file's size and
+    mtime: the file is only re-read when one of them changed. A copy or
+    checkout that changes the mtime costs one re-hash, never a wrong answer.
+    """
+    st = path.stat()
+    key = [st.st_size, st.st_mtime_ns]
+    sidecar = path.with_name(path.name + ".sha256")
+    try:
+        cached = json.loads(sidecar.read_text(encoding="utf-8"))
+        if cached["stat"] == key:
+            return cached["sha256"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    digest = file_sha256(path)
+    try:
+        sidecar.write_text(json.dumps({"stat": key, "sha256": digest}), encoding="utf-8")
+    except OSError:
+        pass  # read-only data dir: hash again next time
+    return digest
+
+
+def write_store(messages, path: Path = STORE_PATH, source_sha256: str | None = None):
+    """
+    Write `messages` (any iterable of dicts with FIELDS) atomically to
+    `path`, in one pass. `source_sha256` is the hash of the JSON file they
+    came from (see store_source).
+    """
+    path = Path(path)
+    users, user_idx = {}, array("I")
+    uuids, all_uuids = bytearray(), True
+    spools = {field: _StringSpool() for field in ("message_id", "text", "timestamp")}
+    count = 0
+    for m in messages:
+        user_idx.append(users.setdefault((m.get("user_id"), m.get("user_name")), len(users)))
+        message_id = m.get("message_id")
+        if all_uuids:
+            raw = _uuid_bytes(message_id)
+            if raw is None:
+                all_uuids, uuids = False, None
+            else:
+                uuids += raw
+        for field, spool in spools.items():
+            spool.append(message_id if field == "message_id" else m.get(field))
+        count += 1
+
+    columns = {"user_idx": np.frombuffer(user_idx, dtype=np.uint32)}
+    if all_uuids:
+        columns["message_id"] = np.frombuffer(uuids, dtype=np.uint8).reshape(-1, 16)
+    else:
+        columns.update(spools["message_id"].sections("message_id"))
+    for field in ("text", "timestamp"):
+        columns.update(spools[field].sections(field))
+
+    # Lay columns out after a fixed-size header slot, each ALIGN-aligned.
+    sections, cursor = {}, 0
+    for name, column in columns.items():
+        nbytes = _nbytes(column)
+        if isinstance(column, np.ndarray):
+            dtype, shape = column.dtype.str, list(column.shape)
+        else:
+            dtype, shape = "|u1", [nbytes]
+        sections[name] = {"offset": cursor, "dtype": dtype, "shape": shape}
+        cursor += -(-nbytes // ALIGN) * ALIGN
+    header = json.dumps({
+        "count": count,
+        "users": [list(k) for k in users],
+        "message_id": "uuid" if all_uuids else "str",
+        "source_sha256": source_sha256,
+        "sections": sections,
+    }).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGN) * ALIGN
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.uint64(len(header)).tobytes())
+            f.write(header)
+            for name, column in columns.items():
+                f.seek(data_start + sections[name]["offset"])
+                if isinstance(column, np.ndarray):
+                    f.write(np.ascontiguousarray(column).tobytes())
+                else:
+                    column.seek(0)
+                    shutil.copyfileobj(column, f, 1 << 20)
+            f.truncate(data_start + cursor)
+        os.replace(tmp_path, path)
+    finally:
+        for spool in spools.values():
+            spool.blob.close()
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_list(path: Path, chunk_size: int = 1 << 20):
+    """Yield the items of a JSON list file one at a time, reading `chunk_size` characters at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf, pos, eof = f.read(chunk_size).lstrip(), 1, False
+        if not buf.startswith("["):
+            raise ValueError(f"{path} is not a JSON list")
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+
+def convert_json(json_path: Path = JSON_PATH, store_path: Path = STORE_PATH) -> int:
+    write_store(iter_json_list(json_path), store_path, cached_sha256(json_path))
+    return len(open_store(store_path))
+
+
+def store_source(path: Path = STORE_PATH):
+    """The source_sha256 recorded in a store's header (None for older stores)."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(header_len)).get("source_sha256")
+
+
+# -----------------------------
+#   READ
+# -----------------------------
+class Message(Mapping):
+    """One corpus row, read from the store's columns on access."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        if key not in FIELDS:
+            raise KeyError(key)
+        return self._store.value(self._row, key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"Message({dict(self)!r})"
+
+
+class CorpusStore(Sequence):
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{self.path} is not a corpus store")
+            header_len = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+            header = json.loads(f.read(header_len))
+        data_start = -(-(len(MAGIC) + 8 + header_len) // ALIGN) * ALIGN
+
+        self.count = header["count"]
+        self.users = [tuple(u) for u in header["users"]]
+        self.uuid_ids = header["message_id"] == "uuid"
+        self.columns = {}
+        for name, section in header["sections"].items():
+            shape = tuple(section["shape"])
+            if not np.prod(shape):
+                self.columns[name] = np.zeros(shape, dtype=section["dtype"])
+                continue
+            self.columns[name] = np.memmap(
+                self.path, dtype=section["dtype"], mode="r",
+                offset=data_start + section["offset"], shape=shape,
+            )
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [Message(self, r) for r in range(*i.indices(self.count))]
+        i = int(i)
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return Message(self, i)
+
+    def _string(self, field, row):
+        if self.columns[f"{field}.nulls"][row]:
+            return None
+        offsets = self.columns[f"{field}.offsets"]
+        return bytes(self.columns[f"{field}.blob"][offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def value(self, row, field):
+        if field == "user_id":
+            return self.users[self.columns["user_idx"][row]][0]
+        if field == "user_name":
+            return self.users[self.columns["user_idx"][row]][1]
+        if field == "message_id" and self.uuid_ids:
+            return str(uuid.UUID(bytes=bytes(self.columns["message_id"][row])))
+        return self._string(field, row)
+
+    def texts(self):
+        """Every message text, decoded in one pass."""
+        return [self._string("text", i) or "" for i in range(self.count)]
+
+    def timestamps(self):
+        """Every timestamp string (None where missing), decoded in one pass."""
+        return [self._string("timestamp", i) for i in range(self.count)]
+
+    def user_rows(self):
+        """{(user_id, user_name): sorted row ids} without touching any text."""
+        user_idx = np.asarray(self.columns["user_idx"])
+        order = np.argsort(user_idx, kind="stable")
+        bounds = np.searchsorted(user_idx[order], np.arange(len(self.users) + 1))
+        return {
+            user: order[bounds[u]:bounds[u + 1]].astype(np.int64)
+            for u, user in enumerate(self.users)
+        }
+
+
+def open_store(path: Path = STORE_PATH) -> CorpusStore:
+    return CorpusStore(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the JSON corpus to the binary store.")
+    parser.add_argument("--from", dest="src", type=Path, default=JSON_PATH)
+    parser.add_argument("--to", dest="dst", type=Path, default=STORE_PATH)
+    args = parser.parse_args()
+
+    n = convert_json(args.src, args.dst)
+    print(f"[INFO] Wrote {n} messages → {args.dst} "
+          f"({args.dst.stat().st_size:,} bytes, JSON was {args.src.stat().st_size:,})")
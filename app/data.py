@@ -1,12 +1,34 @@
 # app/data.py
 import json
+import math
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import requests
 
+from app.corpus_store import (
+    STORE_PATH, cached_sha256, iter_json_list, open_store, store_source, write_store,
+)
+
 API_URL = API_URL = "https://november7-730026606190.europe-west1.run.app/messages"
 CACHE_DIR = Path("data_cache")
 CACHE_MESSAGES = CACHE_DIR / "corpus_messages.json"
+CACHE_STORE = STORE_PATH
 
+# -----------------------------
+#   FULL INGEST SETTINGS
+# -----------------------------
+PAGE_LIMIT = 100
+INGEST_WORKERS = int(os.getenv("MEMBER_QA_INGEST_WORKERS", "4"))
+INGEST_MAX_RETRIES = int(os.getenv("MEMBER_QA_INGEST_RETRIES", "5"))
+INGEST_BACKOFF = float(os.getenv("MEMBER_QA_INGEST_BACKOFF", "0.5"))
+INGEST_TIMEOUT = float(os.getenv("MEMBER_QA_INGEST_TIMEOUT", "20"))
+# Duplicates come from pages shifting under the walk, so ids are only
+# compared against this many recent pages; memory stays flat with the corpus.
+INGEST_DEDUPE_PAGES = int(os.getenv("MEMBER_QA_INGEST_DEDUPE_PAGES", "8"))
 
 
 def fetch_first_page(limit: int = 100) -> list[dict]:
@@ -33,16 +55,216 @@ def normalize_messages(messages: list[dict]) -> list[dict]:
     return normalized
 
 
-def load_corpus() -> list[dict]:
-    """Load cached messages if available; otherwise fetch the first page."""
+# -----------------------------
+#   FULL PAGINATED INGEST
+# -----------------------------
+def fetch_page(
+    session: requests.Session,
+    skip: int,
+    limit: int = PAGE_LIMIT,
+    api_url: str = API_URL,
+    max_retries: int = INGEST_MAX_RETRIES,
+    backoff: float = INGEST_BACKOFF,
+) -> dict:
+    """
+    Fetch one page, retrying 4xx/5xx, throttling and connection errors
+    with jittered exponential backoff. Honours Retry-After when present.
+    """
+    params = {"skip": skip, "limit": limit}
+    attempt = 0
+    while True:
+        try:
+            resp = session.get(api_url, params=params, timeout=INGEST_TIMEOUT)
+            if resp.status_code == 200:
+                return resp.json()
+            error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+            retry_after = resp.headers.get("Retry-After")
+        except requests.RequestException as e:
+            error = str(e)
+            retry_after = None
+
+        attempt += 1
+        if attempt > max_retries:
+            raise RuntimeError(f"Page skip={skip} failed after {max_retries} retries ({error})")
+
+        if retry_after and retry_after.replace(".", "", 1).isdigit():
+            delay = float(retry_after)
+        else:
+            delay = backoff * (2 ** (attempt - 1))
+        time.sleep(delay + random.uniform(0, backoff))
+
+
+def iter_all_pages(
+    limit: int = PAGE_LIMIT,
+    workers: int = INGEST_WORKERS,
+    api_url: str = API_URL,
+    max_retries: int = INGEST_MAX_RETRIES,
+    backoff: float = INGEST_BACKOFF,
+    stats: dict | None = None,
+    start: int = 0,
+):
+    """
+    Yield raw message pages in order from offset `start`, fetching up to
+    `workers` pages concurrently over a single pooled session.
+
+    The first page tells us `total`; the rest are requested through a
+    sliding window so at most `workers` pages are ever held in memory.
+    A page that still fails after retries is skipped and recorded in
+    `stats["failed_skips"]` instead of aborting the whole ingest.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault("pages", 0)
+    stats.setdefault("failed_skips", [])
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def fetch(skip):
+        return fetch_page(session, skip, limit, api_url, max_retries, backoff)
+
+    try:
+        first = fetch(start)
+        items = first.get("items", [])
+        total = int(first.get("total") or len(items))
+        stats["total_reported"] = total
+        stats["pages"] += 1
+        yield items
+
+        # Short or empty first page: nothing more to walk.
+        if len(items) < limit:
+            return
+
+        skips = iter(range(start + limit, math.ceil(total / limit) * limit, limit))
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            window = deque()
+            for skip in skips:
+                window.append((skip, pool.submit(fetch, skip)))
+                if len(window) >= workers:
+                    break
+
+            while window:
+                skip, future = window.popleft()
+                try:
+                    page = future.result().get("items", [])
+                except RuntimeError as e:
+                    print(f"[WARN] {e}")
+                    stats["failed_skips"].append(skip)
+                    page = None
+
+                next_skip = next(skips, None)
+                if next_skip is not None:
+                    window.append((next_skip, pool.submit(fetch, next_skip)))
+
+                if page is None:
+                    continue
+
+                stats["pages"] += 1
+                yield page
+    finally:
+        session.close()
+
+
+def ingest_all_messages(
+    path: Path = CACHE_MESSAGES,
+    limit: int = PAGE_LIMIT,
+    workers: int = INGEST_WORKERS,
+    api_url: str = API_URL,
+    max_retries: int = INGEST_MAX_RETRIES,
+    backoff: float = INGEST_BACKOFF,
+    dedupe_pages: int = INGEST_DEDUPE_PAGES,
+) -> dict:
+    """
+    Walk every page of the messages API and stream the normalized records
+    to `path` as a JSON list, one page at a time. The file is written to a
+    temporary name and renamed on success so readers never see a partial
+    corpus. Duplicate message ids (pages shifting under us) are dropped
+    when they repeat within the last `dedupe_pages` pages.
+    If any page still fails after retries, the existing corpus is left in
+    place and RuntimeError is raised: a corpus with holes is not a refresh.
+
+    Returns ingest stats: pages, messages written, failed skips.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+
+    stats = {"messages": 0, "duplicates": 0}
+    recent_ids = deque(maxlen=max(1, dedupe_pages))  # one id set per page
+    first_record = True
+
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        pages = iter_all_pages(limit, workers, api_url, max_retries, backoff, stats)
+        for page in pages:
+            page_ids = set()
+            recent_ids.append(page_ids)
+            for record in normalize_messages(page):
+                if any(record["message_id"] in ids for ids in recent_ids):
+                    stats["duplicates"] += 1
+                    continue
+                page_ids.add(record["message_id"])
+
+                f.write("\n  " if first_record else ",\n  ")
+                f.write(json.dumps(record, ensure_ascii=False))
+                first_record = False
+                stats["messages"] += 1
+        f.write("\n]\n")
+
+    if stats["failed_skips"]:
+        tmp_path.unlink()
+        raise RuntimeError(
+            f"Ingest incomplete: pages at skip={stats['failed_skips']} failed; kept {path}"
+        )
+    os.replace(tmp_path, path)
+    if path == CACHE_MESSAGES:
+        # streamed back record by record, so memory does not grow with the corpus
+        write_store(iter_json_list(path), CACHE_STORE, cached_sha256(path))
+    print(
+        f"[INFO] Ingested {stats['messages']} messages from {stats['pages']} pages "
+        f"(reported total={stats.get('total_reported')}, "
+        f"failed pages={len(stats['failed_skips'])})"
+    )
+    return stats
+
+
+def store_is_current() -> bool:
+    """
+    The binary store exists and was built from the JSON now on disk (by
+    content hash: file times do not survive checkouts, copies and deploys).
+    The hash is cached next to the JSON, so an unchanged file is not re-read.
+    """
+    if not CACHE_STORE.exists():
+        return False
+    return not CACHE_MESSAGES.exists() or store_source(CACHE_STORE) == cached_sha256(CACHE_MESSAGES)
+
+
+def load_corpus(full_ingest: bool = False):
+    """
+    Load cached messages if available (the binary store when it is
+    current, else the JSON list); otherwise fetch the first page, or
+    every page when `full_ingest` is set.
+    """
     CACHE_DIR.mkdir(exist_ok=True)
 
+    if store_is_current():
+        print("[INFO] Opening binary corpus store...")
+        return open_store(CACHE_STORE)
+
     # Load from cache
     if CACHE_MESSAGES.exists():
         print("[INFO] Loading messages from cache...")
         with open(CACHE_MESSAGES, "r") as f:
             return json.load(f)
 
+    if full_ingest:
+        print("[INFO] Fetching all pages of messages...")
+        ingest_all_messages(CACHE_MESSAGES)
+        return open_store(CACHE_STORE)
+
     # Fetch fresh
     print("[INFO] Fetching first page of messages...")
     messages = fetch_first_page(limit=100)
@@ -53,4 +275,9 @@ def load_corpus() -> list[dict]:
     with open(CACHE_MESSAGES, "w") as f:
         json.dump(normalized, f, indent=2)
 
-    return normalized
\ No newline at end of file
+    return normalized
+
+
+if __name__ == "__main__":
+    # python -m app.data  →  rebuild data_cache/corpus_messages.json (+ .bin store) from every page
+    ingest_all_messages()
@@ -1,39 +1,260 @@
 # app/embeddings.py
 
+import asyncio
+import json
+import os
+import threading
 import numpy as np
 from pathlib import Path
-from typing import List
-from sklearn.metrics.pairwise import cosine_similarity
 
-from sentence_transformers import SentenceTransformer
+from app.backends import (
+    EMBED_BACKEND, backend_from_key, check_compatibility, load_encoder, model_key, sample_rows,
+)
+from app.batching import EmbeddingBatcher
+from app.cache import TTLCache, SqliteCache
+from app.index import normalize_rows
+from app.startup import phase
 
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+active_backend = EMBED_BACKEND
+
+# The encoder (and torch) is loaded on first use or by the lifespan's
+# background loader, never at import, so the server binds its port fast.
+model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                with phase("model"):
+                    print(f"[INFO] Loading embedding model: {MODEL_NAME} ({active_backend})...")
+                    model = load_encoder(active_backend, MODEL_NAME)
+    return model
 
 CACHE_DIR = Path("data_cache")
 CACHE_EMBEDDINGS = CACHE_DIR / "corpus_embeddings.npy"
+CACHE_MANIFEST = CACHE_DIR / "corpus_manifest.json"
+# Pre-normalized float32 copy written by compute_embeddings.py for mmap serving
+CACHE_EMBEDDINGS_SERVING = CACHE_DIR / "corpus_embeddings_f32.npy"
+
+# Memory-map the serving matrix so every uvicorn worker shares the same
+# page-cache pages instead of holding a private copy.
+EMBEDDINGS_MMAP = os.getenv("MEMBER_QA_EMBEDDINGS_MMAP", "0") == "1"
+NPY_ALIGN = 64
+
+# -----------------------------
+#   QUERY EMBEDDING CACHE
+# -----------------------------
+QUERY_CACHE_SIZE = int(os.getenv("MEMBER_QA_QUERY_CACHE_SIZE", "4096"))
+QUERY_CACHE_TTL = float(os.getenv("MEMBER_QA_QUERY_CACHE_TTL", "86400"))
+# Optional on-disk tier, e.g. data_cache/query_embeddings.sqlite
+QUERY_CACHE_DB = os.getenv("MEMBER_QA_QUERY_CACHE_DB")
+
+query_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+query_disk_cache = SqliteCache(QUERY_CACHE_DB, ttl=QUERY_CACHE_TTL, table="query_embeddings") \
+    if QUERY_CACHE_DB else None
+
+# -----------------------------
+#   QUERY MICRO-BATCHING
+# -----------------------------
+# When > 0, concurrent cache misses are collected for up to this many ms
+# (or BATCH_MAX_SIZE texts) and encoded in one model.encode call. The
+# serving path submits from the event loop (embed_text_async), so the
+# batch is not capped by the number of retrieval executor threads.
+BATCH_MAX_WAIT_MS = float(os.getenv("MEMBER_QA_BATCH_MAX_WAIT_MS", "0"))
+BATCH_MAX_SIZE = int(os.getenv("MEMBER_QA_BATCH_MAX_SIZE", "32"))
+
+
+def encode_batch(texts):
+    """One forward pass over `texts` → (n, d) float32."""
+    embs = get_model().encode(texts, convert_to_numpy=True)
+    if embs.ndim == 1:
+        embs = embs.reshape(1, -1)
+    return embs.astype(np.float32)
+
+
+batcher = EmbeddingBatcher(encode_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS) \
+    if BATCH_MAX_WAIT_MS > 0 else None
+
+
+def load_embeddings(mmap=EMBEDDINGS_MMAP):
+    """Load precomputed embeddings from disk, normalized for dot-product scoring."""
+    if mmap:
+        if CACHE_EMBEDDINGS_SERVING.exists():
+            return load_embeddings_mmap()
+        print(f"[WARN] {CACHE_EMBEDDINGS_SERVING} missing; loading a private copy instead.")
 
-def load_embeddings():
-    """Load precomputed embeddings from disk."""
     if not CACHE_EMBEDDINGS.exists():
         raise RuntimeError(
             f"Embedding file not found: {CACHE_EMBEDDINGS}. "
             "You must compute embeddings locally before deploying."
         )
 
-    return np.load(CACHE_EMBEDDINGS)
+    return prepare_embeddings(np.load(CACHE_EMBEDDINGS))
+
+
+def prepare_embeddings(embeddings):
+    """
+    L2-normalize the corpus matrix once and keep it contiguous float32,
+    so per-request scoring is a single matrix–vector product.
+    """
+    return normalize_rows(embeddings)
+
+
+def load_embeddings_mmap(path=CACHE_EMBEDDINGS_SERVING):
+    """
+    Map the pre-normalized float32 matrix read-only. Only the .npy header is
+    read here; rows are paged in by the OS on first touch and shared by
+    every process that maps the same file.
+    """
+    matrix = np.load(path, mmap_mode="r")
+
+    if matrix.dtype != np.float32 or matrix.ndim != 2 or not matrix.flags.c_contiguous:
+        raise RuntimeError(f"{path} is not a contiguous 2-D float32 matrix; rebuild it.")
+    if matrix.offset % NPY_ALIGN:
+        raise RuntimeError(f"{path} data is not {NPY_ALIGN}-byte aligned; rebuild it.")
+
+    print(f"[INFO] Memory-mapped embeddings {matrix.shape} from {path}")
+    return matrix
+
+
+def load_manifest():
+    """
+    Load the manifest written by compute_embeddings.py, if any.
+    Tells the server which corpus version (model + message ids + text
+    hashes) the embedding matrix was built from. This is the header only:
+    the per-row keys are in a separate file the server never reads.
+    """
+    if not CACHE_MANIFEST.exists():
+        return None
+
+    with open(CACHE_MANIFEST, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest.pop("rows", None)  # built before the rows moved out; rebuild to skip parsing them
+    return manifest
+
+
+def use_backend(backend: str):
+    """Swap the query encoder to another backend (e.g. after a failed compatibility check)."""
+    global model, active_backend
+    with _model_lock:
+        model = load_encoder(backend, MODEL_NAME)
+        active_backend = backend
+    query_cache.clear()
+
+
+def query_cache_key(text: str) -> str:
+    """Cache key: model + backend + case/whitespace-normalized question text."""
+    return f"{model_key(MODEL_NAME, active_backend)}\n{' '.join(text.split()).casefold()}"
 
 
 def embed_texts(texts):
     if isinstance(texts, str):
         texts = [texts]
 
-    embs = model.encode(texts, convert_to_numpy=True)
+    keys = [query_cache_key(t) for t in texts]
+    rows = [query_cache.get(k) for k in keys]
 
-    # Ensure (1, d) shape for single query
-    if embs.ndim == 1:
-        embs = embs.reshape(1, -1)
+    if query_disk_cache is not None:
+        for i, k in enumerate(keys):
+            if rows[i] is None:
+                blob = query_disk_cache.get(k)
+                if blob is not None:
+                    rows[i] = np.frombuffer(blob, dtype=np.float32)
+                    query_cache.set(k, rows[i])
+
+    missing = [i for i, r in enumerate(rows) if r is None]
+    if missing:
+        miss_texts = [texts[i] for i in missing]
+        if batcher is not None:
+            encoded = batcher.encode_many(miss_texts)
+        else:
+            encoded = encode_batch(miss_texts)
+
+        for i, vec in zip(missing, encoded):
+            rows[i] = _remember(keys[i], vec)
+
+    # Always (n, d), (1, d) for a single query
+    return np.stack(rows)
+
+
+def _remember(key, vec):
+    vec.setflags(write=False)
+    query_cache.set(key, vec)
+    if query_disk_cache is not None:
+        query_disk_cache.set(key, vec.tobytes())
+    return vec
+
+
+async def embed_text_async(text: str):
+    """
+    embed_texts for one text, awaited on the event loop: a miss is handed
+    to the batcher without holding a thread, so every in-flight request
+    can join the same batch. Requires the batcher; returns (1, d).
+    """
+    key = query_cache_key(text)
+    row = query_cache.get(key)
+    if row is None and query_disk_cache is not None:
+        blob = await asyncio.to_thread(query_disk_cache.get, key)
+        if blob is not None:
+            row = np.frombuffer(blob, dtype=np.float32)
+            query_cache.set(key, row)
+    if row is None:
+        vec = await asyncio.wrap_future(batcher.submit(text))
+        if query_disk_cache is not None:
+            row = await asyncio.to_thread(_remember, key, vec)
+        else:
+            row = _remember(key, vec)
+    return row.reshape(1, -1)
+
+
+def query_cache_stats() -> dict:
+    stats = {"memory": query_cache.stats()}
+    if query_disk_cache is not None:
+        stats["disk"] = query_disk_cache.stats()
+    if batcher is not None:
+        stats["batcher"] = batcher.stats()
+    return stats
+
+
+def verify_backend(messages, corpus_embeddings, manifest) -> dict:
+    """
+    If the query backend differs from the one that built the corpus
+    vectors, re-encode a sample of corpus texts and compare. Outside the
+    cosine tolerance, fall back to the corpus backend and flag that a full
+    rebuild (python -m app.compute_embeddings --backend ...) is needed.
+    """
+    corpus_key = manifest["model"] if manifest else MODEL_NAME
+    report = {
+        "backend": active_backend,
+        "corpus_model": corpus_key,
+        "checked": False,
+        "rebuild_required": False,
+    }
+    if model_key(MODEL_NAME, active_backend) == corpus_key or not len(messages):
+        return report
+
+    rows = sample_rows(len(messages))
+    result = check_compatibility(
+        encode_batch, [messages[i]["text"] for i in rows], corpus_embeddings[rows]
+    )
+    report.update(result, checked=True)
+
+    if not result["compatible"]:
+        fallback = backend_from_key(corpus_key)
+        print(
+            f"[WARN] {active_backend} embeddings drift from the corpus vectors "
+            f"(min cosine {result['min_cosine']}); serving with {fallback}. "
+            f"Rebuild with --backend {active_backend} to switch."
+        )
+        use_backend(fallback)
+        report["backend"] = fallback
+        report["rebuild_required"] = True
 
-    return embs
+    return report
 
 
 # Render will call this on startup
@@ -0,0 +1,290 @@
+# app/extractive.py
+#
+# Deterministic answer selection: answer straight from the top retrieved
+# messages, without the answer LLM, when the question asks for a typed
+# value (a date, a count, a phone/account number, a place) and one of
+# those messages clearly states it.
+#
+# The answer type comes from the question's wording ("how many", "what
+# date", "where", "... number") or, failing that, from the parsed
+# `intent`. Candidates are pulled from each message with regex patterns
+# for that type. A message is used only when
+#
+#   - its cosine to the question is at least MEMBER_QA_EXTRACT_MIN_SCORE,
+#   - it covers the question's content terms (member name and type cue
+#     words aside), and
+#   - it holds exactly one distinct candidate, or coverage makes up for it:
+#
+#     confidence = term coverage / distinct candidates in the message
+#
+# and confidence is at least MEMBER_QA_EXTRACT_MIN_CONFIDENCE, and none of
+# the top messages cancels or negates something ("cancel my London trip",
+# "no longer need", "instead"). Otherwise the question goes to the LLM.
+#
+#   python -m benchmarks.bench_extractive   # bypass rate on tests/qa_answers.csv
+
+import os
+import re
+import time
+from datetime import datetime, timedelta, timezone
+
+from app.gazetteer import fold
+from app.lexical import terms
+from app.timeline import parse_timestamp
+
+EXTRACTIVE = os.getenv("MEMBER_QA_EXTRACTIVE", "1") == "1"
+EXTRACT_MIN_SCORE = float(os.getenv("MEMBER_QA_EXTRACT_MIN_SCORE", "0.45"))
+EXTRACT_MIN_CONFIDENCE = float(os.getenv("MEMBER_QA_EXTRACT_MIN_CONFIDENCE", "0.6"))
+# Only the best-ranked messages are considered; below them the LLM is
+# better at telling which message answers the question.
+EXTRACT_TOP_N = int(os.getenv("MEMBER_QA_EXTRACT_TOP_N", "2"))
+
+EXTRACT_STATS = {
+    "attempts": 0,
+    "bypassed": 0,
+    "no_answer_type": 0,
+    "no_candidate": 0,
+    "low_score": 0,
+    "low_confidence": 0,
+    "negated": 0,
+    "extract_ms_total": 0.0,
+    "llm_answers": 0,
+    "llm_ms_total": 0.0,
+}
+
+
+# -----------------------------
+#   PATTERNS
+# -----------------------------
+MONTHS = (
+    r"(?:Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?"
+    r"|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+)
+WEEKDAYS = r"(?:Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)"
+ORDINAL = r"(?:st|nd|rd|th)?"
+
+DATE_PATTERNS = [
+    re.compile(rf"\b{MONTHS}\.?\s+\d{{1,2}}{ORDINAL}(?:,?\s+\d{{4}})?\b"),   # November 25
+    re.compile(rf"\b\d{{1,2}}{ORDINAL}\s+(?:of\s+)?{MONTHS}(?:\s+\d{{4}})?\b"),  # 25th of November
+    re.compile(r"\b\d{4}-\d{2}-\d{2}\b"),
+    re.compile(rf"\b(?:the\s+)?(?:first|second|third|fourth|last)\s+week\s+of\s+{MONTHS}\b"),
+    re.compile(rf"(?<=\bin\s){MONTHS}\b"),                                   # in May
+]
+# Relative to the day the message was sent; resolved against its timestamp.
+RELATIVE_DATE = re.compile(rf"\b(next|this|on)\s+({WEEKDAYS})\b|\b(tomorrow|tonight|today)\b")
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+NUMBER_WORDS = (
+    "one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+    "eleven", "twelve", "fifteen", "twenty", "thirty", "forty", "fifty", "hundred",
+)
+QUANTITY = r"(?:\d+|" + "|".join(NUMBER_WORDS) + r")"
+COUNT_NOUNS = (
+    r"(?:people|persons?|guests?|adults?|children|kids|tickets?|seats?|rooms?|suites?"
+    r"|nights?|days?|cars?|bags?|passengers?|members?|attendees?)"
+)
+COUNT_PATTERNS = [
+    re.compile(rf"\b({QUANTITY})\s+(?:[a-z]+\s+){{0,2}}?{COUNT_NOUNS}\b", re.I),  # two premiere tickets
+    re.compile(rf"\b(?:of|for)\s+({QUANTITY})\b(?!\s*(?:am|pm|:))", re.I),       # family of five
+]
+
+NUMBER_PATTERNS = [
+    re.compile(r"\+?\(?\d{2,4}\)?[\s.-]\d{3}[\s.-]\d{3,4}\b"),  # 431-555-2363
+    re.compile(r"\b\d{5,}\b"),                                  # 123456789
+]
+
+CONNECTORS = r"(?:de|del|da|di|du|of|the|and|&)"
+PLACE_WORD = r"(?:[A-Z][\w'’.-]*)"
+PLACE_PATTERN = re.compile(
+    rf"\b(?:at|in|to|from|near)\s+((?:the\s+)?{PLACE_WORD}(?:\s+(?:{CONNECTORS}\s+)?{PLACE_WORD})*)"
+)
+NOT_PLACES = re.compile(rf"^(?:the\s+)?(?:{MONTHS}|{WEEKDAYS})\b")
+
+# A top message that cancels, negates or replaces something: which value
+# still holds is for the LLM to read, not for a pattern to pick.
+NEGATION = re.compile(
+    r"\b(?:cancel\w*|call(?:ed)? off|no longer|not|never|instead|postpon\w*|resched\w*)\b|n't\b"
+)
+
+# Question wording → answer type, checked in order.
+QUESTION_TYPES = [
+    ("count", re.compile(r"\bhow many\b|\bnumber of\b")),
+    ("date", re.compile(r"\bwhat (?:date|day)\b|\bwhich (?:date|day)\b|\bwhen\b")),
+    ("number", re.compile(r"\b(?:number|phone|fax|mobile)\b")),
+    ("place", re.compile(r"\bwhere\b|\bwhich (?:city|country|hotel|restaurant|venue)\b")),
+]
+# Parsed `intent` labels (free text from the LLM parse) → answer type.
+INTENT_TYPES = [
+    ("count", ("count", "how_many", "quantity", "party_size")),
+    ("date", ("date", "when", "schedule", "time")),
+    ("number", ("phone", "fax", "contact_number", "account_number")),
+    ("place", ("location", "destination", "venue", "restaurant", "hotel", "travel_plans")),
+]
+# Verbs that say nothing about which message is meant.
+GENERIC_TERMS = {"want", "wants", "need", "needs", "like", "get", "going", "plan", "planning"}
+# Question words that name the type rather than the thing asked about.
+CUE_TERMS = {
+    "count": {"many", "number", "people", "persons", "guests"},
+    "date": {"date", "day"},
+    "number": {"number"},
+    "place": {"place", "location"},
+}
+
+
+# -----------------------------
+#   EXTRACTION
+# -----------------------------
+def answer_type(question: str, parsed: dict | None = None):
+    """"date" | "count" | "number" | "place", or None when the question is open-ended."""
+    text = fold(question)
+    for kind, pattern in QUESTION_TYPES:
+        if pattern.search(text):
+            return kind
+
+    intent = fold(str((parsed or {}).get("intent") or ""))
+    for kind, labels in INTENT_TYPES:
+        if any(label in intent for label in labels):
+            return kind
+    return None
+
+
+def resolve_relative(match: re.Match, sent: datetime) -> str:
+    """ "tomorrow", "this Friday", "next Monday" → the calendar date, from the send day."""
+    which, weekday, day = match.groups()
+    if day:
+        days = 1 if day == "tomorrow" else 0
+    else:
+        days = (WEEKDAY_NAMES.index(weekday) - sent.weekday()) % 7
+        if which == "next" and days == 0:
+            days = 7
+    date = sent + timedelta(days=days)
+    return f"{date:%B} {date.day}, {date.year}"
+
+
+def candidates(text: str, kind: str, sent_at=None) -> list[str]:
+    """
+    Distinct values of `kind` in `text`, in order of appearance. Relative
+    dates ("tomorrow", "next Monday") are resolved against `sent_at`, the
+    message's timestamp, and dropped when it has none.
+    """
+    found = []
+    if kind == "date":
+        spans = {m.span(): m.group() for p in DATE_PATTERNS for m in p.finditer(text)}
+        sent = parse_timestamp(sent_at)
+        if sent is not None:
+            sent = datetime.fromtimestamp(sent, tz=timezone.utc)
+            for m in RELATIVE_DATE.finditer(text):
+                spans[m.span()] = resolve_relative(m, sent)
+        # a span inside a longer one ("November 25" in "November 25, 2025") is the same date
+        found = [
+            value for s, value in sorted(spans.items())
+            if not any(o != s and o[0] <= s[0] and s[1] <= o[1] for o in spans)
+        ]
+    elif kind == "count":
+        found = [m.group(1) for p in COUNT_PATTERNS for m in p.finditer(text)]
+    elif kind == "number":
+        for p in NUMBER_PATTERNS:
+            found = [m.group().strip() for m in p.finditer(text)]
+            if found:
+                break
+    elif kind == "place":
+        for m in PLACE_PATTERN.finditer(text):
+            place = re.sub(rf"\s+{CONNECTORS}$", "", m.group(1).rstrip(".,;:!?"))
+            if not NOT_PLACES.match(place):
+                found.append(place)
+
+    distinct = []
+    for value in found:
+        if fold(value) not in {fold(v) for v in distinct}:
+            distinct.append(value)
+    return distinct
+
+
+def _stem(term: str) -> str:
+    return term[:5]
+
+
+def coverage(question: str, message_text: str, kind: str, user_name=None) -> float:
+    """Share of the question's content terms (name and type cues aside) found in the message."""
+    skip = GENERIC_TERMS | CUE_TERMS.get(kind, set()) | set(terms(user_name or ""))
+    wanted = {_stem(t) for t in terms(question) if t not in skip and not t.isdigit()}
+    if not wanted:
+        return 0.0
+    have = {_stem(t) for t in terms(message_text)}
+    return len(wanted & have) / len(wanted)
+
+
+def extract_answer(question: str, parsed: dict, retrieved_messages, scores,
+                   min_score=EXTRACT_MIN_SCORE, min_confidence=EXTRACT_MIN_CONFIDENCE,
+                   top_n=EXTRACT_TOP_N):
+    """
+    Returns (answer text or None, details). `scores` are the retrieved
+    messages' cosines to the question, in the same order.
+    """
+    start = time.perf_counter()
+    EXTRACT_STATS["attempts"] += 1
+    kind = answer_type(question, parsed)
+    details = {"answer_type": kind, "source": "llm"}
+
+    best = None
+    if kind is None:
+        details["reason"] = "no_answer_type"
+    else:
+        details["reason"] = "no_candidate"
+        user_name = (parsed or {}).get("user_name")
+        top = list(retrieved_messages)[:top_n]
+        if any(NEGATION.search(fold(str(m.get("text", "")))) for m in top):
+            details["reason"] = "negated"
+            top = []
+        for rank, m in enumerate(top):
+            text = str(m.get("text", ""))
+            # a value the question already names ("... in Rio?") is not the answer
+            found = [
+                v for v in candidates(text, kind, m.get("timestamp")) if fold(v) not in fold(question)
+            ]
+            if not found:
+                continue
+            if float(scores[rank]) < min_score:
+                details["reason"] = "low_score"
+                continue
+            confidence = coverage(question, text, kind, user_name) / len(found)
+            if best is None or confidence > best[0]:
+                best = (confidence, rank, found[0], float(scores[rank]))
+        if best is not None:
+            details.update(confidence=round(best[0], 3), rank=best[1], score=round(best[3], 4))
+            if best[0] < min_confidence:
+                details["reason"] = "low_confidence"
+                best = None
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    EXTRACT_STATS["extract_ms_total"] += elapsed_ms
+    details["extract_ms"] = round(elapsed_ms, 3)
+    if best is None:
+        EXTRACT_STATS[details["reason"]] += 1
+        return None, details
+
+    EXTRACT_STATS["bypassed"] += 1
+    details["source"] = "extractive"
+    details.pop("reason")
+    return best[2], details
+
+
+def record_llm_answer(elapsed_ms: float):
+    """Answer-LLM latency, used to estimate the time bypasses save."""
+    EXTRACT_STATS["llm_answers"] += 1
+    EXTRACT_STATS["llm_ms_total"] += elapsed_ms
+
+
+def extractive_stats() -> dict:
+    attempts = EXTRACT_STATS["attempts"]
+    bypassed = EXTRACT_STATS["bypassed"]
+    llm_answers = EXTRACT_STATS["llm_answers"]
+    avg_llm_ms = EXTRACT_STATS["llm_ms_total"] / llm_answers if llm_answers else 0.0
+    return {
+        **EXTRACT_STATS,
+        "enabled": EXTRACTIVE,
+        "bypass_rate": round(bypassed / attempts, 4) if attempts else 0.0,
+        "avg_extract_ms": round(EXTRACT_STATS["extract_ms_total"] / attempts, 4) if attempts else 0.0,
+        "avg_llm_ms": round(avg_llm_ms, 2),
+        "est_ms_saved": round(bypassed * avg_llm_ms, 1),
+    }
@@ -0,0 +1,135 @@
+# app/gazetteer.py
+#
+# Local, LLM-free member-name resolution. The gazetteer is built from the
+# loaded corpus and maps every alias of a member (full name, first name,
+# last name, accent-free spellings) to the canonical `user_name`.
+
+import difflib
+import re
+import time
+import unicodedata
+
+TOKEN_RE = re.compile(r"\w[\w'\-]*")
+MIN_ALIAS_LEN = 3
+FUZZY_CUTOFF = 0.85
+
+# Capitalized words that are not names when they start a question or
+# appear mid-sentence; they should not make the local parser doubt itself.
+NON_NAME_WORDS = {
+    "what", "when", "where", "who", "whom", "whose", "which", "why", "how",
+    "is", "are", "was", "were", "does", "do", "did", "can", "could", "will",
+    "would", "should", "has", "have", "had", "for", "the", "a", "an", "in",
+    "on", "at", "to", "of", "i", "my", "me", "please", "tell", "list", "give",
+}
+
+
+def fold(text: str) -> str:
+    """Casefold, strip accents and unify apostrophes: "Müller’s" → "muller's"."""
+    text = text.replace("’", "'").replace("‘", "'")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.casefold()
+
+
+def strip_possessive(token: str) -> str:
+    if token.endswith("'s"):
+        return token[:-2]
+    if token.endswith("'"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list[tuple[str, str]]:
+    """Split into (raw token, folded token without possessive) pairs."""
+    raw_tokens = TOKEN_RE.findall(text.replace("’", "'").replace("‘", "'"))
+    return [(t, strip_possessive(fold(t))) for t in raw_tokens]
+
+
+class Gazetteer:
+    def __init__(self, names):
+        self.names = sorted({n for n in names if n})
+        self.aliases = {}
+        self.max_len = 1
+
+        for name in self.names:
+            parts = [t for _, t in tokenize(name)]
+            variants = {" ".join(parts)}
+            if len(parts) > 1:
+                variants.add(parts[0])
+                variants.add(" ".join(parts[1:]))
+                variants.add(parts[-1])
+            for alias in variants:
+                if len(alias) >= MIN_ALIAS_LEN:
+                    self.aliases.setdefault(alias, set()).add(name)
+            self.max_len = max(self.max_len, len(parts))
+
+        self.single_token_aliases = [a for a in self.aliases if " " not in a]
+
+    @classmethod
+    def from_messages(cls, messages):
+        if hasattr(messages, "users"):  # CorpusStore keeps the interned users
+            return cls(name for _, name in messages.users)
+        return cls(m.get("user_name") for m in messages)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, question: str):
+        """
+        Return (canonical names matched, unmatched capitalized tokens).
+        Longest alias wins, so "Layla Kawaguchi" is one match, not two.
+        A one-word alias only counts when capitalized in the question:
+        "young kids" is not Grace Young, nor "will the gala" Will Turner.
+        """
+        pairs = tokenize(question)
+        raw_tokens = [raw for raw, _ in pairs]
+        tokens = [t for _, t in pairs]
+        matched = set()
+        unknown = []
+
+        i = 0
+        while i < len(tokens):
+            for n in range(min(self.max_len, len(tokens) - i), 0, -1):
+                alias = " ".join(tokens[i:i + n])
+                if n == 1 and not raw_tokens[i][:1].isupper():
+                    continue
+                if alias in self.aliases:
+                    matched |= self.aliases[alias]
+                    i += n
+                    break
+            else:
+                token = tokens[i]
+                if raw_tokens[i][:1].isupper() and token not in NON_NAME_WORDS:
+                    close = difflib.get_close_matches(
+                        token, self.single_token_aliases, n=1, cutoff=FUZZY_CUTOFF
+                    )
+                    if close:
+                        matched |= self.aliases[close[0]]
+                    else:
+                        unknown.append(raw_tokens[i])
+                i += 1
+
+        return matched, unknown
+
+
+def parse_locally(question: str, gazetteer: Gazetteer):
+    """
+    Resolve the member name without an LLM. Returns (parsed, confident):
+    confident when exactly one member matched, or when nothing in the
+    question looks like a name at all.
+    """
+    start = time.perf_counter()
+    matched, unknown = gazetteer.match(question)
+
+    user_name = next(iter(matched)) if len(matched) == 1 else None
+    confident = len(matched) == 1 or (not matched and not unknown)
+
+    parsed = {
+        "user_name": user_name,
+        "intent": None,
+        "entities": [],
+        "raw": question,
+        "source": "local",
+        "parse_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+    return parsed, confident
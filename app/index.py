@@ -0,0 +1,334 @@
+# app/index.py
+#
+# Nearest-neighbour indexes over the corpus embedding matrix.
+#
+#   exact  brute-force cosine similarity over every row (reference path)
+#   ivf    inverted file: spherical k-means lists, probe the `nprobe` closest
+#   hnsw   HNSW graph via the optional `hnswlib` package
+#   sharded  exact search split over a process pool (app.sharded)
+#
+# Every index exposes the same  search(query, k) -> (row_indices, scores)
+# and search_batch(queries, k) calls, so retrieval does not care which one
+# is loaded; extended(embeddings) returns a copy covering appended rows
+# for corpus hot reloads. Indexes are given
+# the L2-normalized float32 matrix from app.embeddings.load_embeddings,
+# so cosine similarity is a plain dot product.
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+CACHE_DIR = Path("data_cache")
+INDEX_PATHS = {
+    "ivf": CACHE_DIR / "corpus_index_ivf.npz",
+    "hnsw": CACHE_DIR / "corpus_index_hnsw.bin",
+}
+
+# "auto" picks the best persisted index for large corpora, exact otherwise
+INDEX_KIND = os.getenv("MEMBER_QA_INDEX", "auto")
+# Below this many rows brute force is both exact and faster than probing.
+ANN_MIN_ROWS = int(os.getenv("MEMBER_QA_ANN_MIN_ROWS", "20000"))
+# Recall/latency knobs: more lists probed / larger ef → higher recall, slower.
+IVF_NPROBE = int(os.getenv("MEMBER_QA_IVF_NPROBE", "8"))
+HNSW_EF = int(os.getenv("MEMBER_QA_HNSW_EF", "64"))
+
+
+def normalize_rows(x: np.ndarray) -> np.ndarray:
+    """L2-normalize along the last axis into a contiguous float32 array."""
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(x / norms)
+
+
+def top_k_scores(matrix: np.ndarray, query: np.ndarray, k: int):
+    """
+    Score a pre-normalized (n, d) matrix against a normalized (d,) query
+    with one matrix–vector product, then select the k best with
+    argpartition and sort only those k. Returns (row_indices, scores).
+    """
+    sims = matrix @ query
+    k = min(k, len(sims))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=sims.dtype)
+
+    if k < len(sims):
+        top = np.argpartition(-sims, k - 1)[:k]
+    else:
+        top = np.arange(len(sims))
+    top = top[np.argsort(-sims[top], kind="stable")]
+    return top, sims[top]
+
+
+def top_k_scores_batch(matrix: np.ndarray, queries: np.ndarray, k: int, max_cells: int = 1 << 26):
+    """
+    Batched top_k_scores: one matrix–matrix product per chunk of queries
+    (chunked so the (queries x rows) score block stays under `max_cells`),
+    then argpartition per row. Returns (m, k) row indices and scores.
+    """
+    n = len(matrix)
+    k = min(k, n)
+    m = len(queries)
+    top = np.empty((m, k), dtype=np.int64)
+    scores = np.empty((m, k), dtype=np.float32)
+    if k <= 0:
+        return top, scores
+
+    chunk = max(1, max_cells // max(n, 1))
+    for start in range(0, m, chunk):
+        sims = queries[start:start + chunk] @ matrix.T
+        if k < n:
+            part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(n), sims.shape).copy()
+        part_scores = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_scores, axis=1, kind="stable")
+        top[start:start + chunk] = np.take_along_axis(part, order, axis=1)
+        scores[start:start + chunk] = np.take_along_axis(part_scores, order, axis=1)
+    return top, scores
+
+
+# -----------------------------
+#   EXACT (REFERENCE)
+# -----------------------------
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, query: np.ndarray, k: int):
+        return top_k_scores(self.embeddings, normalize_rows(query.reshape(-1)), k)
+
+    def search_batch(self, queries: np.ndarray, k: int):
+        return top_k_scores_batch(self.embeddings, normalize_rows(queries), k)
+
+    def extended(self, embeddings):
+        return ExactIndex(embeddings)
+
+
+# -----------------------------
+#   IVF
+# -----------------------------
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, embeddings, centroids, list_rows, list_offsets, nprobe=IVF_NPROBE):
+        self.vectors = embeddings
+        self.centroids = centroids
+        self.list_rows = list_rows
+        self.list_offsets = list_offsets
+        self.nprobe = nprobe
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def build(cls, embeddings, nlist=None, iters=20, seed=0, max_train=None):
+        x = normalize_rows(embeddings)
+        n = len(x)
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+
+        # Train on a sample; assignment below still covers every row.
+        max_train = max_train or 256 * nlist
+        train = x[rng.choice(n, size=min(n, max_train), replace=False)]
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+
+        for _ in range(iters):
+            assign = _assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            counts = np.bincount(assign, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        assign = _assign(x, centroids)
+        list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assign, minlength=nlist))]
+        ).astype(np.int64)
+        return cls(x, centroids, list_rows, list_offsets)
+
+    def search(self, query: np.ndarray, k: int):
+        q = normalize_rows(query.reshape(-1))
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe, _ = top_k_scores(self.centroids, q, nprobe)
+
+        cands = np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+        ])
+        top, sims = top_k_scores(self.vectors[cands], q, k)
+        return cands[top], sims
+
+    def search_batch(self, queries: np.ndarray, k: int):
+        results = [self.search(q, k) for q in queries]
+        return [r[0] for r in results], [r[1] for r in results]
+
+    def extended(self, embeddings):
+        """
+        A new index over `embeddings`, whose first len(self) rows are the
+        indexed ones: appended rows join their nearest existing list, the
+        centroids are kept. This index is left untouched.
+        """
+        nlist = len(self.centroids)
+        assign = np.empty(len(embeddings), dtype=np.int64)
+        assign[self.list_rows] = np.repeat(np.arange(nlist), np.diff(self.list_offsets))
+        assign[len(self):] = _assign(embeddings[len(self):], self.centroids)
+
+        list_rows = np.argsort(assign, kind="stable").astype(np.int64)
+        list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assign, minlength=nlist))]
+        ).astype(np.int64)
+        return IVFIndex(embeddings, self.centroids, list_rows, list_offsets, self.nprobe)
+
+    def save(self, path: Path, corpus_version=None):
+        np.savez(
+            path,
+            centroids=self.centroids,
+            list_rows=self.list_rows,
+            list_offsets=self.list_offsets,
+            meta=json.dumps({"count": len(self), "corpus_version": corpus_version}),
+        )
+
+    @classmethod
+    def load(cls, path: Path, embeddings):
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        index = cls(embeddings, data["centroids"], data["list_rows"], data["list_offsets"])
+        return index, meta
+
+
+def _assign(x, centroids, chunk=65536):
+    """Nearest centroid (by inner product) for each row, in bounded chunks."""
+    out = np.empty(len(x), dtype=np.int64)
+    for start in range(0, len(x), chunk):
+        out[start:start + chunk] = np.argmax(x[start:start + chunk] @ centroids.T, axis=1)
+    return out
+
+
+# -----------------------------
+#   HNSW (optional)
+# -----------------------------
+class HNSWIndex:
+    kind = "hnsw"
+
+    def __init__(self, graph, count, ef=HNSW_EF):
+        self.graph = graph
+        self.count = count
+        self.graph.set_ef(ef)
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def build(cls, embeddings, m=16, ef_construction=200):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed; use the ivf index instead.")
+        graph = hnswlib.Index(space="cosine", dim=embeddings.shape[1])
+        graph.init_index(max_elements=len(embeddings), M=m, ef_construction=ef_construction)
+        graph.add_items(np.asarray(embeddings, dtype=np.float32), np.arange(len(embeddings)))
+        return cls(graph, len(embeddings))
+
+    def search(self, query: np.ndarray, k: int):
+        k = min(k, self.count)
+        labels, distances = self.graph.knn_query(query.reshape(1, -1), k=k)
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+    def search_batch(self, queries: np.ndarray, k: int):
+        k = min(k, self.count)
+        labels, distances = self.graph.knn_query(np.asarray(queries, dtype=np.float32), k=k)
+        return labels.astype(np.int64), 1.0 - distances
+
+    def extended(self, embeddings):
+        # The graph is updated in place by add_items, so build a new one
+        # rather than touching the graph in-flight requests are reading.
+        return HNSWIndex.build(embeddings)
+
+    def save(self, path: Path, corpus_version=None):
+        self.graph.save_index(str(path))
+        with open(Path(str(path) + ".json"), "w") as f:
+            json.dump({"count": self.count, "corpus_version": corpus_version}, f)
+
+    @classmethod
+    def load(cls, path: Path, embeddings):
+        if hnswlib is None:
+            raise RuntimeError("hnswlib is not installed.")
+        with open(Path(str(path) + ".json")) as f:
+            meta = json.load(f)
+        graph = hnswlib.Index(space="cosine", dim=embeddings.shape[1])
+        graph.load_index(str(path), max_elements=meta["count"])
+        return cls(graph, meta["count"]), meta
+
+
+INDEX_TYPES = {"ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+# -----------------------------
+#   BUILD / LOAD
+# -----------------------------
+def build_index(embeddings, kind="ivf", corpus_version=None, path=None):
+    """Build an ANN index for `embeddings` and persist it under data_cache/."""
+    index = INDEX_TYPES[kind].build(normalize_rows(embeddings))
+    path = path or INDEX_PATHS[kind]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index.save(path, corpus_version)
+    return index
+
+
+def load_index(embeddings, corpus_version=None, kind=INDEX_KIND):
+    """
+    Load the configured index, falling back to exact search when the
+    corpus is small, the persisted index is missing or stale, or the
+    optional backend is not installed.
+    """
+    if kind == "exact":
+        return ExactIndex(embeddings)
+
+    if kind == "sharded":
+        from app.sharded import ShardedIndex
+        index = ShardedIndex(embeddings).start()
+        print(f"[INFO] Sharded exact search: {index.shards} shards on {index.workers} processes.")
+        return index
+
+    if kind == "auto":
+        if len(embeddings) < ANN_MIN_ROWS:
+            return ExactIndex(embeddings)
+        candidates = [
+            k for k in ("hnsw", "ivf")
+            if INDEX_PATHS[k].exists() and (k != "hnsw" or hnswlib is not None)
+        ]
+        if not candidates:
+            return ExactIndex(embeddings)
+        kind = candidates[0]
+
+    path = INDEX_PATHS[kind]
+    if not path.exists():
+        print(f"[WARN] No {kind} index at {path}; using exact search.")
+        return ExactIndex(embeddings)
+
+    try:
+        index, meta = INDEX_TYPES[kind].load(path, embeddings)
+    except Exception as e:
+        print(f"[WARN] Could not load {kind} index ({e}); using exact search.")
+        return ExactIndex(embeddings)
+
+    if meta.get("count") != len(embeddings) or meta.get("corpus_version") != corpus_version:
+        print(f"[WARN] {kind} index is stale for this corpus; using exact search.")
+        return ExactIndex(embeddings)
+
+    print(f"[INFO] Loaded {kind} index over {len(index)} vectors.")
+    return index
@@ -0,0 +1,190 @@
+# app/lexical.py
+#
+# BM25 inverted index over message text, built next to the embeddings by
+# app.compute_embeddings and persisted as data_cache/corpus_lexical.npz.
+#
+# Names, venues and dates ("The French Laundry", "orchestra seats",
+# "June 14") are where dense similarity is weakest and exact term overlap
+# is strongest. Retrieval fuses the two rankings with reciprocal rank
+# fusion (rrf_fuse), and on large corpora uses the BM25 candidates as a
+# prefilter so dense scoring only touches those rows.
+#
+# Postings are stored CSR-style: the rows of term t are
+# rows[offsets[t]:offsets[t + 1]] with matching term frequencies in tf.
+
+import json
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from app.gazetteer import fold
+
+CACHE_DIR = Path("data_cache")
+LEXICAL_PATH = CACHE_DIR / "corpus_lexical.npz"
+
+BM25_K1 = float(os.getenv("MEMBER_QA_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("MEMBER_QA_BM25_B", "0.75"))
+RRF_K = int(os.getenv("MEMBER_QA_RRF_K", "60"))
+
+TERM_RE = re.compile(r"[0-9a-z]+")
+
+# Question words and glue that match half the corpus and carry no signal.
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "by",
+    "with", "from", "is", "are", "was", "were", "be", "do", "does", "did",
+    "i", "me", "my", "you", "your", "we", "our", "it", "its", "this", "that",
+    "what", "when", "where", "who", "which", "how", "why", "s", "please",
+    "can", "could", "would", "will", "has", "have", "had",
+}
+
+
+def terms(text: str) -> list[str]:
+    """Folded alphanumeric terms without stopwords: "Müller's jet" → ["muller", "jet"]."""
+    return [t for t in TERM_RE.findall(fold(text)) if t not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocab, offsets, rows, tf, doc_len, k1=BM25_K1, b=BM25_B):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.rows = rows
+        self.tf = tf
+        self.doc_len = doc_len
+        self.k1 = k1
+        self.b = b
+        n = len(doc_len)
+        df = np.diff(offsets)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.avgdl = float(doc_len.mean()) if n else 0.0
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts):
+        postings = {}
+        doc_len = np.zeros(len(texts), dtype=np.int32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for t in terms(text or ""):
+                counts[t] = counts.get(t, 0) + 1
+            doc_len[row] = sum(counts.values())
+            for t, c in counts.items():
+                postings.setdefault(t, []).append((row, c))
+
+        vocab = {t: i for i, t in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        for t, i in vocab.items():
+            offsets[i + 1] = len(postings[t])
+        offsets = np.cumsum(offsets)
+
+        rows = np.empty(offsets[-1], dtype=np.int32)
+        tf = np.empty(offsets[-1], dtype=np.float32)
+        for t, i in vocab.items():
+            plist = postings[t]
+            rows[offsets[i]:offsets[i + 1]] = [r for r, _ in plist]
+            tf[offsets[i]:offsets[i + 1]] = [c for _, c in plist]
+        return cls(vocab, offsets, rows, tf, doc_len)
+
+    def search(self, query: str, k: int, rows=None):
+        """
+        BM25 top-k as (row_indices, scores), restricted to the sorted
+        `rows` when given. Only rows sharing a term with the query are
+        touched, so cost follows posting-list length, not corpus size.
+        """
+        ids = sorted({self.vocab[t] for t in terms(query) if t in self.vocab})
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        hits = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+        tf = np.concatenate([self.tf[self.offsets[i]:self.offsets[i + 1]] for i in ids])
+        idf = np.repeat(self.idf[ids], np.diff(self.offsets)[ids])
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len[hits] / max(self.avgdl, 1e-9))
+        contrib = idf * tf * (self.k1 + 1) / (tf + norm)
+
+        cands, inverse = np.unique(hits, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib).astype(np.float32)
+
+        if rows is not None:
+            pos = np.searchsorted(rows, cands)
+            keep = (pos < len(rows)) & (rows[np.minimum(pos, len(rows) - 1)] == cands)
+            cands, scores = cands[keep], scores[keep]
+
+        k = min(k, len(cands))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return cands[top].astype(np.int64), scores[top]
+
+    def save(self, path: Path, corpus_version=None):
+        terms_sorted = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            path,
+            terms=np.array(terms_sorted, dtype=str),
+            offsets=self.offsets,
+            rows=self.rows,
+            tf=self.tf,
+            doc_len=self.doc_len,
+            meta=json.dumps({"count": len(self), "corpus_version": corpus_version}),
+        )
+
+    @classmethod
+    def load(cls, path: Path):
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        vocab = {str(t): i for i, t in enumerate(data["terms"])}
+        index = cls(vocab, data["offsets"], data["rows"], data["tf"], data["doc_len"])
+        return index, meta
+
+
+def rrf_fuse(rankings, k: int, rrf_k: int = RRF_K) -> np.ndarray:
+    """
+    Reciprocal rank fusion: each row scores sum(1 / (rrf_k + rank)) over
+    the rankings it appears in. Returns the top-k row ids, best first.
+    """
+    rankings = [np.asarray(r, dtype=np.int64) for r in rankings if len(r)]
+    if not rankings:
+        return np.empty(0, dtype=np.int64)
+
+    rows = np.concatenate(rankings)
+    weights = np.concatenate([1.0 / (rrf_k + np.arange(1, len(r) + 1)) for r in rankings])
+    cands, inverse = np.unique(rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=weights)
+
+    order = np.argsort(-fused, kind="stable")[:k]
+    return cands[order]
+
+
+# -----------------------------
+#   BUILD / LOAD
+# -----------------------------
+def message_texts(messages):
+    if hasattr(messages, "texts"):  # CorpusStore decodes the text column in one pass
+        return messages.texts()
+    return [m.get("text", "") for m in messages]
+
+
+def build_lexical_index(messages, corpus_version=None, path=LEXICAL_PATH):
+    index = BM25Index.build(message_texts(messages))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    index.save(path, corpus_version)
+    return index
+
+
+def load_lexical_index(messages, corpus_version=None, path=LEXICAL_PATH):
+    """The persisted index when it matches this corpus, else one built in memory."""
+    if path.exists():
+        try:
+            index, meta = BM25Index.load(path)
+            if meta.get("count") == len(messages) and meta.get("corpus_version") == corpus_version:
+                print(f"[INFO] Loaded BM25 index ({len(index.vocab)} terms).")
+                return index
+            print("[WARN] BM25 index is stale for this corpus; rebuilding in memory.")
+        except Exception as e:
+            print(f"[WARN] Could not load BM25 index ({e}); rebuilding in memory.")
+
+    return BM25Index.build(message_texts(messages))
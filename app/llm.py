@@ -1,7 +1,429 @@
+# app/llm.py
+#
+# The one place that talks to OpenAI. app.parsing and app.answer go
+# through chat()/chat_async()/stream_chat_async(), which share:
+#
+#   - one pooled client per flavour (sync/async), created on first use
+#   - a per-call deadline covering every attempt
+#   - jittered exponential retries on timeouts, connection errors, 429 and 5xx
+#   - optional hedging: a duplicate request after MEMBER_QA_LLM_HEDGE_MS,
+#     first success wins (async only)
+#   - a circuit breaker that fails fast with LLMUnavailable while the
+#     upstream is down, so callers can answer NOT_FOUND_ANSWER right away
+#   - optional on-disk response cache (MEMBER_QA_LLM_CACHE_DB) for
+#     temperature=0 calls, shared by every worker process and restart
+#
+# Importing openai/httpx is deferred with the clients.
+
+import asyncio
+import hashlib
+import json
 import os
-from openai import OpenAI
+import random
+import threading
+import time
+
+from app.cache import ResponseCache
+
+MODEL = "gpt-4o-mini"
+
+LLM_TIMEOUT = float(os.getenv("MEMBER_QA_LLM_TIMEOUT", "15"))       # seconds per call
+LLM_RETRIES = int(os.getenv("MEMBER_QA_LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("MEMBER_QA_LLM_BACKOFF", "0.25"))     # seconds, doubled per retry
+LLM_HEDGE_MS = float(os.getenv("MEMBER_QA_LLM_HEDGE_MS", "0"))      # 0 disables hedging
+LLM_MAX_CONNECTIONS = int(os.getenv("MEMBER_QA_LLM_MAX_CONNECTIONS", "32"))
+BREAKER_FAILURES = int(os.getenv("MEMBER_QA_LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("MEMBER_QA_LLM_BREAKER_RESET_S", "30"))
+# e.g. data_cache/llm_responses.sqlite; unset disables the response cache
+LLM_CACHE_DB = os.getenv("MEMBER_QA_LLM_CACHE_DB")
+LLM_CACHE_MAX_MB = float(os.getenv("MEMBER_QA_LLM_CACHE_MAX_MB", "64"))
+LLM_CACHE_TTL = float(os.getenv("MEMBER_QA_LLM_CACHE_TTL", "0"))    # seconds; 0 = no expiry
+
+
+class LLMUnavailable(Exception):
+    """The call ran out of attempts or deadline; the upstream is unhealthy."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    """Rejected without calling the upstream because the breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failed calls. After `reset_s` one
+    trial call is let through (half-open); its outcome closes or re-opens it.
+    A trial that ends without an outcome (cancelled) hands the slot back.
+    """
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_s: float = BREAKER_RESET_S):
+        self.failures = failures
+        self.reset_s = reset_s
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.short_circuits = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_s:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Raises CircuitOpenError when open; True when this call is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half-open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.short_circuits += 1
+        raise CircuitOpenError("LLM circuit breaker is open")
+
+    def release_trial(self):
+        """The trial call was cancelled: it says nothing about the upstream."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.trial_in_flight or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive,
+            "short_circuits": self.short_circuits,
+        }
+
+
+breaker = CircuitBreaker()
+
+LLM_STATS = {
+    "calls": 0,
+    "attempts": 0,
+    "retries": 0,
+    "hedges": 0,
+    "hedge_wins": 0,
+    "failures": 0,
+}
+
+
+# -----------------------------
+#   CLIENTS
+# -----------------------------
+# Clients are created on first use (not at import) and shared by
+# app.parsing and app.answer. The SDK's own retries are off; the loop
+# below owns retries so that they respect the per-call deadline.
+_client = None
+_async_client = None
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+    )
+
+
+def get_client():
+    global _client
+    if _client is None:
+        from openai import DefaultHttpxClient, OpenAI
+        _client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            http_client=DefaultHttpxClient(limits=_limits()),
+        )
+    return _client
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            max_retries=0,
+            timeout=LLM_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(limits=_limits()),
+        )
+    return _async_client
+
+
+# -----------------------------
+#   RESPONSE CACHE
+# -----------------------------
+# temperature=0 completions for the same request are reused instead of
+# paid for again. The key hashes the model, messages (system + user
+# prompt) and parameters; answer calls also pass the corpus version
+# (cache_version) so they are never served across corpora, and entries
+# of other versions are purged at startup. Hits skip the breaker too.
+# The SQLite connection is opened on first use, after workers fork.
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _response_cache
+    if _response_cache is None and LLM_CACHE_DB:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache(
+                    LLM_CACHE_DB,
+                    max_bytes=int(LLM_CACHE_MAX_MB * (1 << 20)),
+                    ttl=LLM_CACHE_TTL or None,
+                )
+    return _response_cache
+
+
+def response_cache_key(request: dict, version=None) -> str:
+    # Streamed and blocking calls share entries.
+    payload = {k: v for k, v in request.items() if k != "stream"}
+    payload["corpus_version"] = version
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _cache_slot(request: dict, version):
+    """(cache, key) when this request may be cached, else (None, None)."""
+    cache = get_response_cache()
+    if cache is None or request.get("temperature") != 0:
+        return None, None
+    return cache, response_cache_key(request, version)
+
+
+def purge_response_cache(keep_version) -> int:
+    """Drop cached answers of other corpus versions; 0 when the cache is off."""
+    cache = get_response_cache()
+    return cache.purge_versions(keep_version) if cache is not None else 0
+
+
+# -----------------------------
+#   RETRY POLICY
+# -----------------------------
+def is_retryable(error: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError  # APITimeoutError is a connection error
+
+    if isinstance(error, (APIConnectionError, asyncio.TimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, LLM_BACKOFF * (2 ** attempt))
+
+
+def _request(messages, max_tokens, temperature, **params) -> dict:
+    return {
+        "model": params.pop("model", MODEL),
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        **params,
+    }
+
+
+def chat(messages, max_tokens=150, temperature=0.0, timeout=None, cache_version=None,
+         **params) -> str:
+    """Blocking completion; returns the stripped message text."""
+    request = _request(messages, max_tokens, temperature, **params)
+    cache, key = _cache_slot(request, cache_version)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    trial = breaker.allow()
+    try:
+        LLM_STATS["calls"] += 1
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+
+        for attempt in range(LLM_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            LLM_STATS["attempts"] += 1
+            try:
+                response = get_client().chat.completions.create(**request, timeout=max(remaining, 0.001))
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()  # the upstream answered; the request was bad
+                    raise
+                error = e
+            else:
+                breaker.record_success()
+                text = response.choices[0].message.content.strip()
+                if cache is not None:
+                    cache.set(key, text, cache_version)
+                return text
+
+            delay = backoff_delay(attempt)
+            if attempt == LLM_RETRIES or time.monotonic() + delay >= deadline:
+                break
+            LLM_STATS["retries"] += 1
+            time.sleep(delay)
+
+        LLM_STATS["failures"] += 1
+        breaker.record_failure()
+        raise LLMUnavailable(f"LLM call failed: {error!r}") from error
+    except BaseException as e:
+        if trial and not isinstance(e, Exception):  # KeyboardInterrupt and the like
+            breaker.release_trial()
+        raise
+
+
+async def _hedged(call, hedge_after: float):
+    """Run call(); if it is still pending after `hedge_after` s, race a duplicate."""
+    first = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+
+    LLM_STATS["hedges"] += 1
+    second = asyncio.ensure_future(call())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        LLM_STATS["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _with_retries(call, timeout):
+    """Retry `call()` (a coroutine factory) until success or the deadline passes."""
+    trial = breaker.allow()
+    try:
+        LLM_STATS["calls"] += 1
+        deadline = time.monotonic() + (timeout or LLM_TIMEOUT)
+
+        for attempt in range(LLM_RETRIES + 1):
+            remaining = deadline - time.monotonic()
+            LLM_STATS["attempts"] += 1
+            try:
+                attempt_call = lambda: call(max(remaining, 0.001))
+                if LLM_HEDGE_MS > 0:
+                    result = await asyncio.wait_for(_hedged(attempt_call, LLM_HEDGE_MS / 1000), remaining)
+                else:
+                    result = await asyncio.wait_for(attempt_call(), remaining)
+            except Exception as e:
+                if not is_retryable(e):
+                    breaker.record_success()  # the upstream answered; the request was bad
+                    raise
+                error = e
+            else:
+                breaker.record_success()
+                return result
+
+            delay = backoff_delay(attempt)
+            if attempt == LLM_RETRIES or time.monotonic() + delay >= deadline:
+                break
+            LLM_STATS["retries"] += 1
+            await asyncio.sleep(delay)
+
+        LLM_STATS["failures"] += 1
+        breaker.record_failure()
+        raise LLMUnavailable(f"LLM call failed: {error!r}") from error
+    except BaseException as e:
+        # CancelledError (client disconnect, wait_for on the caller) skips the
+        # handlers above; without this a cancelled trial would hold the slot forever.
+        if trial and not isinstance(e, Exception):
+            breaker.release_trial()
+        raise
+
+
+async def chat_async(messages, max_tokens=150, temperature=0.0, timeout=None,
+                     cache_version=None, **params) -> str:
+    """Async completion with deadline, retries, hedging and breaker; returns the text."""
+    request = _request(messages, max_tokens, temperature, **params)
+    cache, key = _cache_slot(request, cache_version)
+    if cache is not None:
+        # SQLite I/O runs off the event loop; another worker may hold the file.
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            return cached
+
+    async def call(remaining):
+        return await get_async_client().chat.completions.create(**request, timeout=remaining)
+
+    response = await _with_retries(call, timeout)
+    text = response.choices[0].message.content.strip()
+    if cache is not None:
+        await asyncio.to_thread(cache.set, key, text, cache_version)
+    return text
+
+
+async def stream_chat_async(messages, max_tokens=150, temperature=0.0, timeout=None,
+                            cache_version=None, **params):
+    """
+    Yield content deltas. Opening the stream is retried like chat_async;
+    once tokens have been sent, a failure is raised as LLMUnavailable.
+    A cached response is yielded as a single delta.
+    """
+    request = _request(messages, max_tokens, temperature, stream=True, **params)
+    cache, key = _cache_slot(request, cache_version)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            yield cached
+            return
+
+    async def call(remaining):
+        return await get_async_client().chat.completions.create(**request, timeout=remaining)
+
+    stream = await _with_retries(call, timeout)
+    parts = []
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        if not is_retryable(e):
+            raise
+        LLM_STATS["failures"] += 1
+        breaker.record_failure()
+        raise LLMUnavailable(f"LLM stream failed: {e!r}") from e
+
+    if cache is not None:
+        await asyncio.to_thread(cache.set, key, "".join(parts).strip(), cache_version)
+
+
+def llm_stats() -> dict:
+    cache = get_response_cache()
+    return {
+        **LLM_STATS,
+        "hedge_ms": LLM_HEDGE_MS,
+        "timeout_s": LLM_TIMEOUT,
+        "breaker": breaker.stats(),
+        "response_cache": cache.stats() if cache is not None else None,
+    }
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 SYSTEM_PROMPT = """
 You are a question-answering system.
@@ -20,14 +442,11 @@ def answer_with_llm(question: str, context_messages: list[str]) -> str:
     Answer based ONLY on the context above.
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
+    return chat(
+        [
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user",   "content": prompt}
         ],
         max_tokens=150,
         temperature=0.0,   # deterministic
     )
-
-    return response.choices[0].message.content.strip()
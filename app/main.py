@@ -1,22 +1,51 @@
 # main.py
 
-from fastapi import FastAPI, HTTPException, Request
-from pydantic import BaseModel
-from contextlib import asynccontextmanager
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from slowapi.middleware import SlowAPIMiddleware
+from app.startup import phase, startup_report
 
-from app.data import load_corpus
-from app.embeddings import load_or_compute_embeddings
-from app.retrieval import retrieve_relevant_messages
+with phase("import.web"):
+    from fastapi import FastAPI, HTTPException, Request
+    from pydantic import BaseModel
+    from contextlib import asynccontextmanager
+    from fastapi.responses import JSONResponse, StreamingResponse
 
-# ALWAYS use OpenAI parsing + answer generation
-from app.parsing import parse_question
-from app.answer import generate_answer
+    from slowapi import Limiter
+    from slowapi.util import get_remote_address
+    from slowapi.errors import RateLimitExceeded
+    from slowapi.middleware import SlowAPIMiddleware
+
+# Nothing below imports torch, sentence-transformers, openai or sklearn;
+# those load on first use or in the background after startup.
+with phase("import.app"):
+    from app.cache import SemanticCache
+    from app.data import load_corpus
+    from app.gazetteer import Gazetteer
+    import app.embeddings as emb
+    from app.embeddings import (
+        load_or_compute_embeddings, load_manifest, query_cache_stats, verify_backend,
+    )
+    from app.index import load_index, normalize_rows
+    from app.lexical import load_lexical_index
+    from app.timeline import TimestampIndex
+    from app.retrieval import (
+        UserPartitions, embed_question_async, embed_questions, retrieve_batch_rows, retrieve_for_user,
+        retrieve_rows_for_user, retrieval_stats,
+    )
+
+    # Local gazetteer parse with OpenAI fallback; OpenAI answer generation
+    from app.snapshot import CorpusSnapshot, REFRESH_INTERVAL_S, refresh_stats, start_refresher
+    from app.parsing import parse_question_with_fallback, parse_stats
+    from app.answer import (
+        NOT_FOUND_ANSWER, context_stats, generate_answer_async, stream_answer_async,
+    )
+    from app.extractive import extractive_stats
+    from app.llm import LLMUnavailable, llm_stats, purge_response_cache
 
 
 # -----------------------------
@@ -32,23 +61,135 @@ DEBUG_LAST = {
     "retrieved": None
 }
 
+# -----------------------------
+#   RETRIEVAL EXECUTOR
+# -----------------------------
+# Local embedding + vector search are CPU-bound; run them on a small,
+# bounded pool so the event loop stays free for in-flight LLM calls.
+RETRIEVAL_WORKERS = int(os.getenv("MEMBER_QA_RETRIEVAL_WORKERS", str(min(4, os.cpu_count() or 1))))
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=RETRIEVAL_WORKERS,
+    thread_name_prefix="retrieval",
+)
+# Messages retrieved per question; the prompt size is capped separately
+# by MEMBER_QA_CONTEXT_TOKENS in app.answer.
+RETRIEVAL_K = int(os.getenv("MEMBER_QA_RETRIEVAL_K", "5"))
+
+# -----------------------------
+#   SEMANTIC ANSWER CACHE
+# -----------------------------
+# Near-duplicate questions about the same member (and corpus version)
+# reuse the previous answer instead of paying for another LLM call.
+answer_cache = SemanticCache(
+    maxsize=int(os.getenv("MEMBER_QA_ANSWER_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("MEMBER_QA_ANSWER_CACHE_TTL", "3600")),
+    threshold=float(os.getenv("MEMBER_QA_ANSWER_CACHE_THRESHOLD", "0.95")),
+)
+
+# -----------------------------
+#   BATCH ASK
+# -----------------------------
+BATCH_MAX_QUESTIONS = int(os.getenv("MEMBER_QA_BATCH_MAX_QUESTIONS", "200"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("MEMBER_QA_BATCH_LLM_CONCURRENCY", "8"))
+
 
 # -----------------------------
 #   LIFESPAN
 # -----------------------------
+READINESS_PHASES = ("corpus", "embeddings", "index", "model", "backend_check", "warmup")
+WARMUP_QUESTION = "When is Layla going to London?"
+
+
+def warm_up(state):
+    """
+    One real encode (tokenizer init + first forward pass) and a dummy
+    global and per-member search, so the first user request is not cold.
+    """
+    snap = state.snapshot
+    with phase("warmup"):
+        q_emb = normalize_rows(emb.encode_batch([WARMUP_QUESTION]))[0]
+        retrieve_for_user(
+            q_emb, 5, snap.messages, snap.embeddings, snap.index, snap.partitions, None,
+            WARMUP_QUESTION, snap.lexical,
+        )
+        if snap.partitions.names:
+            retrieve_for_user(
+                q_emb, 5, snap.messages, snap.embeddings, snap.index, snap.partitions,
+                snap.partitions.names[0], WARMUP_QUESTION, snap.lexical,
+            )
+    state.ready = True
+
+
+def load_model_in_background(app: FastAPI, messages, embeddings, manifest):
+    """Load the encoder off the startup path, verify it against the corpus, warm up."""
+    def run():
+        try:
+            emb.get_model()
+            with phase("backend_check"):
+                app.state.embedding_backend = verify_backend(messages, embeddings, manifest)
+            print(f"[INFO] Query embedding backend: {app.state.embedding_backend['backend']}")
+            warm_up(app.state)
+            print("[INFO] Warm-up done; ready for traffic.")
+        except Exception as e:
+            print(f"[ERROR] Background model load failed: {e}")
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("[INFO] Loading messages...")
-    messages = load_corpus()
+    with phase("corpus"):
+        print("[INFO] Loading messages...")
+        messages = load_corpus()
+
+    with phase("embeddings"):
+        print("[INFO] Computing embeddings...")
+        embeddings = load_or_compute_embeddings(messages)
+
+        manifest = load_manifest()
+        corpus_version = manifest["corpus_version"] if manifest else None
+        if manifest and manifest.get("count") != len(embeddings):
+            print("[WARN] Embedding manifest does not match loaded embeddings.")
+        print(f"[INFO] Corpus version: {corpus_version}")
+
+    with phase("index"):
+        print("[INFO] Loading search index...")
+        index = load_index(embeddings, corpus_version)
+        if index.kind == "sharded":
+            embeddings = index.embeddings  # serve from the shared block, not a second copy
+
+        lexical = load_lexical_index(messages, corpus_version)
+
+        gazetteer = Gazetteer.from_messages(messages)
+        print(f"[INFO] Gazetteer built for {len(gazetteer)} members.")
+        partitions = UserPartitions(messages)
+        timeline = TimestampIndex.from_messages(messages)
+        print(f"[INFO] Timestamp index built ({len(timeline.sorted)} dated messages).")
+
+    # Everything a request reads about the corpus; replaced as a whole
+    # by the refresher (app.snapshot), never mutated.
+    app.state.snapshot = CorpusSnapshot(
+        messages, embeddings, corpus_version, index, lexical, gazetteer, partitions, timeline
+    )
+    app.state.embedding_backend = None
+    app.state.ready = False
+
+    purged = purge_response_cache(corpus_version)
+    if purged:
+        print(f"[INFO] LLM response cache: dropped {purged} answers of older corpus versions.")
 
-    print("[INFO] Computing embeddings...")
-    embeddings = load_or_compute_embeddings(messages)
+    load_model_in_background(app, messages, embeddings, manifest)
 
-    app.state.corpus_messages = messages
-    app.state.corpus_embeddings = embeddings
+    refresher_stop = threading.Event()
+    if REFRESH_INTERVAL_S > 0:
+        start_refresher(app.state, emb.encode_batch, REFRESH_INTERVAL_S, refresher_stop)
 
     yield
 
+    refresher_stop.set()
+
 
 
 app = FastAPI(lifespan=lifespan)
@@ -65,48 +206,332 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     )
 
 
+def answer_scope(snap, parsed):
+    """Answer-cache scope: corpus version, member and time window."""
+    window = parsed.get("time_window")
+    return (
+        snap.version,
+        parsed.get("user_name"),
+        (window["start"], window["end"]) if window else None,
+    )
+
+
 class AskRequest(BaseModel):
     question: str
 
 
+class AskBatchRequest(BaseModel):
+    questions: list[str]
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready(request: Request):
+    """
+    Readiness for load balancers: 200 only once the corpus, embeddings,
+    index and model are loaded and a warm-up encode + search has run.
+    """
+    report = startup_report()
+    phases = {name: report["phases"].get(name) for name in READINESS_PHASES}
+
+    if any(p and p["status"] == "error" for p in phases.values()):
+        status = "error"
+    elif getattr(request.app.state, "ready", False):
+        status = "ready"
+    else:
+        status = "loading"
+
+    return JSONResponse(
+        status_code=200 if status == "ready" else 503,
+        content={"status": status, "uptime_ms": report["uptime_ms"], "phases": phases},
+    )
+
+
 @app.post("/ask")
 @limiter.limit("30/minute")
-def ask(req: AskRequest, request: Request):
+async def ask(req: AskRequest, request: Request):
     question = req.question.strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
-    # Parse the question with OpenAI
-    parsed = parse_question(question)
+    # Embed the question in the executor while the parse (local, or OpenAI
+    # fallback) is in flight; scoring waits for the member name so that a
+    # question about a known member only scores that member's rows.
+    # The corpus snapshot is read once so a hot reload cannot swap it
+    # between retrieval and answer.
+    snap = request.app.state.snapshot
+    loop = asyncio.get_running_loop()
+    parsed, q_emb = await asyncio.gather(
+        parse_question_with_fallback(question, snap.gazetteer),
+        embed_question_async(question, retrieval_executor),
+    )
 
-    # Retrieve relevant messages
-    retrieved = retrieve_relevant_messages(
-        question=question,
-        user_name=parsed.get("user_name"),
-        k=5,
-        request=request
+    cache_scope = answer_scope(snap, parsed)
+    cached = answer_cache.get(q_emb, cache_scope)
+    if cached is not None:
+        DEBUG_LAST["parsed"] = parsed
+        DEBUG_LAST["retrieved"] = None
+        return cached
+
+    timings, context = {}, {}
+    rows = await loop.run_in_executor(
+        retrieval_executor,
+        retrieve_rows_for_user,
+        q_emb,
+        RETRIEVAL_K,
+        snap.embeddings,
+        snap.index,
+        snap.partitions,
+        parsed.get("user_name"),
+        question,
+        snap.lexical,
+        timings,
+        parsed.get("time_window"),
+        snap.timeline,
     )
+    retrieved = [snap.messages[i] for i in rows]
 
     # SAVE DEBUG INFO
     DEBUG_LAST["parsed"] = parsed
     DEBUG_LAST["retrieved"] = retrieved
+    DEBUG_LAST["timings"] = timings
+    DEBUG_LAST["context"] = context
     print("DEBUG PARSED:", parsed)
     
-    # Generate final answer with OpenAI
+    # Generate final answer: read straight from the top messages when
+    # they clearly hold it (app.extractive), otherwise with OpenAI
     print("DEBUG retrieved passed into answer:", retrieved)
-    answer = generate_answer(
-        question=question,
-        parsed=parsed,
-        retrieved_messages=retrieved
-    )
+    vectors = snap.embeddings[rows]
+    start = time.perf_counter()
+    try:
+        answer = await generate_answer_async(
+            question=question,
+            parsed=parsed,
+            retrieved_messages=retrieved,
+            vectors=vectors,
+            report=context,
+            scores=vectors @ q_emb,
+            corpus_version=snap.version,
+        )
+    except LLMUnavailable as e:
+        # Upstream down or breaker open: answer fast, and don't cache it.
+        print(f"[WARN] {e}")
+        return {"answer": NOT_FOUND_ANSWER}
+    answer_cache.set(q_emb, answer, cache_scope, (time.perf_counter() - start) * 1000)
 
     return answer
 
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ask/stream")
+@limiter.limit("30/minute")
+async def ask_stream(req: AskRequest, request: Request):
+    """
+    Server-sent events variant of /ask: a `retrieval` event as soon as the
+    messages are picked, `token` events as the answer streams in, then a
+    `done` event carrying the same {"answer": ...} that /ask returns.
+    """
+    question = req.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
+
+    snap = request.app.state.snapshot
+    loop = asyncio.get_running_loop()
+    parsed, q_emb = await asyncio.gather(
+        parse_question_with_fallback(question, snap.gazetteer),
+        embed_question_async(question, retrieval_executor),
+    )
+    cache_scope = answer_scope(snap, parsed)
+
+    async def events():
+        cached = answer_cache.get(q_emb, cache_scope)
+        if cached is not None:
+            DEBUG_LAST["parsed"] = parsed
+            DEBUG_LAST["retrieved"] = None
+            yield sse_event("retrieval", {"user_name": parsed.get("user_name"), "cached": True, "messages": []})
+            yield sse_event("done", cached)
+            return
+
+        timings, context = {}, {}
+        rows = await loop.run_in_executor(
+            retrieval_executor,
+            retrieve_rows_for_user,
+            q_emb,
+            RETRIEVAL_K,
+            snap.embeddings,
+            snap.index,
+            snap.partitions,
+            parsed.get("user_name"),
+            question,
+            snap.lexical,
+            timings,
+            parsed.get("time_window"),
+            snap.timeline,
+        )
+        retrieved = [snap.messages[i] for i in rows]
+        DEBUG_LAST["parsed"] = parsed
+        DEBUG_LAST["retrieved"] = retrieved
+        DEBUG_LAST["timings"] = timings
+        DEBUG_LAST["context"] = context
+
+        yield sse_event("retrieval", {
+            "user_name": parsed.get("user_name"),
+            "cached": False,
+            "messages": [
+                {k: m.get(k) for k in ("message_id", "user_name", "text", "timestamp")}
+                for m in retrieved
+            ],
+        })
+
+        start = time.perf_counter()
+        parts = []
+        try:
+            vectors = snap.embeddings[rows]
+            async for delta in stream_answer_async(
+                question, parsed, retrieved, vectors, context, vectors @ q_emb, snap.version
+            ):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except LLMUnavailable as e:
+            print(f"[WARN] {e}")
+            yield sse_event("done", {"answer": NOT_FOUND_ANSWER})
+            return
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Answer generation failed: {e}"})
+            return
+
+        answer = {"answer": "".join(parts).strip()}
+        answer_cache.set(q_emb, answer, cache_scope, (time.perf_counter() - start) * 1000)
+        yield sse_event("done", answer)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/ask/batch")
+@limiter.limit("10/minute")
+async def ask_batch(req: AskBatchRequest, request: Request):
+    """
+    Answer many questions in one call. Questions are embedded in one
+    encode, scored with matrix–matrix products, and the parse/answer LLM
+    calls run with bounded concurrency. Results keep the input order;
+    a failing question gets {"error": ...} instead of failing the batch.
+    """
+    if not req.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch.",
+        )
+
+    questions = [q.strip() for q in req.questions]
+    results = [None if q else {"error": "Question cannot be empty."} for q in questions]
+    valid = [i for i, q in enumerate(questions) if q]
+    if not valid:
+        return {"results": results}
+
+    snap = request.app.state.snapshot
+    loop = asyncio.get_running_loop()
+    llm_slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def parse_one(question):
+        async with llm_slots:
+            return await parse_question_with_fallback(question, snap.gazetteer)
+
+    parsed_list, q_embs = await asyncio.gather(
+        asyncio.gather(*(parse_one(questions[i]) for i in valid), return_exceptions=True),
+        loop.run_in_executor(retrieval_executor, embed_questions, [questions[i] for i in valid]),
+    )
+    user_names = [
+        p.get("user_name") if isinstance(p, dict) else None for p in parsed_list
+    ]
+    time_windows = [
+        p.get("time_window") if isinstance(p, dict) else None for p in parsed_list
+    ]
+
+    rows_list = await loop.run_in_executor(
+        retrieval_executor,
+        retrieve_batch_rows,
+        q_embs,
+        RETRIEVAL_K,
+        snap.embeddings,
+        snap.index,
+        snap.partitions,
+        user_names,
+        [questions[i] for i in valid],
+        snap.lexical,
+        time_windows,
+        snap.timeline,
+    )
+
+    async def answer_one(j, i):
+        parsed = parsed_list[j]
+        if isinstance(parsed, Exception):
+            results[i] = {"error": f"Question parsing failed: {parsed}"}
+            return
+
+        cache_scope = answer_scope(snap, parsed)
+        cached = answer_cache.get(q_embs[j], cache_scope)
+        if cached is not None:
+            results[i] = cached
+            return
+
+        # same inputs as /ask, so both endpoints take the same extractive/LLM path
+        rows = rows_list[j]
+        vectors = snap.embeddings[rows]
+        try:
+            async with llm_slots:
+                start = time.perf_counter()
+                answer = await generate_answer_async(
+                    question=questions[i],
+                    parsed=parsed,
+                    retrieved_messages=[snap.messages[r] for r in rows],
+                    vectors=vectors,
+                    scores=vectors @ q_embs[j],
+                    corpus_version=snap.version,
+                )
+            answer_cache.set(q_embs[j], answer, cache_scope, (time.perf_counter() - start) * 1000)
+            results[i] = answer
+        except LLMUnavailable:
+            results[i] = {"answer": NOT_FOUND_ANSWER}
+        except Exception as e:
+            results[i] = {"error": f"Answer generation failed: {e}"}
+
+    await asyncio.gather(*(answer_one(j, i) for j, i in enumerate(valid)))
+    return {"results": results}
+
+
 @app.get("/debug/last")
 def debug_last():
     return DEBUG_LAST
+
+
+@app.get("/debug/startup")
+def debug_startup():
+    return startup_report()
+
+
+@app.get("/debug/stats")
+def debug_stats():
+    return {
+        "query_embedding_cache": query_cache_stats(),
+        "embedding_backend": getattr(app.state, "embedding_backend", None),
+        "parse": parse_stats(),
+        "context": context_stats(),
+        "extractive": extractive_stats(),
+        "retrieval": retrieval_stats(),
+        "answer_cache": answer_cache.stats(),
+        "refresh": refresh_stats(app.state),
+        "llm": llm_stats(),
+    }
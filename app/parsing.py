@@ -1,20 +1,14 @@
 # app/parsing_openai.py
-import os
 import json
-from openai import OpenAI
+import time
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from app.gazetteer import parse_locally
+from app.llm import LLMUnavailable, chat, chat_async
+from app.timeline import time_window
 
-def parse_question(question: str) -> dict:
-    """
-    Use OpenAI GPT-4o-mini to extract:
-    - user_name
-    - intent
-    - entities
-    - raw question
-    """
 
-    prompt = f"""
+def build_parse_prompt(question: str) -> str:
+    return f"""
 Extract structured data from the user's question. Return ONLY valid JSON.
 
 Fields:
@@ -28,18 +22,8 @@ Question: "{question}"
 Return ONLY the JSON. No explanation.
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "Respond ONLY with strict JSON."},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=150,
-        temperature=0
-    )
-
-    text = response.choices[0].message.content.strip()
 
+def parse_llm_output(text: str, question: str) -> dict:
     try:
         start = text.index("{")
         end = text.rindex("}") + 1
@@ -51,3 +35,100 @@ Return ONLY the JSON. No explanation.
             "entities": [],
             "raw": question
         }
+
+
+def parse_question(question: str) -> dict:
+    """
+    Use OpenAI GPT-4o-mini to extract:
+    - user_name
+    - intent
+    - entities
+    - raw question
+    """
+
+    text = chat(
+        [
+            {"role": "system", "content": "Respond ONLY with strict JSON."},
+            {"role": "user", "content": build_parse_prompt(question)}
+        ],
+        max_tokens=150,
+        temperature=0
+    )
+    return parse_llm_output(text, question)
+
+
+async def parse_question_async(question: str) -> dict:
+    """Same as parse_question, on the async client (does not hold a thread)."""
+
+    text = await chat_async(
+        [
+            {"role": "system", "content": "Respond ONLY with strict JSON."},
+            {"role": "user", "content": build_parse_prompt(question)}
+        ],
+        max_tokens=150,
+        temperature=0
+    )
+    return parse_llm_output(text, question)
+
+
+# -----------------------------
+#   LOCAL-FIRST PARSE
+# -----------------------------
+PARSE_STATS = {
+    "total": 0,
+    "local": 0,
+    "llm_fallback": 0,
+    "llm_unavailable": 0,
+    "time_scoped": 0,
+    "local_ms_total": 0.0,
+    "llm_ms_total": 0.0,
+}
+
+
+async def parse_question_with_fallback(question: str, gazetteer=None) -> dict:
+    """
+    Resolve the member name with the corpus gazetteer; only fall back to
+    the LLM parse when the local parser is not confident. The time window
+    ("last month", see app.timeline) is always read locally.
+    """
+    PARSE_STATS["total"] += 1
+    window = time_window(question)
+    PARSE_STATS["time_scoped"] += window is not None
+
+    local = None
+    if gazetteer is not None:
+        local, confident = parse_locally(question, gazetteer)
+        local["time_window"] = window
+        PARSE_STATS["local_ms_total"] += local["parse_ms"]
+        if confident:
+            PARSE_STATS["local"] += 1
+            return local
+
+    PARSE_STATS["llm_fallback"] += 1
+    start = time.perf_counter()
+    try:
+        parsed = await parse_question_async(question)
+    except LLMUnavailable as e:
+        # Keep answering with whatever the local parse found (a global
+        # search when it found nobody) rather than failing the request.
+        PARSE_STATS["llm_unavailable"] += 1
+        print(f"[WARN] LLM parse unavailable, using local parse: {e}")
+        return local or {**parse_llm_output("", question), "time_window": window}
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    PARSE_STATS["llm_ms_total"] += elapsed_ms
+
+    parsed["time_window"] = window
+    parsed["source"] = "llm"
+    parsed["parse_ms"] = round(elapsed_ms, 3)
+    return parsed
+
+
+def parse_stats() -> dict:
+    total = PARSE_STATS["total"]
+    fallbacks = PARSE_STATS["llm_fallback"]
+    return {
+        **PARSE_STATS,
+        "fallback_rate": round(fallbacks / total, 4) if total else 0.0,
+        "avg_local_ms": round(PARSE_STATS["local_ms_total"] / total, 4) if total else 0.0,
+        "avg_llm_ms": round(PARSE_STATS["llm_ms_total"] / fallbacks, 2) if fallbacks else 0.0,
+    }
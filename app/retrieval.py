@@ -1,28 +1,284 @@
 # app/retrieval.py
 
-from sklearn.metrics.pairwise import cosine_similarity
+import asyncio
+import os
+import time
+
+import numpy as np
+
 import app.embeddings as emb
+from app.index import normalize_rows, top_k_scores, top_k_scores_batch
+from app.lexical import rrf_fuse
 
+# hybrid: BM25 + dense fused with RRF; dense: embeddings only
+RETRIEVAL_MODE = os.getenv("MEMBER_QA_RETRIEVAL", "hybrid")
+LEXICAL_CANDIDATES = int(os.getenv("MEMBER_QA_LEXICAL_CANDIDATES", "200"))
+DENSE_CANDIDATES = int(os.getenv("MEMBER_QA_DENSE_CANDIDATES", "50"))
+# At or above this many rows in scope, dense scoring runs over the BM25
+# candidates only (when there are enough of them) instead of every row.
+PREFILTER_MIN_ROWS = int(os.getenv("MEMBER_QA_PREFILTER_MIN_ROWS", "50000"))
 
-def retrieve_relevant_messages(question, user_name, k, request=None):
-    messages = request.app.state.corpus_messages
-    embeddings = request.app.state.corpus_embeddings
+RETRIEVAL_STATS = {
+    "queries": 0,
+    "hybrid": 0,
+    "prefiltered": 0,
+    "time_scoped": 0,
+    "window_fallbacks": 0,
+    "lexical_ms_total": 0.0,
+    "dense_ms_total": 0.0,
+    "fusion_ms_total": 0.0,
+}
+
+
+class UserPartitions:
+    """
+    Corpus row ids grouped by member, built once at load time, so a
+    question about a known member only scores that member's rows.
+    """
+
+    def __init__(self, messages):
+        if hasattr(messages, "user_rows"):  # CorpusStore: group the user column directly
+            groups = {}
+            for (user_id, user_name), rows in messages.user_rows().items():
+                for key in (user_name, user_id):
+                    if key:
+                        groups.setdefault(key.lower(), []).append(rows)
+            self.rows = {key: np.sort(np.concatenate(parts)) for key, parts in groups.items()}
+            self.names = sorted({name.lower() for _, name in messages.users if name})
+            return
+
+        groups = {}
+        for i, m in enumerate(messages):
+            for key in (m.get("user_name"), m.get("user_id")):
+                if key:
+                    groups.setdefault(key.lower(), []).append(i)
+        self.rows = {key: np.asarray(rows, dtype=np.int64) for key, rows in groups.items()}
+        self.names = sorted({m["user_name"].lower() for m in messages if m.get("user_name")})
+
+    def __len__(self):
+        return len(self.names)
+
+    def rows_for(self, user_name):
+        """
+        Rows for `user_name` (exact name or user id, else any member whose
+        name contains it, e.g. "layla"). None when nobody matches.
+        """
+        if not user_name:
+            return None
+
+        key = user_name.lower()
+        if key in self.rows:
+            return self.rows[key]
+
+        matches = [self.rows[n] for n in self.names if key in n]
+        if not matches:
+            return None
+        return np.sort(np.concatenate(matches))
+
+
+def scope_rows(partitions, user_name=None, timeline=None, time_window=None, timings=None):
+    """
+    Sorted row ids a question may score: the member's partition, narrowed
+    to the rows sent inside `time_window` when one was parsed. None means
+    the whole corpus (no member and no window). A window no message falls
+    in (a misread phrase, or a clock past the corpus) is ignored rather
+    than leaving the question without context; `timings` records which.
+    """
+    rows = partitions.rows_for(user_name) if partitions is not None else None
+    if timeline is None or not time_window:
+        return rows
+
+    in_window = timeline.rows_between(time_window["start"], time_window["end"])
+    scoped = in_window if rows is None else np.intersect1d(rows, in_window, assume_unique=True)
+    if timings is not None:
+        timings["window_rows"] = len(scoped)
+        timings["window_fallback"] = not len(scoped)
+    return scoped if len(scoped) else rows
+
+
+def embed_question(question):
+    """Normalized (dim,) query vector."""
+    return normalize_rows(emb.embed_texts(question))[0]
+
+
+async def embed_question_async(question, executor=None):
+    """
+    embed_question from the event loop. With the micro-batcher on, the
+    question is submitted to it directly; otherwise it is encoded on
+    `executor`.
+    """
+    if emb.batcher is None:
+        return await asyncio.get_running_loop().run_in_executor(executor, embed_question, question)
+    return normalize_rows(await emb.embed_text_async(question))[0]
+
+
+def embed_questions(questions):
+    """Normalized (n, dim) query matrix from one encode call (cache misses only)."""
+    return normalize_rows(emb.embed_texts(list(questions)))
 
-    q_emb = emb.embed_texts(question)  # shape (1, dim)
-    sims = cosine_similarity(q_emb, embeddings)[0]
-    ranked_indices = sims.argsort()[::-1][:k]
 
-    ranked_messages = [messages[i] for i in ranked_indices]
+def search_rows(q_emb, k, embeddings, index, rows=None):
+    """Top-k over `rows` only when given, otherwise over the whole index."""
+    if rows is None:
+        return index.search(q_emb, k)
 
-    if user_name:
-        user_name = user_name.lower()
+    top, scores = top_k_scores(embeddings[rows], q_emb, k)
+    return rows[top], scores
 
-        filtered = [
-            m for m in ranked_messages
-            if user_name in m["user_name"].lower()
-        ]
 
-        if filtered:
-            ranked_messages = filtered
+def record_timings(timings):
+    RETRIEVAL_STATS["queries"] += 1
+    RETRIEVAL_STATS["hybrid"] += "lexical_ms" in timings
+    RETRIEVAL_STATS["prefiltered"] += bool(timings.get("prefiltered"))
+    RETRIEVAL_STATS["time_scoped"] += "window_rows" in timings
+    RETRIEVAL_STATS["window_fallbacks"] += bool(timings.get("window_fallback"))
+    for stage in ("lexical", "dense", "fusion"):
+        RETRIEVAL_STATS[f"{stage}_ms_total"] += timings.get(f"{stage}_ms", 0.0)
 
-    return ranked_messages
\ No newline at end of file
+
+def hybrid_search(q_emb, question, k, embeddings, index, lexical, rows=None):
+    """
+    BM25 candidates fused with the dense ranking by reciprocal rank
+    fusion. Returns (ranked row ids, per-stage timings in ms).
+    """
+    start = time.perf_counter()
+    lex_rows, _ = lexical.search(question, LEXICAL_CANDIDATES, rows)
+    lexical_done = time.perf_counter()
+
+    in_scope = len(embeddings) if rows is None else len(rows)
+    prefiltered = in_scope >= PREFILTER_MIN_ROWS and len(lex_rows) >= DENSE_CANDIDATES
+    if prefiltered:
+        cands = np.sort(lex_rows)
+        top, _ = top_k_scores(embeddings[cands], q_emb, DENSE_CANDIDATES)
+        dense_rows = cands[top]
+    else:
+        dense_rows, _ = search_rows(q_emb, DENSE_CANDIDATES, embeddings, index, rows)
+    dense_done = time.perf_counter()
+
+    ranked = rrf_fuse([dense_rows, lex_rows], k)
+    timings = {
+        "lexical_ms": round((lexical_done - start) * 1000, 3),
+        "dense_ms": round((dense_done - lexical_done) * 1000, 3),
+        "fusion_ms": round((time.perf_counter() - dense_done) * 1000, 3),
+        "lexical_candidates": len(lex_rows),
+        "dense_scored": len(lex_rows) if prefiltered else in_scope,
+        "prefiltered": prefiltered,
+    }
+    return ranked, timings
+
+
+def retrieve_rows_for_user(q_emb, k, embeddings, index, partitions, user_name=None,
+                           question=None, lexical=None, timings=None,
+                           time_window=None, timeline=None):
+    """
+    Ranked corpus row ids. Score only the named member's messages when the
+    member is known; fall back to a global search when no member is
+    identified. With a time window and the snapshot's TimestampIndex, only
+    rows sent inside the window are scored (all of them, if none were). With a
+    BM25 index and the question text, lexical and dense rankings are
+    fused. Per-stage timings are written into `timings` when a dict is given.
+    """
+    window = {}
+    rows = scope_rows(partitions, user_name, timeline, time_window, window)
+
+    if lexical is not None and question and RETRIEVAL_MODE == "hybrid":
+        ranked_indices, stages = hybrid_search(q_emb, question, k, embeddings, index, lexical, rows)
+    else:
+        start = time.perf_counter()
+        ranked_indices, _ = search_rows(q_emb, k, embeddings, index, rows)
+        stages = {"dense_ms": round((time.perf_counter() - start) * 1000, 3)}
+
+    stages.update(window)
+    record_timings(stages)
+    if timings is not None:
+        timings.update(stages)
+    return np.asarray(ranked_indices, dtype=np.int64)
+
+
+def retrieve_for_user(q_emb, k, messages, embeddings, index, partitions, user_name=None,
+                      question=None, lexical=None, timings=None,
+                      time_window=None, timeline=None):
+    """retrieve_rows_for_user, returning the messages themselves."""
+    rows = retrieve_rows_for_user(
+        q_emb, k, embeddings, index, partitions, user_name, question, lexical, timings,
+        time_window, timeline,
+    )
+    return [messages[i] for i in rows]
+
+
+def retrieve_batch_rows(q_embs, k, embeddings, index, partitions, user_names,
+                        questions=None, lexical=None, time_windows=None, timeline=None):
+    """
+    Vectorized retrieve_rows_for_user for many questions: questions are
+    grouped by member partition and time window (or global), and each
+    group is scored with one matrix–matrix product plus per-row top-k.
+    Returns one array of ranked row ids per question, in input order.
+    With a BM25 index, each dense ranking is then fused with its question's
+    BM25 candidates (no prefilter: the dense pass is already batched).
+    """
+    hybrid = lexical is not None and questions is not None and RETRIEVAL_MODE == "hybrid"
+    dense_k = DENSE_CANDIDATES if hybrid else k
+    time_windows = time_windows or [None] * len(user_names)
+    groups = {}
+    for i, (user_name, window) in enumerate(zip(user_names, time_windows)):
+        window = window if timeline is not None else None
+        member = partitions.rows_for(user_name) if partitions is not None else None
+        key = (
+            user_name.lower() if member is not None else None,
+            (window["start"], window["end"]) if window else None,
+        )
+        if key not in groups:
+            groups[key] = (scope_rows(partitions, user_name, timeline, window), [])
+        groups[key][1].append(i)
+
+    results = [None] * len(user_names)
+    for rows, members in groups.values():
+        queries = q_embs[members]
+        if rows is None:
+            ranked, _ = index.search_batch(queries, dense_k)
+        else:
+            top, _ = top_k_scores_batch(embeddings[rows], queries, dense_k)
+            ranked = rows[top]
+        for i, row_ids in zip(members, ranked):
+            if hybrid:
+                lex_rows, _ = lexical.search(questions[i], LEXICAL_CANDIDATES, rows)
+                row_ids = rrf_fuse([row_ids, lex_rows], k)
+            results[i] = np.asarray(row_ids, dtype=np.int64)
+    return results
+
+
+def retrieve_batch(q_embs, k, messages, embeddings, index, partitions, user_names,
+                   questions=None, lexical=None, time_windows=None, timeline=None):
+    """retrieve_batch_rows, returning the messages themselves."""
+    ranked = retrieve_batch_rows(
+        q_embs, k, embeddings, index, partitions, user_names, questions, lexical,
+        time_windows, timeline,
+    )
+    return [[messages[r] for r in rows] for rows in ranked]
+
+
+def retrieval_stats() -> dict:
+    queries = RETRIEVAL_STATS["queries"]
+    hybrid = RETRIEVAL_STATS["hybrid"]
+    return {
+        **RETRIEVAL_STATS,
+        "mode": RETRIEVAL_MODE,
+        "avg_lexical_ms": round(RETRIEVAL_STATS["lexical_ms_total"] / hybrid, 3) if hybrid else 0.0,
+        "avg_dense_ms": round(RETRIEVAL_STATS["dense_ms_total"] / queries, 3) if queries else 0.0,
+        "avg_fusion_ms": round(RETRIEVAL_STATS["fusion_ms_total"] / hybrid, 3) if hybrid else 0.0,
+    }
+
+
+def retrieve_relevant_messages(question, user_name, k, request=None):
+    snap = request.app.state.snapshot
+    return retrieve_for_user(
+        embed_question(question),
+        k,
+        snap.messages,
+        snap.embeddings,
+        snap.index,
+        snap.partitions,
+        user_name,
+        question=question,
+        lexical=snap.lexical,
+    )
@@ -0,0 +1,145 @@
+# app/sharded.py
+#
+# Multi-core exact search for very large corpora (MEMBER_QA_INDEX=sharded).
+#
+# The normalized embedding matrix is copied once into a POSIX shared
+# memory block and split into MEMBER_QA_SHARDS contiguous row ranges.
+# A process pool attaches to the block at start-up (no per-query copies);
+# each query is scored shard by shard in parallel, every shard returns
+# its own top-k, and the parent k-way merges those sorted lists.
+#
+# Results are the same rows and scores as ExactIndex: each row's score is
+# the same dot product, only computed in another process.
+
+import heapq
+import multiprocessing as mp
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from app.index import normalize_rows, top_k_scores, top_k_scores_batch
+
+SHARD_WORKERS = int(os.getenv("MEMBER_QA_SHARD_WORKERS", str(os.cpu_count() or 1)))
+SHARDS = int(os.getenv("MEMBER_QA_SHARDS", str(SHARD_WORKERS)))
+# spawn is safe next to the server's threads; fork starts faster
+SHARD_START_METHOD = os.getenv("MEMBER_QA_SHARD_START_METHOD", "spawn")
+
+
+# -----------------------------
+#   WORKER SIDE
+# -----------------------------
+_shm = None
+_matrix = None
+
+
+def _attach(name, shape, dtype):
+    global _shm, _matrix
+    # Workers share the parent's resource tracker, so attaching does not
+    # hand ownership to the worker; the parent unlinks the block.
+    _shm = shared_memory.SharedMemory(name=name)
+    _matrix = np.ndarray(shape, dtype=dtype, buffer=_shm.buf)
+
+
+def _search_shard(lo, hi, query, k):
+    top, scores = top_k_scores(_matrix[lo:hi], query, k)
+    return top + lo, scores
+
+
+def _search_shard_batch(lo, hi, queries, k):
+    top, scores = top_k_scores_batch(_matrix[lo:hi], queries, k)
+    return top + lo, scores
+
+
+def _ping(_=None):
+    return os.getpid()
+
+
+# -----------------------------
+#   PARENT SIDE
+# -----------------------------
+def merge_top_k(parts, k):
+    """
+    K-way merge of per-shard (rows, scores) lists, each sorted best
+    first, into the global top-k (ties broken by lower row id).
+    """
+    streams = [zip((-s for s in scores.tolist()), rows.tolist()) for rows, scores in parts]
+    merged = list(heapq.merge(*streams))[:k] if len(parts) > 1 else list(streams[0])[:k]
+    rows = np.fromiter((r for _, r in merged), dtype=np.int64, count=len(merged))
+    scores = np.fromiter((-s for s, _ in merged), dtype=np.float32, count=len(merged))
+    return rows, scores
+
+
+def _release(shm, pool):
+    pool.shutdown(wait=False, cancel_futures=True)
+    try:
+        shm.close()
+    except BufferError:  # a view is still alive in this process; unlink anyway
+        pass
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ShardedIndex:
+    kind = "sharded"
+
+    def __init__(self, embeddings, shards=SHARDS, workers=SHARD_WORKERS,
+                 start_method=SHARD_START_METHOD):
+        x = np.asarray(embeddings, dtype=np.float32)  # already normalized, as for ExactIndex
+        self.shards = max(1, min(shards, len(x) or 1))
+        self.workers = max(1, workers)
+        self.start_method = start_method
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(x.nbytes, 1))
+        # The shared copy doubles as the serving matrix (see app.main).
+        self.embeddings = np.ndarray(x.shape, dtype=x.dtype, buffer=self._shm.buf)
+        self.embeddings[:] = x
+
+        edges = np.linspace(0, len(self.embeddings), self.shards + 1).astype(np.int64)
+        self.bounds = [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:])]
+
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=mp.get_context(start_method),
+            initializer=_attach,
+            initargs=(self._shm.name, self.embeddings.shape, self.embeddings.dtype.str),
+        )
+        self._finalizer = weakref.finalize(self, _release, self._shm, self._pool)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def start(self):
+        """Start every worker now rather than on the first query."""
+        list(self._pool.map(_ping, range(self.workers)))
+        return self
+
+    def search(self, query: np.ndarray, k: int):
+        q = normalize_rows(query.reshape(-1))
+        futures = [self._pool.submit(_search_shard, lo, hi, q, k) for lo, hi in self.bounds]
+        return merge_top_k([f.result() for f in futures], k)
+
+    def search_batch(self, queries: np.ndarray, k: int):
+        q = normalize_rows(queries)
+        futures = [self._pool.submit(_search_shard_batch, lo, hi, q, k) for lo, hi in self.bounds]
+        parts = [f.result() for f in futures]
+
+        k = min(k, len(self))
+        top = np.empty((len(q), k), dtype=np.int64)
+        scores = np.empty((len(q), k), dtype=np.float32)
+        for i in range(len(q)):
+            top[i], scores[i] = merge_top_k([(rows[i], s[i]) for rows, s in parts], k)
+        return top, scores
+
+    def extended(self, embeddings):
+        # A fresh block and pool (each worker maps one block); this one is
+        # released once no snapshot uses it. The caller serves from the new
+        # block (see app.snapshot.extend_snapshot), not from `embeddings`.
+        return ShardedIndex(embeddings, self.shards, self.workers, self.start_method).start()
+
+    def close(self):
+        self._finalizer()
@@ -0,0 +1,294 @@
+# app/snapshot.py
+#
+# The served corpus as one immutable CorpusSnapshot on app.state.snapshot:
+# messages, embedding matrix, search indexes, gazetteer, partitions and
+# timestamp index that belong together. Request handlers read
+# app.state.snapshot once and use only that object, so a reload never
+# mixes two corpora mid-request.
+#
+# The refresher (MEMBER_QA_REFRESH_INTERVAL_S > 0) periodically pulls the
+# pages past the current corpus, embeds only the unseen messages, builds
+# the extended snapshot off to the side and swaps it in with a single
+# attribute assignment. In-flight requests finish on the old snapshot.
+#
+# Refreshed data lives in memory only; a restart serves the files in
+# data_cache/ again (and the refresher catches up from there). The one
+# exception is a memory-mapped matrix (MEMBER_QA_EMBEDDINGS_MMAP=1): the
+# extended matrix is written beside it as corpus_embeddings_f32.<version>.npy
+# and mapped again, so it stays shared page cache rather than becoming a
+# private copy per worker. Workers that reach the same version map the
+# same file.
+#
+# Each refresh costs time proportional to the whole corpus, not the delta:
+# the matrix is copied, BM25 is rebuilt over every text, and an HNSW index
+# rebuilds its graph (IVF only assigns the new rows to its lists).
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+
+from app.compute_embeddings import text_hash
+from app.data import PAGE_LIMIT, iter_all_pages, normalize_messages
+from app.gazetteer import Gazetteer
+from app.index import normalize_rows
+from app.lexical import BM25Index, message_texts
+from app.retrieval import UserPartitions
+from app.timeline import TimestampIndex, message_timestamps
+
+REFRESH_INTERVAL_S = float(os.getenv("MEMBER_QA_REFRESH_INTERVAL_S", "0"))  # 0 disables
+# Re-read this many already-known messages before the end of the corpus,
+# in case pages shifted since the last pull.
+REFRESH_OVERLAP = int(os.getenv("MEMBER_QA_REFRESH_OVERLAP", str(PAGE_LIMIT)))
+
+
+class ChainedMessages(Sequence):
+    """A base corpus (list or CorpusStore) followed by appended records."""
+
+    def __init__(self, base, extra):
+        self.base = base
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.base) + len(self.extra)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if i < len(self.base):
+            return self.base[i]
+        return self.extra[i - len(self.base)]
+
+    def texts(self):
+        return message_texts(self.base) + [m.get("text", "") for m in self.extra]
+
+    def timestamps(self):
+        return message_timestamps(self.base) + [m.get("timestamp") for m in self.extra]
+
+
+def append_messages(messages, new_records):
+    if isinstance(messages, ChainedMessages):
+        return ChainedMessages(messages.base, messages.extra + list(new_records))
+    return ChainedMessages(messages, list(new_records))
+
+
+class CorpusSnapshot:
+    __slots__ = (
+        "messages", "embeddings", "version", "index", "lexical",
+        "gazetteer", "partitions", "timeline", "created_at", "_ids",
+    )
+
+    def __init__(self, messages, embeddings, version, index, lexical,
+                 gazetteer=None, partitions=None, timeline=None):
+        self.messages = messages
+        self.embeddings = embeddings
+        self.version = version
+        self.index = index
+        self.lexical = lexical
+        self.gazetteer = gazetteer if gazetteer is not None else Gazetteer.from_messages(messages)
+        self.partitions = partitions if partitions is not None else UserPartitions(messages)
+        self.timeline = timeline if timeline is not None else TimestampIndex.from_messages(messages)
+        self.created_at = time.time()
+        self._ids = None
+
+    def __len__(self):
+        return len(self.messages)
+
+    def known_ids(self) -> set:
+        """Message ids in this snapshot (computed on first use, off the request path)."""
+        if self._ids is None:
+            self._ids = {m.get("message_id") for m in self.messages}
+        return self._ids
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "messages": len(self),
+            "index": getattr(self.index, "kind", None),
+            "created_at": self.created_at,
+        }
+
+
+def extended_version(version, new_records) -> str:
+    """Corpus version after appending `new_records` to the corpus `version`."""
+    h = hashlib.sha256(str(version).encode("utf-8"))
+    for m in new_records:
+        h.update(f"\n{m.get('message_id')}:{text_hash(m.get('text', ''))}".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+MAPPED_PREFIX = "corpus_embeddings_f32."
+MAPPED_RE = re.compile(re.escape(MAPPED_PREFIX) + r"[0-9a-f]{16}\.npy")
+
+
+def mapped_path(embeddings):
+    """The file a memory-mapped matrix is read from, else None."""
+    filename = getattr(embeddings, "filename", None)
+    return Path(filename) if isinstance(embeddings, np.memmap) and filename else None
+
+
+def append_mapped(embeddings: np.memmap, vectors, version) -> np.memmap:
+    """
+    `embeddings` followed by `vectors`, written straight to
+    corpus_embeddings_f32.<version>.npy beside the mapped file and mapped
+    read-only. An existing file (another worker got there first) is reused.
+    """
+    path = mapped_path(embeddings).with_name(f"{MAPPED_PREFIX}{version}.npy")
+    if not path.exists():
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        out = np.lib.format.open_memmap(
+            tmp, mode="w+", dtype=embeddings.dtype, shape=(len(embeddings) + len(vectors), embeddings.shape[1])
+        )
+        out[:len(embeddings)] = embeddings
+        out[len(embeddings):] = vectors
+        out.flush()
+        del out
+        os.replace(tmp, path)
+    return np.load(path, mmap_mode="r")
+
+
+def discard_mapped(embeddings):
+    """Remove a refresh's matrix file once superseded (the base file is kept)."""
+    path = mapped_path(embeddings)
+    if path is not None and MAPPED_RE.fullmatch(path.name):
+        path.unlink(missing_ok=True)  # open maps stay valid until dropped
+
+
+def extend_snapshot(snapshot: CorpusSnapshot, new_records, encode) -> CorpusSnapshot:
+    """
+    A new snapshot with `new_records` appended. Only the new texts are
+    encoded; the old matrix is copied, not modified, and every index is
+    rebuilt or extended as a new object. A memory-mapped matrix is copied
+    into a new mapped file (append_mapped). A sharded index copies the
+    matrix into its own shared block, which then becomes the snapshot's
+    matrix so the corpus is not held twice.
+    """
+    vectors = normalize_rows(np.asarray(encode([m.get("text", "") for m in new_records])))
+    vectors = vectors.astype(snapshot.embeddings.dtype)
+    version = extended_version(snapshot.version, new_records)
+    if mapped_path(snapshot.embeddings) is not None:
+        embeddings = append_mapped(snapshot.embeddings, vectors, version)
+    else:
+        embeddings = np.vstack([snapshot.embeddings, vectors])
+    messages = append_messages(snapshot.messages, new_records)
+
+    lexical = None
+    if snapshot.lexical is not None:
+        lexical = BM25Index.build(message_texts(messages))
+
+    index = snapshot.index.extended(embeddings)
+    if index.kind == "sharded":
+        embeddings = index.embeddings
+
+    new = CorpusSnapshot(
+        messages,
+        embeddings,
+        version,
+        index,
+        lexical,
+        timeline=snapshot.timeline.extended(new_records),
+    )
+    new._ids = snapshot.known_ids() | {m.get("message_id") for m in new_records}
+    return new
+
+
+# -----------------------------
+#   DELTA INGEST + REFRESHER
+# -----------------------------
+REFRESH_STATS = {
+    "runs": 0,
+    "swaps": 0,
+    "added": 0,
+    "errors": 0,
+    "last_added": 0,
+    "last_ms": 0.0,
+    "last_run_at": None,
+    "last_error": None,
+}
+_refresh_lock = threading.Lock()
+
+
+def fetch_new_messages(known_ids, start=0, stats=None, **page_kwargs) -> list[dict]:
+    """
+    Normalized records from offset `start` onward whose ids are not in
+    `known_ids`. Pages that failed after retries are listed in
+    `stats["failed_skips"]`.
+    """
+    seen, new = set(known_ids), []
+    for page in iter_all_pages(start=start, stats=stats, **page_kwargs):
+        for record in normalize_messages(page):
+            if record["message_id"] not in seen:
+                seen.add(record["message_id"])
+                new.append(record)
+    return new
+
+
+def refresh_once(state, encode, fetch=fetch_new_messages):
+    """
+    Pull, embed and swap in unseen messages. Returns the number added;
+    0 when nothing is new or another refresh is already running. A delta
+    with failed pages is not swapped in: the next refresh starts from the
+    current snapshot's length, so the messages on those pages would never
+    be fetched again.
+    """
+    if not _refresh_lock.acquire(blocking=False):
+        return 0
+    start = time.perf_counter()
+    try:
+        REFRESH_STATS["runs"] += 1
+        current = state.snapshot
+        fetch_stats = {}
+        new_records = fetch(
+            current.known_ids(), start=max(0, len(current) - REFRESH_OVERLAP), stats=fetch_stats
+        )
+        if fetch_stats.get("failed_skips"):
+            raise RuntimeError(
+                f"delta pages failed (skips {fetch_stats['failed_skips']}); keeping {current.version}"
+            )
+        if new_records:
+            state.snapshot = extend_snapshot(current, new_records, encode)
+            discard_mapped(current.embeddings)
+            REFRESH_STATS["swaps"] += 1
+            REFRESH_STATS["added"] += len(new_records)
+            print(f"[INFO] Corpus refreshed: +{len(new_records)} messages → {state.snapshot.version}")
+        REFRESH_STATS["last_added"] = len(new_records)
+        return len(new_records)
+    except Exception as e:
+        REFRESH_STATS["errors"] += 1
+        REFRESH_STATS["last_error"] = str(e)
+        print(f"[WARN] Corpus refresh failed: {e}")
+        return 0
+    finally:
+        REFRESH_STATS["last_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        REFRESH_STATS["last_run_at"] = time.time()
+        _refresh_lock.release()
+
+
+def start_refresher(state, encode, interval=REFRESH_INTERVAL_S, stop=None):
+    """Background thread calling refresh_once every `interval` s once the model is ready."""
+    stop = stop or threading.Event()
+
+    def run():
+        while not stop.wait(interval):
+            if getattr(state, "ready", False):
+                refresh_once(state, encode)
+
+    thread = threading.Thread(target=run, name="corpus-refresher", daemon=True)
+    thread.start()
+    return thread
+
+
+def refresh_stats(state=None) -> dict:
+    stats = {**REFRESH_STATS, "interval_s": REFRESH_INTERVAL_S}
+    snapshot = getattr(state, "snapshot", None)
+    if snapshot is not None:
+        stats["snapshot"] = snapshot.info()
+    return stats
@@ -0,0 +1,41 @@
+# app/startup.py
+#
+# Import-time and startup-phase timings, published at /debug/startup.
+# Imported first by app.main so offsets are measured from (roughly)
+# process start.
+
+import threading
+import time
+from contextlib import contextmanager
+
+T0 = time.perf_counter()
+
+PHASES = {}
+_lock = threading.Lock()
+
+
+@contextmanager
+def phase(name: str):
+    """Record start offset, duration and outcome of a named startup phase."""
+    start = time.perf_counter()
+    with _lock:
+        PHASES[name] = {"status": "running", "started_ms": round((start - T0) * 1000, 1)}
+    try:
+        yield
+    except Exception as e:
+        with _lock:
+            PHASES[name].update(status="error", error=str(e))
+        raise
+    finally:
+        with _lock:
+            PHASES[name]["ms"] = round((time.perf_counter() - start) * 1000, 1)
+            if PHASES[name]["status"] == "running":
+                PHASES[name]["status"] = "done"
+
+
+def startup_report() -> dict:
+    with _lock:
+        return {
+            "uptime_ms": round((time.perf_counter() - T0) * 1000, 1),
+            "phases": {name: dict(info) for name, info in PHASES.items()},
+        }
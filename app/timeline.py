@@ -0,0 +1,191 @@
+# app/timeline.py
+#
+# Time-window filtering. Every message carries an ISO `timestamp`; the
+# TimestampIndex parses them once at load time into epoch seconds and
+# keeps the row ids sorted by time, so the rows sent inside a window are
+# one searchsorted slice instead of a per-query parse of the corpus.
+#
+# time_window() reads the window from the question locally. Only
+# expressions about *when something was said* are used ("what did she
+# book last month", "messages from this week", "sent yesterday"): the
+# question must also say the member sent, asked or booked something.
+# Absolute dates ("orchestra seats for November 25") and relative ones
+# about the thing itself ("the last day of her trip", "a table for
+# today") are what the message is about, not when it was sent, and are
+# left to retrieval.
+#
+# Windows are {"start", "end", "label"} dicts: epoch seconds, half-open.
+
+import re
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.gazetteer import fold
+
+MISSING = np.iinfo(np.int64).min  # row without a usable timestamp
+
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+
+# "... of the trip" and "for today" / "for this week" name the thing
+# asked about, not the send time.
+NOT_OF = r"\b(?!\s+of\b)"
+NOT_FOR = r"(?<!\bfor\s)"
+ROLLING_RE = re.compile(
+    r"\b(?:last|past|previous)\s+(\d+|" + "|".join(NUMBER_WORDS) + r")\s+(day|week|month|year)s?" + NOT_OF
+)
+CALENDAR_RE = re.compile(r"\b(" + NOT_FOR + r"this|last|past|previous)\s+(day|week|month|year)" + NOT_OF)
+DAY_RE = re.compile(NOT_FOR + r"\b(today|yesterday)\b")
+# Words that make the question about what the member said or did.
+SENT_RE = re.compile(
+    r"\b(?:say|said|ask|asked|send|sent|book|booked|request|requested|requests"
+    r"|mention|mentioned|write|wrote|message|messages|messaged|tell|told"
+    r"|order|ordered|reserve|reserved|anything from)\b"
+)
+
+
+# -----------------------------
+#   PARSING
+# -----------------------------
+def parse_timestamp(value) -> int | None:
+    """ISO-8601 string → epoch seconds (naive times are taken as UTC); None if unusable."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _month_start(dt: datetime, delta: int = 0) -> datetime:
+    index = dt.year * 12 + dt.month - 1 + delta
+    return dt.replace(year=index // 12, month=index % 12 + 1, day=1,
+                      hour=0, minute=0, second=0, microsecond=0)
+
+
+def _calendar_window(unit: str, back: int, now: datetime):
+    """[start, end) of the calendar `unit` containing now, `back` units earlier."""
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "day":
+        start = midnight - timedelta(days=back)
+        return start, start + timedelta(days=1)
+    if unit == "week":
+        start = midnight - timedelta(days=midnight.weekday() + 7 * back)
+        return start, start + timedelta(days=7)
+    if unit == "month":
+        return _month_start(now, -back), _month_start(now, 1 - back)
+    start = _month_start(now, -(now.month - 1) - 12 * back)
+    return start, start.replace(year=start.year + 1)
+
+
+def _rolling_start(unit: str, n: int, now: datetime) -> datetime:
+    if unit == "day":
+        return now - timedelta(days=n)
+    if unit == "week":
+        return now - timedelta(weeks=n)
+    months = n * (12 if unit == "year" else 1)
+    start = _month_start(now, -months)
+    # same day of month, clamped (e.g. 31 March - 1 month → 28/29 February)
+    last_day = (_month_start(start, 1) - timedelta(days=1)).day
+    return now.replace(year=start.year, month=start.month, day=min(now.day, last_day))
+
+
+def _rolling_window(unit: str, n: int, now: datetime):
+    """
+    [start, end) of the last `n` units, in whole days: from the midnight
+    starting the day n units back to the midnight ending today. The bounds
+    then stay the same all day, so the window can key caches.
+    """
+    start = _rolling_start(unit, n, now).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return start, end
+
+
+def time_window(question: str, now: datetime | None = None) -> dict | None:
+    """
+    The window of send times a question is scoped to, or None. The
+    question must be about what was said (SENT_RE); the window is one of:
+
+      "last 3 months", "past two weeks"  rolling, in whole days up to today
+      "this month", "last week"          calendar (weeks start Monday)
+      "past week", "past year"           rolling, like "past 1 week"
+      "today", "yesterday"               calendar days (UTC)
+    """
+    now = now or datetime.now(timezone.utc)
+    text = fold(question)
+    if not SENT_RE.search(text):
+        return None
+
+    m = ROLLING_RE.search(text)
+    if m:
+        n = int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+        start, end = _rolling_window(m.group(2), n, now)
+        label = m.group(0)
+    elif (m := CALENDAR_RE.search(text)):
+        which, unit = m.groups()
+        if which == "past":
+            start, end = _rolling_window(unit, 1, now)
+        else:
+            start, end = _calendar_window(unit, 0 if which == "this" else 1, now)
+        label = m.group(0)
+    elif (m := DAY_RE.search(text)):
+        start, end = _calendar_window("day", 0 if m.group(1) == "today" else 1, now)
+        label = m.group(1)
+    else:
+        return None
+
+    return {"start": int(start.timestamp()), "end": int(end.timestamp()), "label": label}
+
+
+# -----------------------------
+#   INDEX
+# -----------------------------
+def message_timestamps(messages):
+    if hasattr(messages, "timestamps"):  # CorpusStore decodes the column in one pass
+        return messages.timestamps()
+    return [m.get("timestamp") for m in messages]
+
+
+def epoch_column(values) -> np.ndarray:
+    """Epoch seconds per row, MISSING where the timestamp is absent or unparseable."""
+    epochs = [parse_timestamp(v) for v in values]
+    return np.array([MISSING if e is None else e for e in epochs], dtype=np.int64)
+
+
+class TimestampIndex:
+    """Row ids sorted by send time; rows_between(start, end) is one slice."""
+
+    def __init__(self, epochs: np.ndarray):
+        self.epochs = epochs
+        dated = np.flatnonzero(epochs != MISSING)
+        self.order = dated[np.argsort(epochs[dated], kind="stable")]
+        self.sorted = epochs[self.order]
+
+    @classmethod
+    def from_messages(cls, messages):
+        return cls(epoch_column(message_timestamps(messages)))
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def span(self):
+        """(earliest, latest) epoch seconds, or None for an undated corpus."""
+        if not len(self.sorted):
+            return None
+        return int(self.sorted[0]), int(self.sorted[-1])
+
+    def rows_between(self, start: int, end: int) -> np.ndarray:
+        """Sorted row ids sent in [start, end)."""
+        lo, hi = np.searchsorted(self.sorted, [start, end], side="left")
+        return np.sort(self.order[lo:hi])
+
+    def extended(self, new_records):
+        """Index over the corpus plus `new_records`; only their timestamps are parsed."""
+        added = epoch_column(m.get("timestamp") for m in new_records)
+        return TimestampIndex(np.concatenate([self.epochs, added]))
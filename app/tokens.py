@@ -0,0 +1,64 @@
+# app/tokens.py
+#
+# Local token counting for prompt budgeting. Uses tiktoken (optional)
+# with the encoding of the answer model when it is installed and its BPE
+# file is available; otherwise a regex approximation that errs on the
+# high side (words split every 4 characters, punctuation counted alone).
+
+import math
+import re
+
+ENCODING_NAME = "o200k_base"  # gpt-4o / gpt-4o-mini
+
+PIECE_RE = re.compile(r"\w+|[^\w\s]")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def get_encoding():
+    """The tiktoken encoding, or None when tiktoken cannot be used."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(ENCODING_NAME)
+        except Exception as e:  # not installed, or no cached BPE file offline
+            print(f"[INFO] tiktoken unavailable ({e.__class__.__name__}); approximating token counts.")
+            _encoding = None
+    return _encoding
+
+
+def tokenizer_name() -> str:
+    return ENCODING_NAME if get_encoding() is not None else "approx"
+
+
+def _approx_pieces(text: str):
+    for m in PIECE_RE.finditer(text):
+        piece = m.group()
+        n = math.ceil(len(piece) / 4)
+        for i in range(n):
+            yield m.start() + 4 * i, min(m.start() + 4 * (i + 1), m.end())
+
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return sum(1 for _ in _approx_pieces(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """The longest prefix of `text` with at most `max_tokens` tokens."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is not None:
+        ids = encoding.encode(text)
+        return text if len(ids) <= max_tokens else encoding.decode(ids[:max_tokens])
+
+    for i, (_, end) in enumerate(_approx_pieces(text)):
+        if i + 1 == max_tokens:
+            return text[:end]
+    return text
@@ -0,0 +1,133 @@
+# app/warm_cache.py
+#
+# Pre-fill the LLM response cache (MEMBER_QA_LLM_CACHE_DB) from a question
+# log, so the first real askers of frequent questions do not pay for the
+# parse and answer calls. Each question runs the same parse → retrieval →
+# answer path as POST /ask against the current data_cache/ corpus, so the
+# cached prompts are exactly the ones the server will send.
+#
+#   python -m app.warm_cache questions.log --db data_cache/llm_responses.sqlite
+#   python -m app.warm_cache tests/qa_answers.csv --concurrency 8
+#
+# The log is one question per line, a CSV with a "question" column, or
+# JSON lines with a "question" field. Repeated questions are run once.
+
+import argparse
+import asyncio
+import csv
+import json
+import time
+from pathlib import Path
+
+import app.llm as llm
+from app.answer import generate_answer_async
+from app.data import load_corpus
+from app.embeddings import load_manifest, load_or_compute_embeddings
+from app.index import load_index
+from app.lexical import load_lexical_index
+from app.parsing import parse_question_with_fallback
+from app.retrieval import embed_question, retrieve_rows_for_user
+from app.snapshot import CorpusSnapshot
+
+
+def read_questions(path: Path) -> list[str]:
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix == ".csv":
+            raw = [row.get("question", "") for row in csv.DictReader(f)]
+        elif path.suffix in (".jsonl", ".ndjson"):
+            raw = [json.loads(line).get("question", "") for line in f if line.strip()]
+        else:
+            raw = f.read().splitlines()
+
+    questions, seen = [], set()
+    for q in raw:
+        q = (q or "").strip()
+        key = " ".join(q.split()).casefold()
+        if q and key not in seen:
+            seen.add(key)
+            questions.append(q)
+    return questions
+
+
+def load_snapshot() -> CorpusSnapshot:
+    """The corpus the server would load at startup (see app.main.lifespan)."""
+    messages = load_corpus()
+    embeddings = load_or_compute_embeddings(messages)
+    manifest = load_manifest()
+    corpus_version = manifest["corpus_version"] if manifest else None
+    index = load_index(embeddings, corpus_version)
+    if index.kind == "sharded":
+        embeddings = index.embeddings
+    lexical = load_lexical_index(messages, corpus_version)
+    return CorpusSnapshot(messages, embeddings, corpus_version, index, lexical)
+
+
+async def warm_one(snap, question, k):
+    """Run /ask's LLM calls for `question`. Returns "llm" or "extractive"."""
+    parsed = await parse_question_with_fallback(question, snap.gazetteer)
+    q_emb = await asyncio.to_thread(embed_question, question)
+    rows = retrieve_rows_for_user(
+        q_emb, k, snap.embeddings, snap.index, snap.partitions, parsed.get("user_name"),
+        question, snap.lexical, None, parsed.get("time_window"), snap.timeline,
+    )
+    vectors, report = snap.embeddings[rows], {}
+    await generate_answer_async(
+        question, parsed, [snap.messages[i] for i in rows], vectors, report,
+        scores=vectors @ q_emb, corpus_version=snap.version,
+    )
+    return report.get("extractive", {}).get("source", "llm")
+
+
+async def warm(snap, questions, k, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    outcomes = {"llm": 0, "extractive": 0, "failed": 0}
+
+    async def run(question):
+        async with slots:
+            try:
+                outcomes[await warm_one(snap, question, k)] += 1
+            except Exception as e:
+                outcomes["failed"] += 1
+                print(f"[WARN] {question!r}: {e}")
+
+    await asyncio.gather(*(run(q) for q in questions))
+    return outcomes
+
+
+def main(argv=None):
+    from app.main import RETRIEVAL_K
+
+    parser = argparse.ArgumentParser(description="Pre-fill the LLM response cache from a question log.")
+    parser.add_argument("log", type=Path, help="questions: .txt (one per line), .csv or .jsonl")
+    parser.add_argument("--db", default=llm.LLM_CACHE_DB,
+                        help="cache file (default: MEMBER_QA_LLM_CACHE_DB)")
+    parser.add_argument("--k", type=int, default=RETRIEVAL_K)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    if not args.db:
+        parser.error("no cache file: pass --db or set MEMBER_QA_LLM_CACHE_DB")
+    llm.LLM_CACHE_DB = args.db
+
+    questions = read_questions(args.log)
+    print(f"[INFO] {len(questions)} distinct questions from {args.log}")
+
+    snap = load_snapshot()
+    dropped = llm.purge_response_cache(snap.version)
+    if dropped:
+        print(f"[INFO] Dropped {dropped} answers of older corpus versions.")
+
+    start = time.perf_counter()
+    before = llm.get_response_cache().stats()
+    outcomes = asyncio.run(warm(snap, questions, args.k, args.concurrency))
+    after = llm.get_response_cache().stats()
+
+    print(f"[INFO] Warmed in {time.perf_counter() - start:.1f}s: {outcomes['llm']} via LLM, "
+          f"{outcomes['extractive']} extractive (nothing to cache), {outcomes['failed']} failed")
+    print(f"[INFO] Cache {args.db}: {before['entries']} → {after['entries']} entries, "
+          f"{after['bytes']:,} bytes (limit {after['max_bytes']:,}), "
+          f"{after['hits'] - before['hits']} already cached")
+
+
+if __name__ == "__main__":
+    main()
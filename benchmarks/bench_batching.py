@@ -0,0 +1,76 @@
+# benchmarks/bench_batching.py
+#
+# Throughput vs p99 latency of query embedding under concurrent load,
+# with and without the micro-batcher in app/batching.py.
+#
+#   python -m benchmarks.bench_batching
+#   python -m benchmarks.bench_batching --clients 32 --requests 20 --waits 0 2 5 10
+#
+# Every request uses a unique question so the query cache never hits.
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from app.batching import EmbeddingBatcher
+from app.compute_embeddings import MODEL_NAME
+
+
+def run_load(embed_one, clients, requests_per_client):
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(clients)
+
+    def client(cid):
+        barrier.wait()
+        for r in range(requests_per_client):
+            start = time.perf_counter()
+            embed_one(f"client {cid} asks question number {r} about Layla's trip")
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    lat_ms = np.array(latencies) * 1000
+    return len(latencies) / elapsed, np.percentile(lat_ms, 50), np.percentile(lat_ms, 99)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--waits", type=float, nargs="+", default=[0, 2, 5, 10],
+                        help="max wait in ms (0 = no batching)")
+    parser.add_argument("--max-batch", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    model = SentenceTransformer(MODEL_NAME)
+
+    def encode(texts):
+        return model.encode(texts, convert_to_numpy=True)
+
+    encode(["warm-up"])
+    print(f"{'max_wait_ms':>11} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+    for wait in args.waits:
+        if wait <= 0:
+            embed_one, batcher = (lambda text: encode([text])[0]), None
+        else:
+            batcher = EmbeddingBatcher(encode, args.max_batch, wait)
+            embed_one = lambda text, b=batcher: b.submit(text).result()
+
+        rps, p50, p99 = run_load(embed_one, args.clients, args.requests)
+        avg_batch = batcher.stats()["avg_batch_size"] if batcher else 1.0
+        print(f"{wait:>11.1f} {rps:>8.1f} {p50:>8.1f} {p99:>8.1f} {avg_batch:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
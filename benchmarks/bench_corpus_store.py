@@ -0,0 +1,80 @@
+# benchmarks/bench_corpus_store.py
+#
+# Load time and resident memory of the JSON corpus vs the binary store,
+# on a synthetic corpus shaped like the real one (UUIDs, ~10 members,
+# short texts, ISO timestamps). Both paths include building the member
+# partitions, the other per-message startup step. Memory is what stays
+# allocated (tracemalloc) once loading is done.
+#
+#   python -m benchmarks.bench_corpus_store                 # 10k, 100k, 1M messages
+#   python -m benchmarks.bench_corpus_store --rows 50000
+
+import argparse
+import json
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from app.corpus_store import open_store, write_store
+from app.retrieval import UserPartitions
+
+
+def synthetic_messages(n, members=10, seed=0):
+    users = [(str(uuid.UUID(int=seed * 1000 + u)), f"Member {u}") for u in range(members)]
+    return [
+        {
+            "message_id": str(uuid.UUID(int=(seed + 1) << 64 | i)),
+            "user_id": users[i % members][0],
+            "user_name": users[i % members][1],
+            "text": f"Please book a table for {i % 7 + 2} at restaurant number {i} this Friday.",
+            "timestamp": f"2025-05-{i % 28 + 1:02d}T07:47:20.159073+00:00",
+        }
+        for i in range(n)
+    ]
+
+
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    corpus = load()
+    partitions = UserPartitions(corpus)
+    elapsed = (time.perf_counter() - start) * 1000
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return corpus, partitions, elapsed, current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args(argv)
+
+    print(f"{'rows':>10} {'json ms':>9} {'store ms':>9} {'json B/msg':>11} {'store B/msg':>12} "
+          f"{'json file':>11} {'store file':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            messages = synthetic_messages(n)
+            json_path, store_path = Path(tmp) / "corpus.json", Path(tmp) / "corpus.bin"
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(messages, f, indent=2)
+            write_store(messages, store_path)
+            del messages
+
+            def load_json():
+                with open(json_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+
+            corpus, _, json_ms, json_mem = measure(load_json)
+            del corpus
+            corpus, _, store_ms, store_mem = measure(lambda: open_store(store_path))
+            assert corpus[n - 1]["text"].endswith(f"number {n - 1} this Friday.")
+            del corpus
+
+            print(f"{n:>10} {json_ms:>9.1f} {store_ms:>9.1f} {json_mem / n:>11.0f} {store_mem / n:>12.1f} "
+                  f"{json_path.stat().st_size:>11,} {store_path.stat().st_size:>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/bench_extractive.py
+#
+# How often the extractive fast path (app.extractive) answers the
+# questions in tests/qa_answers.csv without the answer LLM, how often
+# those answers match the expected ones, and the latency it saves.
+#
+#   python -m benchmarks.bench_extractive                 # LLM latency assumed (--llm-ms)
+#   python -m benchmarks.bench_extractive --llm           # time the real answer LLM too
+#   python -m benchmarks.bench_extractive --min-score 0.4 --min-confidence 0.5
+#
+# Runs the real local pipeline (gazetteer parse, encoder, hybrid
+# retrieval) over data_cache/. --llm needs OPENAI_API_KEY.
+
+import argparse
+import asyncio
+import csv
+import time
+
+import numpy as np
+
+from app.answer import generate_answer_async
+from app.data import load_corpus
+from app.embeddings import load_manifest, load_or_compute_embeddings
+from app.extractive import EXTRACT_MIN_CONFIDENCE, EXTRACT_MIN_SCORE, extract_answer
+from app.gazetteer import Gazetteer, parse_locally
+from app.index import ExactIndex
+from app.lexical import load_lexical_index
+from app.retrieval import UserPartitions, embed_question, retrieve_rows_for_user
+
+QA_PATH = "tests/qa_answers.csv"
+
+
+def load_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(r["question"], r["expected"].strip()) for r in csv.DictReader(f)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--qa", default=QA_PATH)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--min-score", type=float, default=EXTRACT_MIN_SCORE)
+    parser.add_argument("--min-confidence", type=float, default=EXTRACT_MIN_CONFIDENCE)
+    parser.add_argument("--llm", action="store_true", help="measure the answer LLM per question")
+    parser.add_argument("--llm-ms", type=float, default=800.0,
+                        help="assumed answer-LLM latency when --llm is not given")
+    args = parser.parse_args(argv)
+
+    messages = load_corpus()
+    embeddings = load_or_compute_embeddings(messages)
+    manifest = load_manifest()
+    index = ExactIndex(embeddings)
+    lexical = load_lexical_index(messages, manifest["corpus_version"] if manifest else None)
+    gazetteer, partitions = Gazetteer.from_messages(messages), UserPartitions(messages)
+
+    results = []
+    for question, expected in load_rows(args.qa):
+        parsed, _ = parse_locally(question, gazetteer)
+        q_emb = embed_question(question)
+        rows = retrieve_rows_for_user(
+            q_emb, args.k, embeddings, index, partitions, parsed["user_name"], question, lexical
+        )
+        retrieved = [messages[i] for i in rows]
+        scores = embeddings[rows] @ q_emb
+
+        text, details = extract_answer(
+            question, parsed, retrieved, scores, args.min_score, args.min_confidence
+        )
+        llm_ms = args.llm_ms
+        if args.llm:
+            start = time.perf_counter()
+            asyncio.run(generate_answer_async(question, parsed, retrieved, embeddings[rows]))
+            llm_ms = (time.perf_counter() - start) * 1000
+
+        correct = text is not None and expected.casefold() in text.casefold()
+        results.append((question, text, details, correct, llm_ms))
+
+    print(f"{'source':<15} {'ok':<3} {'extract ms':>10}  question → answer")
+    for question, text, details, correct, _ in results:
+        source = details["source"] if text else details["reason"]
+        print(f"{source:<15} {'✓' if correct else ('✗' if text else '-'):<3} "
+              f"{details['extract_ms']:>10.3f}  {question} → {text or ''}")
+
+    bypassed = [r for r in results if r[1] is not None]
+    extract_ms = np.array([r[2]["extract_ms"] for r in results])
+    saved = sum(r[4] - r[2]["extract_ms"] for r in bypassed)
+    n = len(results)
+    print(f"\nbypass rate: {len(bypassed)}/{n} ({len(bypassed) / n:.0%}); "
+          f"correct when bypassed: {sum(r[3] for r in bypassed)}/{len(bypassed)}")
+    print(f"extractor: mean {extract_ms.mean():.3f} ms, max {extract_ms.max():.3f} ms")
+    print(f"answer latency saved: {saved:.0f} ms total, {saved / n:.0f} ms per question "
+          f"({'measured' if args.llm else f'assuming {args.llm_ms:.0f} ms per LLM answer'})")
+
+
+if __name__ == "__main__":
+    main()
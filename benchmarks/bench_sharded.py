@@ -0,0 +1,82 @@
+# benchmarks/bench_sharded.py
+#
+# Scaling of sharded multi-process exact search (app.sharded) against the
+# single-process ExactIndex, for 1/2/4/8 worker processes (one shard per
+# worker). Every configuration is checked to return exactly the same rows
+# and scores as the single-process path.
+#
+#   python -m benchmarks.bench_sharded                        # 1M x 768
+#   python -m benchmarks.bench_sharded --rows 200000 --dim 384 --workers 1 2 4
+#
+# 1M x 768 float32 is ~3 GB, held twice (private + shared copy); budget
+# ~6.5 GB. Speedup is bounded by physical cores and memory bandwidth.
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.index import ExactIndex, normalize_rows
+from app.sharded import ShardedIndex
+
+
+def time_it(fn, repeats):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    matrix = normalize_rows(rng.standard_normal((args.rows, args.dim), dtype=np.float32))
+    queries = normalize_rows(rng.standard_normal((args.queries, args.dim), dtype=np.float32))
+
+    exact = ExactIndex(matrix)
+    truth = [exact.search(q, args.k) for q in queries]
+    batch_truth = exact.search_batch(queries, args.k)
+    base_ms = time_it(lambda: exact.search(queries[0], args.k), args.repeats)
+    base_batch_ms = time_it(lambda: exact.search_batch(queries, args.k), args.repeats)
+
+    print(f"{args.rows} x {args.dim}, k={args.k}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'query ms':>9} {'speedup':>8} {'batch ms':>9} {'speedup':>8}  exact")
+    print(f"{'single':>8} {base_ms:>9.2f} {1:>7.1f}x {base_batch_ms:>9.2f} {1:>7.1f}x  -")
+
+    for workers in args.workers:
+        index = ShardedIndex(matrix, shards=workers, workers=workers).start()
+        try:
+            same = all(
+                np.array_equal(index.search(q, args.k)[0], rows)
+                and np.array_equal(index.search(q, args.k)[1], scores)
+                for q, (rows, scores) in zip(queries, truth)
+            )
+            batch_rows, batch_scores = index.search_batch(queries, args.k)
+            # Batches are compared with the batched path: a matrix product
+            # may round differently from the per-query matrix-vector product.
+            same = same and np.array_equal(batch_rows, batch_truth[0]) \
+                and np.array_equal(batch_scores, batch_truth[1])
+
+            query_ms = time_it(lambda: index.search(queries[0], args.k), args.repeats)
+            batch_ms = time_it(lambda: index.search_batch(queries, args.k), args.repeats)
+        finally:
+            index.close()
+
+        print(f"{workers:>8} {query_ms:>9.2f} {base_ms / query_ms:>7.1f}x "
+              f"{batch_ms:>9.2f} {base_batch_ms / batch_ms:>7.1f}x  {same}")
+
+
+if __name__ == "__main__":
+    main()
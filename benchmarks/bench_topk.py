@@ -0,0 +1,70 @@
+# benchmarks/bench_topk.py
+#
+# Compare the old per-request scoring path (sklearn cosine_similarity on the
+# raw matrix + full argsort) with the pre-normalized float32 kernel
+# (one matrix–vector product + argpartition top-k).
+#
+#   python -m benchmarks.bench_topk                      # 10k, 100k, 1M rows
+#   python -m benchmarks.bench_topk --rows 10000 50000 --dim 384
+#
+# The baseline needs scikit-learn, which the service no longer depends on
+# (pip install scikit-learn).
+#
+# 1M x 768 float32 is ~3 GB per copy; the baseline needs the raw matrix
+# and the kernel needs the normalized one, so budget ~6 GB for that row.
+
+import argparse
+import time
+
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+
+from app.index import normalize_rows, top_k_scores
+
+
+def baseline(matrix, query, k):
+    sims = cosine_similarity(query.reshape(1, -1), matrix)[0]
+    top = sims.argsort()[::-1][:k]
+    return top, sims[top]
+
+
+def kernel(matrix, query, k):
+    return top_k_scores(matrix, normalize_rows(query), k)
+
+
+def time_it(fn, repeats):
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples)) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>10} {'baseline ms':>12} {'kernel ms':>10} {'speedup':>8}  same top-k")
+    for n in args.rows:
+        raw = rng.standard_normal((n, args.dim), dtype=np.float32)
+        prepared = normalize_rows(raw)
+        query = rng.standard_normal(args.dim, dtype=np.float32)
+
+        same = np.array_equal(baseline(raw, query, args.k)[0], kernel(prepared, query, args.k)[0])
+        repeats = max(3, args.repeats // max(1, n // 100_000))
+        base_ms = time_it(lambda: baseline(raw, query, args.k), repeats)
+        kern_ms = time_it(lambda: kernel(prepared, query, args.k), repeats)
+
+        print(f"{n:>10} {base_ms:>12.2f} {kern_ms:>10.2f} {base_ms / kern_ms:>7.1f}x  {same}")
+        del raw, prepared
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,7 @@ import pytest
 def get_loaded_state():
     with TestClient(app):  # triggers startup_event
         pass
-    return app.state.corpus_messages, app.state.corpus_embeddings
+    return app.state.snapshot.messages, app.state.snapshot.embeddings
 
 corpus_messages, corpus_embeddings = get_loaded_state()
 
@@ -39,17 +39,15 @@ qa_rows = load_qa_csv()
 # Helper: Print retrieval debug info
 # -------------------------------
 def debug_retrieval(question, k=5):
-    from sklearn.metrics.pairwise import cosine_similarity
+    from app.index import normalize_rows, top_k_scores
 
-    q_emb = emb.embed_texts(question)  # shape (1, dim)
-    sims = cosine_similarity(q_emb, corpus_embeddings)[0]
-
-    top_idx = sims.argsort()[::-1][:k]
+    q_emb = normalize_rows(emb.embed_texts(question))[0]  # shape (dim,)
+    top_idx, scores = top_k_scores(corpus_embeddings, q_emb, k)
 
     print("\n🔎 TOP RETRIEVED MESSAGES:")
-    for rank, idx in enumerate(top_idx, start=1):
+    for rank, (idx, score) in enumerate(zip(top_idx, scores), start=1):
         m = corpus_messages[idx]
-        print(f"\n  #{rank}  (score={sims[idx]:.4f})")
+        print(f"\n  #{rank}  (score={score:.4f})")
         print(f"    ID:   {m['message_id']}")
         print(f"    User: {m['user_name']}")
         print(f"    Text: {m['text']}")
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import app.answer as answer
+import app.embeddings as emb
+import app.llm as llm
+import app.main as main
+from app.cache import SemanticCache, TTLCache
+from app.index import ExactIndex, normalize_rows, top_k_scores, top_k_scores_batch
+from app.lexical import BM25Index
+from app.retrieval import UserPartitions, retrieve_for_user
+from app.snapshot import CorpusSnapshot, refresh_once
+
+
+MESSAGES = [
+    {"message_id": "1", "user_name": "Layla Kawaguchi", "text": "Book orchestra seats for November 25."},
+    {"message_id": "2", "user_name": "Hans Müller", "text": "Book a table at Le Bernardin."},
+    {"message_id": "3", "user_name": "Layla Kawaguchi", "text": "I need a car in London."},
+]
+VECTORS = normalize_rows(np.eye(3, 4) + 0.1)
+
+
+class FakeModel:
+    def __init__(self):
+        self.started = threading.Event()
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.started.set()
+        self.calls.append(list(texts))
+        return np.tile(VECTORS[0], (len(texts), 1))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    fake = FakeModel()
+    monkeypatch.setattr(emb, "model", fake)
+    monkeypatch.setattr(emb, "query_cache", TTLCache(maxsize=10))
+    monkeypatch.setattr(main, "answer_cache", SemanticCache(maxsize=10))
+
+    async def parse_after_search_started(question, gazetteer):
+        # Only completes if embedding started while the parse was in flight.
+        for _ in range(200):
+            if fake.started.is_set():
+                return {"user_name": "Layla", "intent": None, "entities": [], "raw": question}
+            await asyncio.sleep(0.01)
+        raise AssertionError("embedding did not overlap with the parse call")
+
+    async def fake_answer(question, parsed, retrieved_messages, vectors=None, report=None,
+                          scores=None, corpus_version=None):
+        fake_answer.calls += 1
+        return {"answer": " | ".join(m["text"] for m in retrieved_messages)}
+
+    monkeypatch.setattr(main, "parse_question_with_fallback", parse_after_search_started)
+    fake_answer.calls = 0
+    monkeypatch.setattr(main, "generate_answer_async", fake_answer)
+
+    main.app.state.snapshot = CorpusSnapshot(
+        MESSAGES, VECTORS, "v1", ExactIndex(VECTORS),
+        BM25Index.build([m["text"] for m in MESSAGES]),
+    )
+    return TestClient(main.app)
+
+
+def test_ask_overlaps_parse_and_embedding(client):
+    response = client.post("/ask", json={"question": "When are Layla's orchestra seats?"})
+
+    assert response.status_code == 200
+    answer = response.json()["answer"]
+    assert "orchestra seats" in answer
+    assert "Le Bernardin" not in answer  # only Layla's rows were scored
+
+
+def test_near_duplicate_question_hits_answer_cache(client):
+    first = client.post("/ask", json={"question": "When are Layla's orchestra seats?"})
+    second = client.post("/ask", json={"question": "when are layla's orchestra seats"})
+
+    assert second.json() == first.json()
+    assert main.generate_answer_async.calls == 1
+    assert main.answer_cache.stats()["hits"] == 1
+
+
+def test_ask_rejects_empty_question(client):
+    assert client.post("/ask", json={"question": "   "}).status_code == 400
+
+
+def test_partitions_score_only_the_members_rows():
+    partitions = UserPartitions(MESSAGES)
+    q = VECTORS[1]  # closest to Hans's message
+
+    layla = retrieve_for_user(q, 5, MESSAGES, VECTORS, ExactIndex(VECTORS), partitions, "Layla")
+    everyone = retrieve_for_user(q, 5, MESSAGES, VECTORS, ExactIndex(VECTORS), partitions, None)
+    stranger = retrieve_for_user(q, 1, MESSAGES, VECTORS, ExactIndex(VECTORS), partitions, "Nobody")
+
+    assert [m["message_id"] for m in layla] in (["1", "3"], ["3", "1"])
+    assert everyone[0]["message_id"] == "2"
+    assert stranger[0]["message_id"] == "2"
+
+
+def test_ready_only_after_warm_up(client):
+    main.app.state.ready = False
+    assert client.get("/ready").status_code == 503
+
+    main.warm_up(main.app.state)
+
+    response = client.get("/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["phases"]["warmup"]["status"] == "done"
+
+
+def test_batch_answers_in_order_with_per_question_errors(client, monkeypatch):
+    async def parse(question, gazetteer):
+        name = "Hans" if "Hans" in question else "Layla"
+        return {"user_name": name, "intent": None, "entities": [], "raw": question}
+
+    async def answer(question, parsed, retrieved_messages, vectors=None, scores=None,
+                     corpus_version=None):
+        # same inputs as /ask: the extractive path and dedup see them too
+        assert len(scores) == len(vectors) == len(retrieved_messages)
+        if "boom" in question:
+            raise RuntimeError("upstream timeout")
+        return {"answer": retrieved_messages[0]["text"]}
+
+    monkeypatch.setattr(main, "parse_question_with_fallback", parse)
+    monkeypatch.setattr(main, "generate_answer_async", answer)
+
+    response = client.post("/ask/batch", json={"questions": [
+        "Where does Hans eat?", "  ", "Layla boom", "Where are Layla's seats?",
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert results[0] == {"answer": "Book a table at Le Bernardin."}
+    assert results[1] == {"error": "Question cannot be empty."}
+    assert "upstream timeout" in results[2]["error"]
+    assert results[3] == {"answer": "Book orchestra seats for November 25."}
+    assert emb.model.calls == [["Where does Hans eat?", "Layla boom", "Where are Layla's seats?"]]
+
+
+def test_ask_fails_fast_with_not_found_when_llm_unavailable(client, monkeypatch):
+    async def breaker_open(question, parsed, retrieved_messages, vectors=None, report=None,
+                           scores=None, corpus_version=None):
+        raise llm.CircuitOpenError("LLM circuit breaker is open")
+
+    monkeypatch.setattr(main, "generate_answer_async", breaker_open)
+
+    response = client.post("/ask", json={"question": "When are Layla's orchestra seats?"})
+
+    assert response.json() == {"answer": main.NOT_FOUND_ANSWER}
+    assert main.answer_cache.stats()["size"] == 0  # degraded answers are not cached
+
+def test_in_flight_request_keeps_its_snapshot_across_a_swap(client, monkeypatch):
+    old = main.app.state.snapshot
+    tokyo = {"message_id": "4", "user_id": "u1", "user_name": "Layla Kawaguchi",
+             "text": "Layla flies to Tokyo on May 2.", "timestamp": None}
+
+    async def answer_during_reload(question, parsed, retrieved_messages, vectors=None, report=None,
+                                   scores=None, corpus_version=None):
+        refresh_once(main.app.state, emb.encode_batch, lambda known, start, stats: [tokyo])
+        assert main.app.state.snapshot is not old
+        return {"answer": " | ".join(m["text"] for m in retrieved_messages)}
+
+    monkeypatch.setattr(main, "generate_answer_async", answer_during_reload)
+    first = client.post("/ask", json={"question": "Where is Layla flying?"}).json()["answer"]
+    assert "Tokyo" not in first  # retrieved from the snapshot the request started with
+
+    async def answer(question, parsed, retrieved_messages, vectors=None, report=None,
+                     scores=None, corpus_version=None):
+        return {"answer": " | ".join(m["text"] for m in retrieved_messages)}
+
+    monkeypatch.setattr(main, "generate_answer_async", answer)
+    second = client.post("/ask", json={"question": "Where is Layla flying?"}).json()["answer"]
+    assert "Tokyo" in second  # new corpus version, so not served from the answer cache
+
+
+def test_batch_kernel_matches_single_query_kernel():
+    rng = np.random.default_rng(0)
+    matrix = normalize_rows(rng.normal(size=(500, 8)))
+    queries = normalize_rows(rng.normal(size=(7, 8)))
+
+    top, scores = top_k_scores_batch(matrix, queries, 5, max_cells=1000)
+
+    for q, row_top, row_scores in zip(queries, top, scores):
+        single_top, single_scores = top_k_scores(matrix, q, 5)
+        np.testing.assert_array_equal(row_top, single_top)
+        np.testing.assert_allclose(row_scores, single_scores, rtol=1e-6)
+
+
+class FakeCompletions(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions that streams fixed chunks."""
+    chunks = ["November", " 25", "."]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert body["stream"] is True
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for text in self.chunks:
+            chunk = {
+                "id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def completion_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeCompletions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm, "_async_client", None)
+    yield server
+    server.shutdown()
+
+
+def read_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_stream_sends_retrieval_then_tokens_then_done(client, completion_server, monkeypatch):
+    monkeypatch.setattr(answer, "EXTRACTIVE", False)
+    response = client.post("/ask/stream", json={"question": "When are Layla's orchestra seats?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = read_events(response)
+
+    assert events[0][0] == "retrieval"
+    assert {m["user_name"] for m in events[0][1]["messages"]} == {"Layla Kawaguchi"}
+    assert [data["text"] for name, data in events[1:-1]] == ["November", " 25", "."]
+    assert all(name == "token" for name, _ in events[1:-1])
+    assert events[-1] == ("done", {"answer": "November 25."})
+
+    # /ask keeps its {"answer": ...} contract and is served from the same cache
+    assert client.post("/ask", json={"question": "When are Layla's orchestra seats?"}).json() == {
+        "answer": "November 25."
+    }
+
+
+def test_stream_answers_typed_questions_without_the_llm(client, monkeypatch):
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("answer LLM should be bypassed")
+        yield
+
+    monkeypatch.setattr(answer, "stream_chat_async", no_llm)
+    response = client.post("/ask/stream", json={"question": "For what date are Layla's orchestra seats?"})
+    events = read_events(response)
+
+    assert [name for name, _ in events] == ["retrieval", "token", "done"]
+    assert events[-1] == ("done", {"answer": "November 25"})
+    assert main.DEBUG_LAST["context"]["extractive"]["source"] == "extractive"
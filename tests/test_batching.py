@@ -0,0 +1,68 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+import app.embeddings as emb
+from app.batching import EmbeddingBatcher
+from app.cache import TTLCache
+from app.retrieval import embed_question_async
+
+
+class RecordingEncoder:
+    def __init__(self):
+        self.batch_sizes = []
+
+    def __call__(self, texts):
+        self.batch_sizes.append(len(texts))
+        return np.array([[float(t.split()[-1]), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_concurrent_queries_share_one_encode_call():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, max_batch=64, max_wait_ms=200)
+    results = {}
+    start = threading.Barrier(16)
+
+    def ask(i):
+        start.wait()
+        results[i] = batcher.submit(f"question {i}").result(timeout=5)
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sum(encoder.batch_sizes) == 16
+    assert len(encoder.batch_sizes) < 16
+    assert all(results[i][0] == i for i in range(16))  # each caller gets its own row
+
+
+def test_max_batch_size_is_respected_and_errors_propagate():
+    encoder = RecordingEncoder()
+    batcher = EmbeddingBatcher(encoder, max_batch=4, max_wait_ms=100)
+
+    rows = batcher.encode_many([f"q {i}" for i in range(10)])
+    assert [r[0] for r in rows] == list(range(10))
+    assert max(encoder.batch_sizes) <= 4
+
+    with pytest.raises(ValueError):
+        batcher.submit("not a number").result(timeout=5)
+
+
+def test_event_loop_callers_fill_batches_beyond_the_executor_size(monkeypatch):
+    encoder = RecordingEncoder()
+    monkeypatch.setattr(emb, "batcher", EmbeddingBatcher(encoder, max_batch=32, max_wait_ms=100))
+    monkeypatch.setattr(emb, "query_cache", TTLCache(maxsize=100))
+    monkeypatch.setattr(emb, "query_disk_cache", None)
+
+    async def ask_all():
+        return await asyncio.gather(*(embed_question_async(f"question {i}") for i in range(24)))
+
+    rows = asyncio.run(ask_all())
+    # no executor thread is held per query, so one batch takes them all
+    assert encoder.batch_sizes == [24]
+    assert [round(float(r[0] / r[1])) for r in rows] == list(range(24))
+    assert emb.query_cache.get(emb.query_cache_key("question 3")) is not None
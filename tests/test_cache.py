@@ -0,0 +1,139 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from app.cache import ResponseCache, TTLCache, SqliteCache, SemanticCache
+from app.index import normalize_rows
+
+
+def test_ttl_cache_lru_eviction_and_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1          # a is now most recent
+    cache.set("c", 3)                   # evicts b
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+    now[0] += 11
+    assert cache.get("a") is None       # expired
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    SqliteCache(path).set("k", b"value")
+
+    reopened = SqliteCache(path)
+    assert reopened.get("k") == b"value"
+    assert reopened.get("missing") is None
+
+
+def test_response_cache_is_shared_evicts_lru_by_size_and_purges_versions(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.time", lambda: now[0])
+    path = tmp_path / "llm.sqlite"
+    writer = ResponseCache(path, max_bytes=100)
+    reader = ResponseCache(path, max_bytes=100, touch_after=0)  # write every hit's use time
+
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        writer.set(key, "x" * 29, version="v1")    # 30 bytes each
+    now[0] += 1
+    assert reader.get("a") == "x" * 29             # another connection sees it; a is now recent
+    now[0] += 1
+    writer.set("d", "y" * 29)                      # 120 bytes > 100: keep recent ones within 90
+    assert writer.evictions == 1
+    assert reader.get("b") is None and reader.get("a") is not None
+    assert writer.stats()["bytes"] <= 90
+
+    assert writer.purge_versions("v2") == 2        # a and c; unversioned entries stay
+    assert reader.get("d") == "y" * 29 and reader.get("c") is None
+    assert writer.stats()["bytes"] == 30
+
+
+def test_response_cache_hits_do_not_wait_for_the_write_lock(tmp_path):
+    path = tmp_path / "llm.sqlite"
+    cache = ResponseCache(path, max_bytes=1000, timeout=0.2)
+    cache.set("a", "cached answer")
+
+    busy = sqlite3.connect(str(path))
+    busy.execute("BEGIN IMMEDIATE")  # another worker mid-write
+    try:
+        start = time.perf_counter()
+        assert cache.get("a") == "cached answer"
+        assert time.perf_counter() - start < 0.1
+        assert cache.set("b", "new answer") is False  # skipped, not raised
+    finally:
+        busy.rollback()
+        busy.close()
+
+    assert cache.set("b", "new answer") is True
+    assert cache.stats()["bytes"] == len("a") + len("cached answer") + len("b") + len("new answer")
+
+
+class FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, convert_to_numpy=True):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_repeated_question_skips_the_model(monkeypatch):
+    import app.embeddings as emb
+
+    fake = FakeModel()
+    monkeypatch.setattr(emb, "model", fake)
+    monkeypatch.setattr(emb, "query_cache", TTLCache(maxsize=10))
+
+    first = emb.embed_texts("When is Layla going to London?")
+    again = emb.embed_texts("  when is layla going to   London? ")
+    batch = emb.embed_texts(["When is Layla going to London?", "Where is Hans?"])
+
+    assert fake.calls == [["When is Layla going to London?"], ["Where is Hans?"]]
+    assert first.shape == (1, 2)
+    np.testing.assert_array_equal(first, again)
+    np.testing.assert_array_equal(batch[0], first[0])
+
+
+def test_semantic_cache_threshold_and_scope():
+    cache = SemanticCache(maxsize=2, threshold=0.95)
+    london = normalize_rows(np.array([1.0, 0.0, 0.0]))
+    london_paraphrase = normalize_rows(np.array([1.0, 0.1, 0.0]))
+    paris = normalize_rows(np.array([0.0, 1.0, 0.0]))
+
+    cache.set(london, {"answer": "June 14"}, ("v1", "Layla Kawaguchi"), cost_ms=800)
+
+    assert cache.get(london_paraphrase, ("v1", "Layla Kawaguchi")) == {"answer": "June 14"}
+    assert cache.get(paris, ("v1", "Layla Kawaguchi")) is None
+    assert cache.get(london, ("v1", "Hans Müller")) is None      # other member
+    assert cache.get(london, ("v2", "Layla Kawaguchi")) is None  # other corpus version
+    assert cache.stats()["saved_llm_ms"] == 800
+
+    cache.set(paris, "a", ("v1", None))
+    cache.set(paris, "b", ("v1", None))                           # evicts the london entry
+    assert cache.get(london, ("v1", "Layla Kawaguchi")) is None
+
+
+def test_semantic_cache_skips_expired_entries_for_a_fresh_match(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = SemanticCache(maxsize=10, ttl=60, threshold=0.9)
+    london = normalize_rows(np.array([1.0, 0.0, 0.0]))
+    london_paraphrase = normalize_rows(np.array([1.0, 0.2, 0.0]))
+    scope = ("v1", "Layla Kawaguchi")
+
+    cache.set(london, "stale", scope)
+    now[0] += 50
+    cache.set(london_paraphrase, "fresh", scope)
+    now[0] += 20                                                  # only the closest entry expired
+
+    assert cache.get(london, scope) == "fresh"
+    assert len(cache) == 1
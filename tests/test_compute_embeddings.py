@@ -0,0 +1,115 @@
+import numpy as np
+
+from app.compute_embeddings import (
+    rebuild_embeddings, atomic_save, load_previous, MODEL_NAME,
+)
+
+
+class CountingEncoder:
+    """Deterministic fake encoder that records what it was asked to encode."""
+
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, texts):
+        self.seen.extend(texts)
+        return np.array([[len(t), sum(map(ord, t)) % 97, 1.0] for t in texts], dtype=np.float32)
+
+
+def make_messages(texts):
+    return [{"message_id": mid, "text": t} for mid, t in texts]
+
+
+def test_rebuild_reuses_unchanged_vectors(tmp_path):
+    emb_path = tmp_path / "corpus_embeddings.npy"
+    manifest_path = tmp_path / "corpus_manifest.json"
+
+    v1 = make_messages([("a", "hello"), ("b", "world"), ("c", "gone soon")])
+    encoder = CountingEncoder()
+    emb1, manifest1, stats1 = rebuild_embeddings(v1, encoder)
+    atomic_save(emb1, manifest1, emb_path, manifest_path)
+    assert stats1["encoded"] == 3
+
+    # b edited, c deleted, d new, a unchanged (and moved)
+    v2 = make_messages([("d", "brand new"), ("a", "hello"), ("b", "world!")])
+    prev_emb, prev_manifest = load_previous(emb_path, manifest_path)
+    encoder = CountingEncoder()
+    emb2, manifest2, stats2 = rebuild_embeddings(v2, encoder, MODEL_NAME, prev_emb, prev_manifest)
+
+    assert encoder.seen == ["brand new", "world!"]
+    assert stats2 == {"total": 3, "reused": 1, "encoded": 2, "dropped": 2}
+    np.testing.assert_array_equal(emb2[1], emb1[0])
+    np.testing.assert_array_equal(emb2, CountingEncoder()([m["text"] for m in v2]))
+    assert manifest2["corpus_version"] != manifest1["corpus_version"]
+
+
+def test_model_change_forces_full_rebuild():
+    msgs = make_messages([("a", "hello"), ("b", "world")])
+    emb, manifest, _ = rebuild_embeddings(msgs, CountingEncoder(), "model-a")
+
+    encoder = CountingEncoder()
+    _, manifest2, stats = rebuild_embeddings(msgs, encoder, "model-b", emb, manifest)
+
+    assert stats["encoded"] == 2
+    assert manifest2["corpus_version"] != manifest["corpus_version"]
+
+
+def test_serving_embeddings_are_mmapped_and_aligned(tmp_path):
+    from app.compute_embeddings import save_serving_embeddings
+    from app.embeddings import load_embeddings_mmap
+
+    raw = np.random.default_rng(0).normal(size=(50, 8))
+    path = tmp_path / "corpus_embeddings_f32.npy"
+    save_serving_embeddings(raw, path)
+
+    matrix = load_embeddings_mmap(path)
+
+    assert isinstance(matrix, np.memmap)
+    assert matrix.dtype == np.float32 and matrix.offset % 64 == 0
+    assert not matrix.flags.writeable
+    np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1.0, rtol=1e-5)
+
+
+def test_backend_check_gates_reuse_of_previous_vectors():
+    from app.backends import check_compatibility
+
+    msgs = make_messages([("a", "hello"), ("b", "world")])
+    reference = CountingEncoder()
+    emb, manifest, _ = rebuild_embeddings(msgs, reference, "mpnet")
+
+    def close_backend(texts):
+        return reference(texts) * 1.01 + 0.001    # int8-style small drift
+
+    def drifting_backend(texts):
+        return -reference(texts)                    # different vector space
+
+    texts = [m["text"] for m in msgs]
+    assert check_compatibility(close_backend, texts, emb)["compatible"]
+    assert not check_compatibility(drifting_backend, texts, emb)["compatible"]
+
+    encoder = CountingEncoder()
+    _, _, stats = rebuild_embeddings(msgs, encoder, "mpnet@onnx-int8", emb, manifest,
+                                     compatible_models=("mpnet",))
+    assert stats["encoded"] == 0
+
+    _, _, stats = rebuild_embeddings(msgs, encoder, "mpnet@onnx-int8", emb, manifest)
+    assert stats["encoded"] == 2
+
+
+def test_manifest_header_leaves_the_rows_to_their_own_file(tmp_path):
+    import json
+
+    from app.compute_embeddings import rows_path
+
+    emb_path, manifest_path = tmp_path / "corpus_embeddings.npy", tmp_path / "corpus_manifest.json"
+    msgs = make_messages([("a", "hello"), ("b", "world")])
+    emb, manifest, _ = rebuild_embeddings(msgs, CountingEncoder())
+    atomic_save(emb, manifest, emb_path, manifest_path)
+
+    header = json.loads(manifest_path.read_text(encoding="utf-8"))
+    assert "rows" not in header and header["count"] == 2
+    assert rows_path(manifest_path).name == "corpus_manifest_rows.json"
+    assert load_previous(emb_path, manifest_path)[1]["rows"] == manifest["rows"]
+
+    rows_path(manifest_path).unlink()
+    assert load_previous(emb_path, manifest_path) == (None, None)
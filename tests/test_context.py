@@ -0,0 +1,65 @@
+import numpy as np
+
+from app.answer import format_context, pack_context
+from app.index import normalize_rows
+from app.tokens import count_tokens, truncate_tokens
+
+
+MESSAGES = [
+    {"user_name": "Layla Kawaguchi", "text": "Book orchestra seats for November 25."},
+    {"user_name": "Layla Kawaguchi", "text": "Book orchestra seats for November 25!"},
+    {"user_name": "Layla Kawaguchi", "text": "I need a car in London."},
+    {"user_name": "Hans Müller", "text": "Reserve a table at The French Laundry for four people."},
+]
+VECTORS = normalize_rows(np.array([[1, 0, 0], [1, 0.01, 0], [0, 1, 0], [0, 0, 1]], dtype=np.float32))
+
+
+def test_near_duplicates_dropped_by_embedding_similarity():
+    lines, report = pack_context(MESSAGES, VECTORS, budget=1000)
+
+    assert len(lines) == 3
+    assert "November 25." in lines[0]  # best-ranked copy wins
+    assert report["duplicates"] == 1
+    assert report["tokens_saved"] == count_tokens(lines[0].replace("25.", "25!")) + 1
+
+
+def test_identical_text_dropped_without_vectors():
+    messages = MESSAGES + [{"user_name": "Hans Müller", "text": "i need a  CAR in london."}]
+    _, report = pack_context(messages, budget=1000)
+    assert report["duplicates"] == 1
+
+
+def test_budget_keeps_best_ranked_messages_only():
+    full = format_context(MESSAGES[2:])
+    budget = count_tokens(full.splitlines()[0]) + 2
+
+    lines, report = pack_context(MESSAGES[2:], budget=budget)
+
+    assert lines == full.splitlines()[:1]
+    assert report["dropped_for_budget"] == 1
+    assert report["tokens_packed"] <= budget < report["tokens_naive"]
+
+
+def test_first_message_is_truncated_to_fit():
+    lines, report = pack_context(MESSAGES[3:], budget=12)
+
+    assert report["truncated"] == 1
+    assert lines[0].startswith("- Hans Müller: \"Res") and lines[0].endswith("...\"")
+    assert report["tokens_packed"] <= 12
+
+
+def test_format_context_reports_into_dict():
+    report = {}
+    assert format_context([], report=report) == "NO_RELEVANT_MESSAGES"
+
+    format_context(MESSAGES, VECTORS, report)
+    assert report["messages_in"] == 4 and report["messages_kept"] == 3
+
+
+def test_truncate_tokens_returns_a_prefix_within_budget():
+    text = "Reserve a table at The French Laundry for four people."
+    for n in range(0, count_tokens(text) + 2):
+        prefix = truncate_tokens(text, n)
+        assert text.startswith(prefix)
+        assert count_tokens(prefix) <= n
+    assert truncate_tokens(text, 1000) == text
@@ -0,0 +1,134 @@
+import json
+import os
+
+import numpy as np
+from fastapi.encoders import jsonable_encoder
+
+import app.data as data
+from app.corpus_store import CorpusStore, convert_json, iter_json_list, open_store, write_store
+from app.gazetteer import Gazetteer
+from app.retrieval import UserPartitions
+
+
+MESSAGES = [
+    {"message_id": "b1e9bb83-18be-4b90-bbb8-83b7428e8e21", "user_id": "u1", "user_name": "Layla Kawaguchi",
+     "text": "Book orchestra seats for November 25.", "timestamp": "2025-05-05T07:47:20.159073+00:00"},
+    {"message_id": "0c9e3d2f-8a8b-4f6e-9d57-2d7f0d9f5a10", "user_id": "u2", "user_name": "Hans Müller",
+     "text": "Réservez une table — 4 personnes 🍷", "timestamp": None},
+    {"message_id": "a3f3a4a1-1111-4c2b-9e8e-6e4b0c2f7d11", "user_id": "u1", "user_name": "Layla Kawaguchi",
+     "text": "", "timestamp": "2025-06-14T10:00:00+00:00"},
+]
+
+
+def test_roundtrip_matches_json_records(tmp_path):
+    path = tmp_path / "corpus.bin"
+    write_store(MESSAGES, path)
+    store = open_store(path)
+
+    assert len(store) == 3
+    assert [dict(m) for m in store] == MESSAGES
+    assert store[-1] == MESSAGES[-1]
+    assert store.uuid_ids
+    assert store.users == [("u1", "Layla Kawaguchi"), ("u2", "Hans Müller")]
+
+
+def test_non_uuid_ids_and_missing_users_fall_back_to_strings(tmp_path):
+    messages = [{"message_id": "msg-1", "user_id": None, "user_name": None, "text": "hi", "timestamp": None}]
+    path = tmp_path / "corpus.bin"
+    write_store(messages, path)
+
+    store = open_store(path)
+    assert not store.uuid_ids
+    assert dict(store[0]) == messages[0]
+
+
+def test_writes_from_a_stream_of_records(tmp_path):
+    json_path = tmp_path / "corpus.json"
+    records = MESSAGES + [{**MESSAGES[0], "message_id": "msg-4"}]
+    json_path.write_text(json.dumps(records, indent=2), encoding="utf-8")
+    # chunks far smaller than a record: items are still decoded whole
+    assert list(iter_json_list(json_path, chunk_size=7)) == records
+
+    path = tmp_path / "corpus.bin"
+    write_store(iter_json_list(json_path, chunk_size=64), path)
+    store = open_store(path)
+    assert not store.uuid_ids  # the last id is not a UUID
+    assert [dict(m) for m in store][:3] == MESSAGES and store[3]["message_id"] == "msg-4"
+
+
+def test_records_are_lazy_dict_like_views(tmp_path):
+    path = tmp_path / "corpus.bin"
+    write_store(MESSAGES, path)
+    store = CorpusStore(path)
+
+    assert isinstance(store.columns["text.blob"], np.memmap)  # nothing decoded at open
+    m = store[np.int64(1)]
+    assert not hasattr(m, "__dict__")
+    assert m["user_name"] == "Hans Müller" and m.get("missing", "x") == "x"
+    assert "text" in m and "missing" not in m
+    assert jsonable_encoder([m])[0]["text"] == MESSAGES[1]["text"]
+
+
+def test_partitions_and_gazetteer_match_the_json_path(tmp_path):
+    path = tmp_path / "corpus.bin"
+    write_store(MESSAGES, path)
+    store = open_store(path)
+
+    from_json, from_store = UserPartitions(MESSAGES), UserPartitions(store)
+    assert from_json.names == from_store.names
+    assert from_json.rows.keys() == from_store.rows.keys()
+    for key in from_json.rows:
+        np.testing.assert_array_equal(from_json.rows[key], from_store.rows[key])
+    assert Gazetteer.from_messages(store).names == Gazetteer.from_messages(MESSAGES).names
+    assert store.timestamps() == [m["timestamp"] for m in MESSAGES]
+
+
+def test_load_corpus_prefers_a_current_store(tmp_path, monkeypatch):
+    json_path, store_path = tmp_path / "corpus_messages.json", tmp_path / "corpus_messages.bin"
+    json_path.write_text(json.dumps(MESSAGES), encoding="utf-8")
+    monkeypatch.setattr(data, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(data, "CACHE_MESSAGES", json_path)
+    monkeypatch.setattr(data, "CACHE_STORE", store_path)
+
+    assert isinstance(data.load_corpus(), list)
+
+    assert convert_json(json_path, store_path) == 3
+    corpus = data.load_corpus()
+    assert isinstance(corpus, CorpusStore)
+    assert corpus[0] == MESSAGES[0]
+
+
+def test_store_freshness_follows_the_json_content_not_file_times(tmp_path, monkeypatch):
+    json_path, store_path = tmp_path / "corpus_messages.json", tmp_path / "corpus_messages.bin"
+    json_path.write_text(json.dumps(MESSAGES), encoding="utf-8")
+    monkeypatch.setattr(data, "CACHE_MESSAGES", json_path)
+    monkeypatch.setattr(data, "CACHE_STORE", store_path)
+    convert_json(json_path, store_path)
+
+    os.utime(json_path, (1, 1))                   # JSON looks older: still the same content
+    os.utime(store_path, (10**10, 10**10))
+    assert data.store_is_current()
+
+    json_path.write_text(json.dumps(MESSAGES[:2]), encoding="utf-8")
+    os.utime(json_path, (1, 1))                   # a checkout can leave the stale store newer
+    assert not data.store_is_current()
+
+
+def test_unchanged_json_is_hashed_once(tmp_path, monkeypatch):
+    import app.corpus_store as corpus_store
+
+    json_path, store_path = tmp_path / "corpus_messages.json", tmp_path / "corpus_messages.bin"
+    json_path.write_text(json.dumps(MESSAGES), encoding="utf-8")
+    monkeypatch.setattr(data, "CACHE_MESSAGES", json_path)
+    monkeypatch.setattr(data, "CACHE_STORE", store_path)
+    convert_json(json_path, store_path)
+
+    hashed = []
+    real_sha256 = corpus_store.file_sha256
+    monkeypatch.setattr(corpus_store, "file_sha256", lambda p: hashed.append(p) or real_sha256(p))
+    assert data.store_is_current() and data.store_is_current()
+    assert hashed == []
+
+    os.utime(json_path, ns=(1, 1))                # new mtime: hashed again, still current
+    assert data.store_is_current()
+    assert hashed == [json_path]
@@ -0,0 +1,133 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from app.data import ingest_all_messages
+
+
+# -------------------------------
+# Local stand-in for the /messages API
+# -------------------------------
+TOTAL = 537
+
+
+def make_item(i):
+    return {
+        "id": f"msg-{i}",
+        "user_id": f"user-{i % 7}",
+        "user_name": f"Member {i % 7}",
+        "timestamp": "2025-01-01T00:00:00+00:00",
+        "message": f"  message number {i}  ",
+    }
+
+
+class FlakyMessagesHandler(BaseHTTPRequestHandler):
+    """
+    Imitates the upstream quirks: a reported `total`, a short final page,
+    429 throttling on the first hit of some pages, transient 5xx/4xx,
+    the pages listed in `broken`, which never succeed, and pages in
+    `shifted` that start a few messages early (records slid under the walk).
+    """
+    hits = {}
+    broken = set()
+    shifted = {}
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        qs = parse_qs(urlparse(self.path).query)
+        skip = int(qs.get("skip", ["0"])[0])
+        limit = int(qs.get("limit", ["100"])[0])
+
+        with self.lock:
+            n = self.hits.get(skip, 0)
+            self.hits[skip] = n + 1
+
+        if skip == 200 and n == 0:
+            return self._send(429, {"detail": "Too Many Requests"}, {"Retry-After": "0"})
+        if skip == 300 and n < 2:
+            return self._send(503, {"detail": "unavailable"})
+        if skip == 400 and n == 0:
+            return self._send(405, {"detail": "Method Not Allowed"})
+        if skip in self.broken:
+            return self._send(400, {"detail": "bad skip"})
+
+        first = skip - self.shifted.get(skip, 0)
+        items = [make_item(i) for i in range(first, min(skip + limit, TOTAL))]
+        self._send(200, {"total": TOTAL, "items": items})
+
+
+@pytest.fixture
+def fake_api():
+    FlakyMessagesHandler.hits = {}
+    FlakyMessagesHandler.broken = set()
+    FlakyMessagesHandler.shifted = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyMessagesHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/messages"
+    server.shutdown()
+
+
+def test_ingest_walks_every_page(fake_api, tmp_path):
+    out = tmp_path / "corpus_messages.json"
+
+    stats = ingest_all_messages(
+        path=out, limit=100, workers=3, api_url=fake_api,
+        max_retries=3, backoff=0.001,
+    )
+
+    messages = json.load(open(out))
+    ids = [m["message_id"] for m in messages]
+
+    # every page arrives despite throttling and transient errors, in order
+    assert ids == [f"msg-{i}" for i in range(TOTAL)]
+    assert stats["failed_skips"] == []
+    assert stats["total_reported"] == TOTAL
+    assert messages[0]["text"] == "message number 0"
+    assert FlakyMessagesHandler.hits[300] == 3
+    assert not (tmp_path / "corpus_messages.json.tmp").exists()
+
+
+def test_failed_page_keeps_the_existing_corpus(fake_api, tmp_path):
+    out = tmp_path / "corpus_messages.json"
+    out.write_text('[{"message_id": "old"}]')
+    FlakyMessagesHandler.broken = {500}  # never succeeds
+
+    with pytest.raises(RuntimeError, match="skip=\\[500\\]"):
+        ingest_all_messages(
+            path=out, limit=100, workers=3, api_url=fake_api,
+            max_retries=3, backoff=0.001,
+        )
+
+    assert json.load(open(out)) == [{"message_id": "old"}]
+    assert not (tmp_path / "corpus_messages.json.tmp").exists()
+
+
+def test_ids_repeated_by_shifted_pages_are_dropped(fake_api, tmp_path):
+    out = tmp_path / "corpus_messages.json"
+    FlakyMessagesHandler.shifted = {100: 3, 500: 5}
+
+    stats = ingest_all_messages(
+        path=out, limit=100, workers=3, api_url=fake_api,
+        max_retries=3, backoff=0.001, dedupe_pages=2,
+    )
+
+    ids = [m["message_id"] for m in json.load(open(out))]
+    assert ids == [f"msg-{i}" for i in range(TOTAL)]
+    assert stats["duplicates"] == 8
@@ -0,0 +1,95 @@
+import pytest
+
+from app.extractive import answer_type, candidates, extract_answer, extractive_stats
+
+
+def msg(text, user_name="Layla Kawaguchi", timestamp=None):
+    return {"user_name": user_name, "text": text, "timestamp": timestamp}
+
+
+@pytest.mark.parametrize("question, parsed, kind", [
+    ("For what date does Layla need orchestra seats?", {}, "date"),
+    ("How many people are in Layla’s dinner reservation?", {}, "count"),
+    ("What is Lily O’Sullivan’s new fax number?", {}, "number"),
+    ("Where does Lily need a suite with a city view?", {}, "place"),
+    ("Tell me about Vikram's trip", {"intent": "travel_plans"}, "place"),
+    ("What did Sophia think about the hotel?", {"intent": None}, None),
+    ("How much is Layla's villa budget?", {}, None),  # an amount, not a count
+])
+def test_answer_type_from_wording_then_intent(question, parsed, kind):
+    assert answer_type(question, parsed) == kind
+
+
+@pytest.mark.parametrize("text, kind, expected", [
+    ("I need orchestra seats for the symphony on November 25.", "date", ["November 25"]),
+    ("Book a villa in Santorini for the first week of December.", "date", ["the first week of December"]),
+    ("Arrive 3rd of June 2025, leave July 4", "date", ["3rd of June 2025", "July 4"]),
+    ("Secure a dinner reservation at Le Bernardin for my family of five.", "count", ["five"]),
+    ("I’d like two premiere tickets to the Met for November 22.", "count", ["two"]),
+    ("My new fax number is 431-555-2363 please update your records.", "number", ["431-555-2363"]),
+    ("I need my frequent flyer number updated: 123456789.", "number", ["123456789"]),
+    ("I need a suite with a city view in Hong Kong next week.", "place", ["Hong Kong"]),
+    ("Reserve a table at The Ivy for dinner on Friday in May.", "place", ["The Ivy"]),
+])
+def test_candidates(text, kind, expected):
+    assert candidates(text, kind) == expected
+
+
+def test_relative_dates_resolve_against_the_send_day():
+    text = "Have the car ready tomorrow and a table next Tuesday."
+    assert candidates(text, "date", "2025-11-04T10:00:00+00:00") == ["November 5, 2025", "November 11, 2025"]
+    assert candidates("Dinner this Friday, please.", "date", "2025-11-04T10:00:00Z") == ["November 7, 2025"]
+    assert candidates(text, "date") == []  # no send day to resolve them against
+
+
+def test_relative_date_is_answered_as_a_calendar_date():
+    question = "When does Layla need the car ready?"
+    sent = msg("Please have the car ready for me tomorrow.", timestamp="2025-11-04T10:00:00+00:00")
+
+    assert extract_answer(question, {}, [sent], [0.8])[0] == "November 5, 2025"
+    assert extract_answer(question, {}, [{**sent, "timestamp": None}], [0.8])[0] is None
+
+
+def test_answers_from_the_top_message_when_it_clearly_holds_the_value():
+    retrieved = [
+        msg("Secure a dinner reservation at Le Bernardin for my family of five."),
+        msg("Reserve a table at The Ivy for dinner tomorrow."),
+    ]
+    question = "How many people are in Layla’s dinner reservation?"
+    text, details = extract_answer(question, {"user_name": "Layla Kawaguchi"}, retrieved, [0.71, 0.52])
+
+    assert text == "five"
+    assert details["source"] == "extractive" and details["rank"] == 0 and details["confidence"] == 1.0
+
+
+def test_prefers_the_message_that_covers_the_question():
+    retrieved = [
+        msg("My brother's new number is 447-555-8823; update my contact list.", "Lily O'Sullivan"),
+        msg("My new fax number is 431-555-2363 please update your records.", "Lily O'Sullivan"),
+    ]
+    text, _ = extract_answer(
+        "What is Lily O’Sullivan’s new fax number?", {"user_name": "Lily O'Sullivan"}, retrieved, [0.6, 0.6]
+    )
+    assert text == "431-555-2363"
+
+
+@pytest.mark.parametrize("question, retrieved, scores, reason", [
+    ("What did Sophia think about the hotel?", [msg("Perfect choice!")], [0.9], "no_answer_type"),
+    ("When is Layla's spa day?", [msg("Book me a spa day.")], [0.9], "no_candidate"),
+    ("When are Layla's orchestra seats?", [msg("Orchestra seats on November 25.")], [0.2], "low_score"),
+    # two dates and little overlap: leave it to the LLM
+    ("When is Layla's Paris flight?", [msg("Hotel from June 3 to June 9, please.")], [0.9], "low_confidence"),
+    # the only place is the one the question names
+    ("Where does Layla stay in Rio?", [msg("Arrange a trainer in Rio.")], [0.9], "no_candidate"),
+    # the value is cancelled, not planned
+    ("When is Layla going to London?", [msg("Cancel my London trip that was planned for June 3.")],
+     [0.9], "negated"),
+    ("How many tickets does Layla need?", [msg("Two tickets to the Met."), msg("I no longer need them.")],
+     [0.9, 0.5], "negated"),
+])
+def test_falls_back_to_the_llm(question, retrieved, scores, reason):
+    before = extractive_stats()[reason]
+    text, details = extract_answer(question, {}, retrieved, scores)
+
+    assert text is None and details["source"] == "llm" and details["reason"] == reason
+    assert extractive_stats()[reason] == before + 1
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from app.gazetteer import Gazetteer, parse_locally
+
+
+@pytest.fixture(scope="module")
+def gazetteer():
+    with open("data_cache/corpus_messages.json", encoding="utf-8") as f:
+        return Gazetteer.from_messages(json.load(f))
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("For what date does Layla need orchestra seats?", "Layla Kawaguchi"),
+    ("How many people are in Layla’s dinner reservation?", "Layla Kawaguchi"),
+    ("What is Lily O’Sullivan’s new fax number?", "Lily O'Sullivan"),
+    ("What did Hans Muller order?", "Hans Müller"),
+    ("Where does Amina Van Den Berg live?", "Amina Van Den Berg"),
+    ("When is Vikrm going to Paris?", "Vikram Desai"),
+])
+def test_resolves_member_names_locally(gazetteer, question, expected):
+    parsed, confident = parse_locally(question, gazetteer)
+
+    assert confident
+    assert parsed["user_name"] == expected
+    assert parsed["source"] == "local"
+
+
+def test_no_name_is_confident_none(gazetteer):
+    parsed, confident = parse_locally("What is the best restaurant?", gazetteer)
+    assert confident and parsed["user_name"] is None
+
+
+def test_unknown_name_is_not_confident(gazetteer):
+    parsed, confident = parse_locally("When is Beatrice going out?", gazetteer)
+    assert not confident and parsed["user_name"] is None
+
+
+def test_ambiguous_first_name_is_not_confident():
+    g = Gazetteer(["Layla Kawaguchi", "Layla Smith"])
+    parsed, confident = parse_locally("Where is Layla?", g)
+    assert not confident
+
+    parsed, confident = parse_locally("Where is Layla Smith?", g)
+    assert confident and parsed["user_name"] == "Layla Smith"
+
+
+def test_names_that_are_also_common_words_need_a_capital():
+    g = Gazetteer(["Layla Kawaguchi", "Grace Young", "Will Turner"])
+
+    for question in ("What is the best restaurant for young kids?", "Where will the gala be held?"):
+        parsed, confident = parse_locally(question, g)
+        assert confident and parsed["user_name"] is None
+
+    parsed, confident = parse_locally("What did Ms Young book?", g)
+    assert confident and parsed["user_name"] == "Grace Young"
+    parsed, confident = parse_locally("what did grace young book?", g)  # full names match in any case
+    assert confident and parsed["user_name"] == "Grace Young"
@@ -0,0 +1,55 @@
+import numpy as np
+
+from app.index import (
+    ExactIndex, IVFIndex, INDEX_PATHS, build_index, load_index, normalize_rows, top_k_scores,
+)
+
+
+def clustered_embeddings(n=4000, dim=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    x = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    return x.astype(np.float32)
+
+
+def test_ivf_recall_tracks_nprobe():
+    x = normalize_rows(clustered_embeddings())
+    exact = ExactIndex(x)
+    ivf = IVFIndex.build(x, nlist=64)
+    queries = x[:50] + 0.05
+
+    def recall(nprobe):
+        ivf.nprobe = nprobe
+        hits = 0
+        for q in queries:
+            truth = set(exact.search(q, 5)[0])
+            hits += len(truth & set(ivf.search(q, 5)[0]))
+        return hits / (5 * len(queries))
+
+    assert recall(64) == 1.0  # probing every list is exact
+    assert recall(8) >= 0.9
+
+
+def test_load_index_roundtrip_and_staleness(tmp_path, monkeypatch):
+    x = normalize_rows(clustered_embeddings(n=500))
+    path = tmp_path / "corpus_index_ivf.npz"
+    build_index(x, "ivf", corpus_version="v1", path=path)
+
+    monkeypatch.setitem(INDEX_PATHS, "ivf", path)
+
+    assert load_index(x, "v1", kind="ivf").kind == "ivf"
+    assert load_index(x, "v2", kind="ivf").kind == "exact"  # stale → fallback
+    assert load_index(x, "v1", kind="auto").kind == "exact"  # small corpus
+
+
+def test_top_k_kernel_matches_full_sort():
+    rng = np.random.default_rng(1)
+    x = normalize_rows(rng.normal(size=(1000, 16)))
+    q = normalize_rows(rng.normal(size=16))
+
+    top, scores = top_k_scores(x, q, 5)
+
+    sims = x @ q
+    np.testing.assert_array_equal(top, sims.argsort()[::-1][:5])
+    np.testing.assert_allclose(scores, np.sort(sims)[::-1][:5])
+    assert len(top_k_scores(x[:3], q, 5)[0]) == 3
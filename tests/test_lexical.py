@@ -0,0 +1,93 @@
+import numpy as np
+
+import app.retrieval as retrieval
+from app.index import ExactIndex, normalize_rows
+from app.lexical import BM25Index, load_lexical_index, build_lexical_index, rrf_fuse, terms
+from app.retrieval import UserPartitions, retrieve_batch, retrieve_for_user
+
+
+MESSAGES = [
+    {"message_id": "1", "user_name": "Layla Kawaguchi", "text": "Book orchestra seats for November 25."},
+    {"message_id": "2", "user_name": "Hans Müller", "text": "Reserve a table at The French Laundry."},
+    {"message_id": "3", "user_name": "Layla Kawaguchi", "text": "I need a car in London on June 14."},
+    {"message_id": "4", "user_name": "Hans Müller", "text": "Please arrange dinner for two tonight."},
+    {"message_id": "5", "user_name": "Layla Kawaguchi", "text": "Find me a restaurant with a view."},
+]
+
+
+def test_terms_fold_and_drop_stopwords():
+    assert terms("What's Müller's plan for June 14?") == ["muller", "plan", "june", "14"]
+
+
+def test_bm25_ranks_exact_names_and_dates_first():
+    index = BM25Index.build([m["text"] for m in MESSAGES])
+
+    assert index.search("the French Laundry", 3)[0][0] == 1
+    assert index.search("what happens June 14", 3)[0][0] == 2
+    assert len(index.search("zeppelin", 3)[0]) == 0
+
+
+def test_bm25_respects_row_restriction():
+    index = BM25Index.build([m["text"] for m in MESSAGES])
+    layla = UserPartitions(MESSAGES).rows_for("Layla")
+
+    rows, _ = index.search("table restaurant dinner", 5, layla)
+    assert set(rows) <= set(layla)
+    assert list(rows) == [4]
+
+
+def test_rrf_prefers_rows_ranked_well_by_both():
+    fused = rrf_fuse([np.array([7, 3, 1]), np.array([3, 9])], k=3)
+    assert list(fused) == [3, 7, 9]
+    assert len(rrf_fuse([np.array([], dtype=np.int64)], k=3)) == 0
+
+
+def test_persisted_index_roundtrip_and_staleness(tmp_path):
+    path = tmp_path / "corpus_lexical.npz"
+    built = build_lexical_index(MESSAGES, corpus_version="v1", path=path)
+
+    loaded = load_lexical_index(MESSAGES, "v1", path=path)
+    assert loaded.vocab == built.vocab
+    np.testing.assert_array_equal(loaded.search("orchestra", 1)[0], [0])
+
+    rebuilt = load_lexical_index(MESSAGES[:4], "v2", path=path)
+    assert len(rebuilt) == 4
+
+
+def test_hybrid_recovers_venue_dense_misses_and_prefilters(monkeypatch):
+    # Dense vectors put the French Laundry message last for this query.
+    vectors = normalize_rows(np.array([[1, 0.1], [0, 1], [0.9, 0.2], [0.8, 0.3], [0.7, 0.4]], dtype=np.float32))
+    q = normalize_rows(np.array([1, 0], dtype=np.float32))
+    lexical = BM25Index.build([m["text"] for m in MESSAGES])
+    args = (q, 1, MESSAGES, vectors, ExactIndex(vectors), UserPartitions(MESSAGES))
+
+    assert retrieve_for_user(*args)[0]["message_id"] == "1"
+
+    timings = {}
+    top = retrieve_for_user(*args, None, "Table at the French Laundry?", lexical, timings)
+    assert top[0]["message_id"] == "2"
+    assert {"lexical_ms", "dense_ms", "fusion_ms"} <= set(timings)
+    assert timings["prefiltered"] is False
+
+    monkeypatch.setattr(retrieval, "PREFILTER_MIN_ROWS", 3)
+    monkeypatch.setattr(retrieval, "DENSE_CANDIDATES", 2)
+    timings = {}
+    retrieve_for_user(*args, None, "table for dinner tonight", lexical, timings)
+    assert timings["prefiltered"] is True
+    assert timings["dense_scored"] == timings["lexical_candidates"] < len(MESSAGES)
+
+
+def test_batch_hybrid_matches_single_question_path():
+    vectors = normalize_rows(np.random.default_rng(0).normal(size=(5, 4)).astype(np.float32))
+    lexical = BM25Index.build([m["text"] for m in MESSAGES])
+    partitions = UserPartitions(MESSAGES)
+    questions = ["French Laundry table", "orchestra seats", "car in London"]
+    names = [None, "Layla", "Layla"]
+    q_embs = normalize_rows(np.random.default_rng(1).normal(size=(3, 4)).astype(np.float32))
+
+    batch = retrieve_batch(q_embs, 2, MESSAGES, vectors, ExactIndex(vectors), partitions,
+                           names, questions, lexical)
+    for q_emb, name, question, got in zip(q_embs, names, questions, batch):
+        single = retrieve_for_user(q_emb, 2, MESSAGES, vectors, ExactIndex(vectors), partitions,
+                                   name, question, lexical)
+        assert got == single
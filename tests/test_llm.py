@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import app.llm as llm
+from app.answer import generate_answer_async
+from app.parsing import parse_question, parse_question_async
+
+
+class MockUpstream(BaseHTTPRequestHandler):
+    """
+    /chat/completions that replays `server.plan`, one (delay_s, status,
+    content) step per request in arrival order; then answers "ok".
+    """
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.requests += 1
+            delay, status, content = self.server.plan.pop(0) if self.server.plan else (0, 200, "ok")
+
+        time.sleep(delay)
+        payload = {"error": {"message": "injected", "type": "server_error"}}
+        if status == 200:
+            payload = {
+                "id": "chatcmpl-test", "object": "chat.completion", "created": 0,
+                "model": body["model"],
+                "choices": [{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }],
+            }
+        data = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (deadline or losing hedge)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockUpstream)
+    server.plan, server.requests, server.lock = [], 0, threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setattr(llm, "_client", None)
+    monkeypatch.setattr(llm, "_async_client", None)
+    monkeypatch.setattr(llm, "LLM_TIMEOUT", 2.0)
+    monkeypatch.setattr(llm, "LLM_RETRIES", 2)
+    monkeypatch.setattr(llm, "LLM_BACKOFF", 0.01)
+    monkeypatch.setattr(llm, "LLM_HEDGE_MS", 0)
+    monkeypatch.setattr(llm, "LLM_STATS", dict.fromkeys(llm.LLM_STATS, 0))
+    monkeypatch.setattr(llm, "breaker", llm.CircuitBreaker(failures=2, reset_s=0.3))
+    yield server
+    server.shutdown()
+
+
+USER = [{"role": "user", "content": "hi"}]
+
+
+def test_retries_injected_errors_then_succeeds(upstream):
+    upstream.plan = [(0, 500, None), (0, 503, None), (0, 200, "November 25")]
+
+    assert asyncio.run(llm.chat_async(USER)) == "November 25"
+    assert upstream.requests == 3
+    assert llm.LLM_STATS["retries"] == 2
+
+
+def test_client_errors_are_not_retried(upstream):
+    upstream.plan = [(0, 400, None)]
+
+    with pytest.raises(Exception) as info:
+        llm.chat(USER)
+    assert not isinstance(info.value, llm.LLMUnavailable)
+    assert upstream.requests == 1
+    assert llm.breaker.state == "closed"
+
+
+def test_deadline_bounds_a_slow_upstream(upstream):
+    upstream.plan = [(2, 200, "too late")] * 3
+
+    start = time.perf_counter()
+    with pytest.raises(llm.LLMUnavailable):
+        asyncio.run(llm.chat_async(USER, timeout=0.3))
+    assert time.perf_counter() - start < 1.0
+
+
+def test_hedged_request_wins_over_slow_first_attempt(upstream, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_HEDGE_MS", 50)
+    upstream.plan = [(1.0, 200, "slow"), (0, 200, "fast")]
+
+    start = time.perf_counter()
+    assert asyncio.run(llm.chat_async(USER)) == "fast"
+    assert time.perf_counter() - start < 0.8
+    assert llm.LLM_STATS["hedges"] == 1
+    assert llm.LLM_STATS["hedge_wins"] == 1
+
+
+def test_breaker_opens_fails_fast_and_recovers(upstream, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_RETRIES", 0)
+    upstream.plan = [(0, 500, None), (0, 500, None)]
+
+    for _ in range(2):
+        with pytest.raises(llm.LLMUnavailable):
+            llm.chat(USER)
+    assert llm.breaker.state == "open"
+
+    with pytest.raises(llm.CircuitOpenError):
+        asyncio.run(generate_answer_async("q", {}, []))
+    assert upstream.requests == 2  # rejected without calling the upstream
+
+    time.sleep(0.35)
+    assert llm.breaker.state == "half-open"
+    assert llm.chat(USER) == "ok"
+    assert llm.breaker.state == "closed"
+
+
+def test_cancelled_half_open_trial_hands_the_slot_back(upstream):
+    llm.breaker.opened_at = time.monotonic() - llm.breaker.reset_s
+    upstream.plan = [(1.0, 200, "too late")]
+
+    async def cancel_the_trial():
+        trial = asyncio.ensure_future(llm.chat_async(USER))
+        await asyncio.sleep(0.1)
+        assert llm.breaker.trial_in_flight
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    asyncio.run(cancel_the_trial())
+    assert not llm.breaker.trial_in_flight and llm.breaker.state == "half-open"
+    assert llm.chat(USER) == "ok"  # the next call is let through as the trial
+    assert llm.breaker.state == "closed"
+
+
+def test_parse_and_answer_go_through_the_shared_client(upstream):
+    parsed_json = json.dumps({"user_name": "Layla", "intent": "travel_plans", "entities": [], "raw": "q"})
+    upstream.plan = [(0, 500, None), (0, 200, parsed_json), (0, 200, parsed_json), (0, 200, "November 25")]
+
+    assert parse_question("q")["user_name"] == "Layla"
+
+    async def parse_then_answer():
+        parsed = await parse_question_async("q")
+        return parsed, await generate_answer_async("q", parsed, [{"user_name": "Layla", "text": "Nov 25"}])
+
+    parsed, answer = asyncio.run(parse_then_answer())
+    assert parsed["intent"] == "travel_plans"
+    assert answer == {"answer": "November 25"}
+    assert llm.LLM_STATS["calls"] == 3
+
+
+def test_response_cache_serves_repeats_across_clients_and_versions(upstream, tmp_path, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_CACHE_DB", str(tmp_path / "llm.sqlite"))
+    monkeypatch.setattr(llm, "_response_cache", None)
+    upstream.plan = [(0, 200, "November 25"), (0, 200, "December 1")]
+
+    assert llm.chat(USER, cache_version="v1") == "November 25"
+    assert asyncio.run(llm.chat_async(USER, cache_version="v1")) == "November 25"
+    assert upstream.requests == 1
+
+    # another corpus version is a different entry; so is a sampled call
+    assert llm.chat(USER, cache_version="v2") == "December 1"
+    llm.chat(USER, temperature=0.7)
+    assert upstream.requests == 3
+
+    # a new process (fresh connection) reuses the entries, even with the breaker open
+    monkeypatch.setattr(llm, "_response_cache", None)
+    llm.breaker.opened_at = time.monotonic()
+    assert llm.breaker.state == "open"
+    assert llm.chat(USER, cache_version="v1") == "November 25"
+    assert upstream.requests == 3
+    assert llm.llm_stats()["response_cache"]["hits"] == 1
@@ -0,0 +1,83 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from app.index import ExactIndex, load_index, normalize_rows
+from app.sharded import ShardedIndex, merge_top_k
+from app.snapshot import CorpusSnapshot, extend_snapshot
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return normalize_rows(np.random.default_rng(0).normal(size=(3001, 16)))
+
+
+@pytest.fixture(scope="module")
+def sharded(matrix):
+    index = ShardedIndex(matrix, shards=4, workers=2).start()
+    yield index
+    index.close()
+
+
+def test_search_matches_single_process_exactly(matrix, sharded):
+    exact = ExactIndex(matrix)
+    queries = normalize_rows(np.random.default_rng(1).normal(size=(20, 16)))
+
+    for q in queries:
+        rows, scores = sharded.search(q, 10)
+        exact_rows, exact_scores = exact.search(q, 10)
+        np.testing.assert_array_equal(rows, exact_rows)
+        np.testing.assert_array_equal(scores, exact_scores)
+
+    rows, scores = sharded.search_batch(queries, 10)
+    exact_rows, exact_scores = exact.search_batch(queries, 10)
+    np.testing.assert_array_equal(rows, exact_rows)
+    np.testing.assert_array_equal(scores, exact_scores)
+
+
+def test_k_larger_than_a_shard(matrix, sharded):
+    rows, _ = sharded.search(matrix[0], 1000)
+    assert len(rows) == 1000 and len(set(rows.tolist())) == 1000
+    assert rows[0] == 0
+
+
+def test_merge_breaks_ties_by_row():
+    parts = [(np.array([5, 9]), np.array([0.9, 0.5], dtype=np.float32)),
+             (np.array([2, 7]), np.array([0.9, 0.8], dtype=np.float32))]
+    rows, scores = merge_top_k(parts, 3)
+    assert rows.tolist() == [2, 5, 7]
+    assert scores.tolist() == pytest.approx([0.9, 0.9, 0.8])
+
+
+def test_load_index_and_close_release_shared_memory(matrix, monkeypatch):
+    import app.sharded as sharded_module
+    monkeypatch.setattr(sharded_module, "SHARD_WORKERS", 1)
+
+    index = load_index(matrix, kind="sharded")
+    assert index.kind == "sharded"
+    np.testing.assert_array_equal(index.embeddings, matrix)
+    name = index._shm.name
+
+    index.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_extended_snapshot_serves_from_the_new_shared_block(matrix):
+    messages = [{"message_id": f"m{i}", "user_name": "Layla Kawaguchi", "text": f"note {i}"}
+                for i in range(len(matrix))]
+    index = ShardedIndex(matrix, shards=2, workers=1, start_method="fork").start()
+    snap = CorpusSnapshot(messages, index.embeddings, "v1", index, None)
+    extra = normalize_rows(np.random.default_rng(2).normal(size=(2, 16)))
+
+    new_records = [{"message_id": "x1", "text": "a"}, {"message_id": "x2", "text": "b"}]
+    new = extend_snapshot(snap, new_records, lambda texts: extra[: len(texts)])
+    try:
+        assert new.index.start_method == "fork"
+        assert new.embeddings is new.index.embeddings  # one copy of the corpus, in shared memory
+        rows, _ = new.index.search(extra[1], 1)
+        assert rows.tolist() == [len(matrix) + 1]
+    finally:
+        new.index.close()
+        index.close()
@@ -0,0 +1,197 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+
+from app.index import ExactIndex, IVFIndex, normalize_rows
+from app.lexical import BM25Index
+from app.snapshot import (
+    REFRESH_STATS, CorpusSnapshot, extend_snapshot, fetch_new_messages, refresh_once,
+)
+
+
+DIM = 8
+
+
+def record(i):
+    return {
+        "message_id": f"msg-{i}",
+        "user_id": f"user-{i % 3}",
+        "user_name": f"Member {i % 3}",
+        "text": f"message number {i}",
+        "timestamp": "2025-01-01T00:00:00+00:00",
+    }
+
+
+def vector(i):
+    return np.random.default_rng(i).normal(size=DIM)
+
+
+def encode(texts):
+    encode.calls.append(list(texts))
+    return np.array([vector(int(t.rsplit(" ", 1)[1])) for t in texts])
+
+
+def vectors_for(n):
+    return normalize_rows(np.array([vector(i) for i in range(n)]))
+
+
+def make_snapshot(n, index_cls=ExactIndex):
+    messages = [record(i) for i in range(n)]
+    embeddings = vectors_for(n).astype(np.float32)
+    index = index_cls(embeddings) if index_cls is ExactIndex else IVFIndex.build(embeddings, nlist=4)
+    return CorpusSnapshot(messages, embeddings, "v1", index, BM25Index.build([m["text"] for m in messages]))
+
+
+@pytest.fixture(autouse=True)
+def reset_encode():
+    encode.calls = []
+
+
+def test_extend_encodes_only_the_delta_and_leaves_the_old_snapshot_alone():
+    old = make_snapshot(20)
+    new = extend_snapshot(old, [record(20), record(21)], encode)
+
+    assert encode.calls == [["message number 20", "message number 21"]]
+    assert len(old) == 20 and old.embeddings.shape == (20, DIM) and len(old.index) == 20
+    assert len(new) == 22 and len(new.index) == 22
+    assert new.version != old.version
+    assert {"msg-20", "msg-21"} <= new.known_ids() and "msg-20" not in old.known_ids()
+
+    np.testing.assert_allclose(new.embeddings, vectors_for(22), rtol=1e-5)
+    assert new.index.search(new.embeddings[21], 1)[0][0] == 21
+    assert new.messages[21]["message_id"] == "msg-21"
+    assert list(new.lexical.search("21", 1)[0]) == [21]
+    assert new.partitions.rows_for("Member 0")[-1] == 21
+
+
+def test_extended_ivf_matches_exact_search_when_probing_every_list():
+    old = make_snapshot(200, IVFIndex)
+    new = extend_snapshot(old, [record(i) for i in range(200, 260)], encode)
+
+    assert new.index.kind == "ivf" and len(old.index.list_rows) == 200
+    new.index.nprobe = len(new.index.centroids)
+    exact = ExactIndex(new.embeddings)
+    for q in new.embeddings[195:205]:
+        np.testing.assert_array_equal(new.index.search(q, 5)[0], exact.search(q, 5)[0])
+
+
+def test_refresh_swaps_in_a_new_snapshot_only_when_something_is_new():
+    state = SimpleNamespace(snapshot=make_snapshot(10))
+    first = state.snapshot
+    seen = {}
+
+    def fetch(known_ids, start, stats=None):
+        seen["start"] = start
+        return [record(i) for i in range(8, 13) if f"msg-{i}" not in known_ids]
+
+    assert refresh_once(state, encode, fetch) == 3
+    assert state.snapshot is not first and len(state.snapshot) == 13
+    assert seen["start"] == 0
+
+    second = state.snapshot
+    assert refresh_once(state, encode, fetch) == 0
+    assert state.snapshot is second
+
+
+def test_refresh_keeps_a_memory_mapped_matrix_mapped(tmp_path):
+    base = tmp_path / "corpus_embeddings_f32.npy"
+    np.save(base, vectors_for(10).astype(np.float32))
+    snapshot = make_snapshot(10)
+    embeddings = np.load(base, mmap_mode="r")
+    state = SimpleNamespace(snapshot=CorpusSnapshot(
+        snapshot.messages, embeddings, "v1", ExactIndex(embeddings), snapshot.lexical,
+    ))
+    batches = iter([[record(10), record(11)], [record(12)]])
+
+    def fetch(known_ids, start, stats=None):
+        return next(batches)
+
+    assert refresh_once(state, encode, fetch) == 2
+    first = state.snapshot.embeddings
+    assert isinstance(first, np.memmap) and str(first.filename).endswith(f".{state.snapshot.version}.npy")
+    np.testing.assert_allclose(first, vectors_for(12), rtol=1e-5)
+
+    assert refresh_once(state, encode, fetch) == 1
+    assert isinstance(state.snapshot.embeddings, np.memmap) and len(state.snapshot.embeddings) == 13
+    # the superseded refresh file is removed, the base file kept
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        [base.name, f"corpus_embeddings_f32.{state.snapshot.version}.npy"]
+    )
+
+
+class GrowingMessagesHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        qs = parse_qs(urlparse(self.path).query)
+        skip, limit = int(qs["skip"][0]), int(qs["limit"][0])
+        self.server.skips.append(skip)
+        if skip in getattr(self.server, "failing", ()):
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        items = [
+            {"id": r["message_id"], "user_id": r["user_id"], "user_name": r["user_name"],
+             "message": r["text"], "timestamp": r["timestamp"]}
+            for r in map(record, range(skip, min(skip + limit, self.server.total)))
+        ]
+        payload = json.dumps({"total": self.server.total, "items": items}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def test_delta_ingest_reads_only_the_tail_of_the_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GrowingMessagesHandler)
+    server.total, server.skips = 230, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/messages"
+
+    try:
+        state = SimpleNamespace(snapshot=make_snapshot(150))
+        added = refresh_once(
+            state, encode,
+            lambda known, start, stats: fetch_new_messages(known, start, stats, api_url=url, backoff=0),
+        )
+    finally:
+        server.shutdown()
+
+    assert added == 80
+    assert min(server.skips) == 50  # one page of overlap, not a full re-walk
+    assert [m["message_id"] for m in state.snapshot.messages[148:152]] == [
+        "msg-148", "msg-149", "msg-150", "msg-151",
+    ]
+    assert encode.calls == [[f"message number {i}" for i in range(150, 230)]]
+
+
+def test_refresh_with_a_failed_delta_page_keeps_the_current_snapshot():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GrowingMessagesHandler)
+    server.total, server.skips, server.failing = 230, [], {150}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/messages"
+
+    state = SimpleNamespace(snapshot=make_snapshot(150))
+    first = state.snapshot
+    errors = REFRESH_STATS["errors"]
+    try:
+        added = refresh_once(
+            state, encode,
+            lambda known, start, stats: fetch_new_messages(
+                known, start, stats, api_url=url, max_retries=1, backoff=0
+            ),
+        )
+    finally:
+        server.shutdown()
+
+    assert added == 0 and state.snapshot is first
+    assert REFRESH_STATS["errors"] == errors + 1
+    assert "150" in REFRESH_STATS["last_error"]
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+
+
+def test_importing_the_app_skips_heavy_dependencies():
+    code = (
+        "import sys, app.main; "
+        "print(','.join(m for m in ('torch', 'sentence_transformers', 'openai', 'sklearn') "
+        "if m in sys.modules))"
+    )
+    env = {"PATH": "", "PYTHONPATH": "."}
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_startup_phases_are_recorded():
+    from app.startup import phase, startup_report
+
+    with phase("test.phase"):
+        pass
+
+    info = startup_report()["phases"]["test.phase"]
+    assert info["status"] == "done"
+    assert info["ms"] >= 0
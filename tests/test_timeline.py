@@ -0,0 +1,181 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from app.index import ExactIndex, normalize_rows
+from app.lexical import BM25Index
+from app.retrieval import UserPartitions, retrieve_batch, retrieve_rows_for_user
+from app.timeline import MISSING, TimestampIndex, parse_timestamp, time_window
+
+NOW = datetime(2025, 3, 12, 15, 30, tzinfo=timezone.utc)  # a Wednesday
+
+
+def ts(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+@pytest.mark.parametrize("question, start, end", [
+    ("What did Layla book last month?", ts(2025, 2, 1), ts(2025, 3, 1)),
+    ("Anything from Vikram this month?", ts(2025, 3, 1), ts(2025, 4, 1)),
+    ("what did she ask for last week", ts(2025, 3, 3), ts(2025, 3, 10)),
+    ("Requests this year?", ts(2025, 1, 1), ts(2026, 1, 1)),
+    ("Messages in the past 3 days", ts(2025, 3, 9), ts(2025, 3, 13)),
+    ("What did he order over the last two months", ts(2025, 1, 12), ts(2025, 3, 13)),
+    ("What did Armand send yesterday?", ts(2025, 3, 11), ts(2025, 3, 12)),
+    ("messages in the past week", ts(2025, 3, 5), ts(2025, 3, 13)),
+])
+def test_time_window_from_question(question, start, end):
+    window = time_window(question, NOW)
+    assert (window["start"], window["end"]) == (start, end)
+
+
+def test_month_arithmetic_clamps_and_wraps_years():
+    now = datetime(2025, 3, 31, 12, tzinfo=timezone.utc)
+    assert time_window("sent in the past month", now)["start"] == ts(2025, 2, 28)
+    assert time_window("sent in the last 4 months", now)["start"] == ts(2024, 11, 30)
+    assert time_window("sent last year", now)["start"] == ts(2024, 1, 1)
+
+
+def test_rolling_windows_are_stable_within_a_day():
+    # the answer cache is keyed on the bounds, so they must not move every second
+    later = datetime(2025, 3, 12, 23, 59, 59, tzinfo=timezone.utc)
+    assert time_window("sent in the past 3 days", NOW) == time_window("sent in the past 3 days", later)
+
+
+def test_absolute_dates_do_not_scope_the_search():
+    # "November 25" is what the message is about, not when it was sent.
+    assert time_window("For what date does Layla need orchestra seats? November 25?", NOW) is None
+    assert time_window("How many cars does Vikram have?", NOW) is None
+
+
+@pytest.mark.parametrize("question", [
+    "What does Layla want on the last day of her trip?",
+    "What did Layla book for the last week of the cruise?",
+    "Where did Vikram ask for a table for today?",
+    "What did Sophia book for this weekend?",
+    "How many nights does Layla stay this month?",  # nothing said about sending
+])
+def test_phrases_about_the_thing_itself_do_not_scope_the_search(question):
+    assert time_window(question, NOW) is None
+
+
+def test_parse_timestamp_formats():
+    assert parse_timestamp("2025-05-05T07:47:20.159073+00:00") == ts(2025, 5, 5, 7, 47, 20)
+    assert parse_timestamp("2025-05-05T09:47:20+02:00") == ts(2025, 5, 5, 7, 47, 20)
+    assert parse_timestamp("2025-05-05T07:47:20Z") == ts(2025, 5, 5, 7, 47, 20)
+    assert parse_timestamp("2025-05-05T07:47:20") == ts(2025, 5, 5, 7, 47, 20)
+    assert parse_timestamp(None) is None and parse_timestamp("soon") is None
+
+
+# -----------------------------
+#   INDEX + RETRIEVAL
+# -----------------------------
+DAYS = [40, 3, 25, 10, 1, None, 33, 12, 7, 20, 2, 15]  # days before NOW, unsorted
+
+
+def corpus():
+    messages = []
+    for i, days in enumerate(DAYS):
+        stamp = None if days is None else datetime.fromtimestamp(
+            NOW.timestamp() - days * 86400, tz=timezone.utc
+        ).isoformat()
+        messages.append({
+            "message_id": f"m{i}",
+            "user_id": f"u{i % 2}",
+            "user_name": ["Layla Kawaguchi", "Vikram Desai"][i % 2],
+            "text": f"booking request number {i}",
+            "timestamp": stamp,
+        })
+    rng = np.random.default_rng(0)
+    embeddings = normalize_rows(rng.normal(size=(len(messages), 8))).astype(np.float32)
+    return messages, embeddings
+
+
+def expected_rows(max_days, keep=lambda i: True):
+    return sorted(i for i, d in enumerate(DAYS) if d is not None and d < max_days and keep(i))
+
+
+def test_index_sorts_once_and_slices_a_window():
+    messages, _ = corpus()
+    timeline = TimestampIndex.from_messages(messages)
+
+    assert timeline.epochs[5] == MISSING and len(timeline.sorted) == len(DAYS) - 1
+    assert np.all(np.diff(timeline.sorted) >= 0)
+
+    window = time_window("sent in the past 14 days", NOW)
+    assert list(timeline.rows_between(window["start"], window["end"])) == expected_rows(14)
+
+
+def test_extended_index_parses_only_the_new_records():
+    messages, _ = corpus()
+    timeline = TimestampIndex.from_messages(messages)
+    extra = {"timestamp": NOW.isoformat()}
+    new = timeline.extended([extra])
+
+    assert len(new) == len(timeline) + 1 and len(timeline) == len(DAYS)
+    assert new.rows_between(ts(2025, 3, 12), ts(2025, 3, 13))[-1] == len(DAYS)
+
+
+def test_retrieval_scores_only_rows_inside_the_window():
+    messages, embeddings = corpus()
+    timeline = TimestampIndex.from_messages(messages)
+    partitions = UserPartitions(messages)
+    lexical = BM25Index.build([m["text"] for m in messages])
+    window = time_window("booking requests in the past 14 days", NOW)
+
+    timings = {}
+    rows = retrieve_rows_for_user(
+        embeddings[0], 20, embeddings, ExactIndex(embeddings), partitions, None,
+        "booking request", lexical, timings, window, timeline,
+    )
+    assert sorted(rows) == expected_rows(14)
+    assert timings["window_rows"] == len(expected_rows(14))
+
+    # member partition ∩ window
+    rows = retrieve_rows_for_user(
+        embeddings[0], 20, embeddings, ExactIndex(embeddings), partitions, "Vikram Desai",
+        "booking request", lexical, None, window, timeline,
+    )
+    assert sorted(rows) == expected_rows(14, lambda i: i % 2 == 1)
+
+
+def test_empty_window_falls_back_to_unscoped_retrieval():
+    messages, embeddings = corpus()
+    timeline = TimestampIndex.from_messages(messages)
+    partitions = UserPartitions(messages)
+    # the clock is years past the corpus, so no message was sent "today"
+    window = time_window("anything sent today?", datetime(2030, 1, 1, tzinfo=timezone.utc))
+
+    timings = {}
+    rows = retrieve_rows_for_user(
+        embeddings[0], 20, embeddings, ExactIndex(embeddings), partitions, "Vikram Desai",
+        "booking request", BM25Index.build([m["text"] for m in messages]), timings, window, timeline,
+    )
+    assert sorted(rows) == [i for i in range(len(DAYS)) if i % 2 == 1]
+    assert timings["window_rows"] == 0 and timings["window_fallback"]
+
+    results = retrieve_batch(
+        embeddings[:1], 20, messages, embeddings, ExactIndex(embeddings), partitions,
+        [None], time_windows=[window], timeline=timeline,
+    )
+    assert len(results[0]) == len(DAYS)
+
+
+def test_batch_groups_by_member_and_window():
+    messages, embeddings = corpus()
+    timeline = TimestampIndex.from_messages(messages)
+    partitions = UserPartitions(messages)
+    index = ExactIndex(embeddings)
+    window = time_window("sent in the past 14 days", NOW)
+    windows = [window, None, window]
+    users = ["Layla Kawaguchi", "Layla Kawaguchi", None]
+
+    results = retrieve_batch(
+        embeddings[:3], 20, messages, embeddings, index, partitions, users,
+        time_windows=windows, timeline=timeline,
+    )
+    ids = [sorted(int(m["message_id"][1:]) for m in r) for r in results]
+    assert ids[0] == expected_rows(14, lambda i: i % 2 == 0)
+    assert ids[1] == [i for i in range(len(DAYS)) if i % 2 == 0]
+    assert ids[2] == expected_rows(14)